@@ -1,7 +1,17 @@
+import io
+import os
+import math
+import logging
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
 from reportlab.pdfgen.canvas import Canvas
 from reportlab.lib import pagesizes
+from reportlab import rl_config
+from reportlab.lib.utils import ImageReader
 from pathlib import Path
 
+from cardStore import RawCard
+
 
 POINTS_PER_IN = 72
 MARGIN_IN_PTS = 24
@@ -11,13 +21,438 @@ US_LETTER_IN = (
     pagesizes.LETTER[1]/POINTS_PER_IN
     )
 
+# Portrait (width, height) of the paper sizes the imposer knows by name
+PAPER_SIZES_IN = {
+    'letter': US_LETTER_IN,
+    'legal': (pagesizes.LEGAL[0]/POINTS_PER_IN, pagesizes.LEGAL[1]/POINTS_PER_IN),
+    'tabloid': (pagesizes.TABLOID[0]/POINTS_PER_IN, pagesizes.TABLOID[1]/POINTS_PER_IN),
+    'a4': (pagesizes.A4[0]/POINTS_PER_IN, pagesizes.A4[1]/POINTS_PER_IN),
+    'a3': (pagesizes.A3[0]/POINTS_PER_IN, pagesizes.A3[1]/POINTS_PER_IN),
+}
+
+# Free rectangle scoring rules tried on every page, each one wins on some card and paper combination
+PACKING_HEURISTICS = ('grid', 'bottomLeft', 'bestShortSide', 'bestArea', 'bestLongSide')
+
+# Slack for float comparisons between point coordinates
+EPSILON = 1e-6
+
+# Fewest sheets worth handing to a process of their own, below this the merge costs more than it saves
+MIN_SHEETS_PER_CHUNK = 16
+
+def toDrawable(image):
+    """Converts a card image into something Canvas.drawImage accepts.
+
+    Paths are handed over by name, PIL images, raw encoded bytes and file objects are wrapped in an ImageReader.
+    A RawCard is mapped straight out of its store.
+    """
+    if isinstance(image, (str, Path)):
+        return str(image)
+    if isinstance(image, RawCard):
+        return ImageReader(image.open())
+    if isinstance(image, (bytes, bytearray, memoryview)):
+        image = io.BytesIO(image)
+    return ImageReader(image)
+
+
+class PlacedImages(object):
+    """Embeds each distinct image into a document exactly once, as a named image XObject.
+
+    Every later placement of the same image is just a reference to that XObject, which skips reportlab's
+    per-draw decoding and content hashing, and keeps repeated backs and tokens from bloating the file.
+    """
+
+    def __init__(self, canvas:Canvas) -> None:
+        self.canvas = canvas
+        # identity of the source image -> (XObject name, embedded stream size, source image)
+        # an image in memory is held on to so that its id() can't be recycled while it's a key, see release
+        self.embedded = dict()
+        self.distinctImages = 0
+        self.placements = 0
+        self.bytesSaved = 0
+        self.bytesEmbedded = 0
+
+    @staticmethod
+    def _identity(image):
+        if isinstance(image, (str, Path)):
+            return ('path', str(image))
+        if isinstance(image, RawCard):
+            return ('raw', str(image.path), image.index)
+        return ('object', id(image))
+
+    def draw(self, image, x, y, width, height, rotation=0):
+        """Draws image into the width x height box at x,y, rotated counterclockwise by rotation degrees (a multiple of 90).
+
+        A rotation of 90 or -90 makes the box height wide and width tall on the page, with x,y still its bottom left corner.
+        """
+        if rotation % 360 != 0:
+            self.canvas.saveState()
+            # Rotating about the origin swings the box out of place, these put its bottom left corner back on x,y
+            anchor = {90: (x+height, y), 180: (x+width, y+height), 270: (x, y+width)}[rotation % 360]
+            self.canvas.translate(*anchor)
+            self.canvas.rotate(rotation)
+            self.draw(image, 0, 0, width, height)
+            self.canvas.restoreState()
+            return
+
+        self.placements += 1
+        key = self._identity(image)
+        if key not in self.embedded:
+            embedded = {'name': None, 'imgObj': None}
+            self.canvas.drawImage(toDrawable(image), x, y, width=width, height=height, mask='auto', extraReturn=embedded)
+            self.embedded[key] = (embedded['name'], len(embedded['imgObj'].streamContent), image if key[0] == 'object' else None)
+            self.distinctImages += 1
+            self.bytesEmbedded += len(embedded['imgObj'].streamContent)
+            return
+
+        name, embeddedSize, _ = self.embedded[key]
+        # Same transform drawImage applies, an image XObject is drawn into the unit square
+        self.canvas.saveState()
+        self.canvas.translate(x, y)
+        self.canvas.scale(width, height)
+        self.canvas.doForm(name)
+        self.canvas.restoreState()
+        self.bytesSaved += embeddedSize
+
+    def release(self, image):
+        """Lets go of an image that won't be drawn again.
+
+        Images known by path or RawCard only ever kept their XObject's name and size. An image in memory is known
+        by its id(), which a later image can be given once this one is freed, so its entry goes altogether and
+        drawing it anyway embeds it a second time.
+        """
+        key = self._identity(image)
+        if key[0] == 'object':
+            self.embedded.pop(key, None)
+
+    def report(self) -> str:
+        return f"{self.distinctImages} distinct images for {self.placements} placements, {self.bytesSaved} bytes saved by reuse"
+
+
+class Placement(object):
+    """Where one card goes on a page, in points. width and height are the card's own, before any rotation."""
+
+    __slots__ = ('x', 'y', 'width', 'height', 'rotation')
+
+    def __init__(self, x, y, width, height, rotation=0) -> None:
+        self.x = x
+        self.y = y
+        self.width = width
+        self.height = height
+        self.rotation = rotation
+
+    @property
+    def pageWidth(self):
+        return self.height if self.rotation % 180 else self.width
+
+    @property
+    def pageHeight(self):
+        return self.width if self.rotation % 180 else self.height
+
+    def __repr__(self) -> str:
+        return f"Placement({self.x:.1f}, {self.y:.1f}, {self.width:.1f}, {self.height:.1f}, rotation={self.rotation})"
+
+
+def _fits(tileWidth, tileHeight, freeWidth, freeHeight):
+    return tileWidth <= freeWidth + EPSILON and tileHeight <= freeHeight + EPSILON
+
+
+def _score(heuristic, freeRect, tileWidth, tileHeight):
+    fx, fy, fw, fh = freeRect
+    leftoverX, leftoverY = fw - tileWidth, fh - tileHeight
+    if heuristic == 'bottomLeft':
+        return (fy + tileHeight, fx)
+    if heuristic == 'bestShortSide':
+        return (min(leftoverX, leftoverY), max(leftoverX, leftoverY))
+    if heuristic == 'bestLongSide':
+        return (max(leftoverX, leftoverY), min(leftoverX, leftoverY))
+    return (fw*fh - tileWidth*tileHeight, min(leftoverX, leftoverY))
+
+
+class MaxRectsPage(object):
+    """One page's free space as the maximal free rectangles left between the tiles placed so far"""
+
+    def __init__(self, width, height, heuristic, allowRotation=True) -> None:
+        self.freeRects = [(0, 0, width, height)]
+        self.heuristic = heuristic
+        self.allowRotation = allowRotation
+
+    def insert(self, tileWidth, tileHeight):
+        """Places a tile, returning (x, y, rotated), or None if it doesn't fit anywhere"""
+        orientations = [(tileWidth, tileHeight, False)]
+        if self.allowRotation and abs(tileWidth - tileHeight) > EPSILON:
+            orientations.append((tileHeight, tileWidth, True))
+
+        best = None
+        for freeRect in self.freeRects:
+            for w, h, rotated in orientations:
+                if _fits(w, h, freeRect[2], freeRect[3]):
+                    score = _score(self.heuristic, freeRect, w, h)
+                    if best is None or score < best[0]:
+                        best = (score, (freeRect[0], freeRect[1], w, h, rotated))
+        if best is None:
+            return None
+
+        x, y, w, h, rotated = best[1]
+        self._splitFreeRects(x, y, w, h)
+        return x, y, rotated
+
+    def _splitFreeRects(self, x, y, w, h):
+        split = list()
+        for freeRect in self.freeRects:
+            fx, fy, fw, fh = freeRect
+            if x >= fx+fw-EPSILON or x+w <= fx+EPSILON or y >= fy+fh-EPSILON or y+h <= fy+EPSILON:
+                split.append(freeRect)
+                continue
+            if x > fx+EPSILON:
+                split.append((fx, fy, x-fx, fh))
+            if x+w < fx+fw-EPSILON:
+                split.append((x+w, fy, fx+fw-x-w, fh))
+            if y > fy+EPSILON:
+                split.append((fx, fy, fw, y-fy))
+            if y+h < fy+fh-EPSILON:
+                split.append((fx, y+h, fw, fy+fh-y-h))
+
+        def contains(outer, inner):
+            return (outer[0] <= inner[0]+EPSILON and outer[1] <= inner[1]+EPSILON
+                    and inner[0]+inner[2] <= outer[0]+outer[2]+EPSILON and inner[1]+inner[3] <= outer[1]+outer[3]+EPSILON)
+
+        # Drop rectangles inside another one, keeping the first of any duplicates
+        self.freeRects = [
+            rect for i, rect in enumerate(split)
+            if not any(contains(other, rect) and (other != rect or j < i) for j, other in enumerate(split) if j != i)
+        ]
+
+
+class Imposer(object):
+    """Packs cards of any mix of sizes onto pages, rotating them where that fits more on a sheet.
+
+    Every page tries each of PACKING_HEURISTICS and keeps whichever layout covers the most paper, so a
+    deck never takes more pages than the plain grid would. Each card is surrounded by bleed on every side,
+    and neighbouring cards are gutter apart. All measurements are in points.
+
+    With no gutter given, a page laid out as a plain grid has its spare room shared out between the cards,
+    the way the pages have always been spaced, and any other page is packed tight and centred.
+    """
+
+    def __init__(self, pageWidth, pageHeight, margin=MARGIN_IN_PTS, gutter=None, bleed=0, allowRotation=True) -> None:
+        self.pageWidth = pageWidth
+        self.pageHeight = pageHeight
+        self.margin = margin
+        self.spread = gutter is None
+        gutter = gutter or 0
+        self.gutter = gutter
+        self.bleed = bleed
+        self.allowRotation = allowRotation
+        # Gutters only go between tiles, so the last tile's trailing gutter may hang into the margin
+        self.usableWidth = pageWidth - 2*margin + gutter
+        self.usableHeight = pageHeight - 2*margin + gutter
+        self._pageLayouts = dict()
+        # Keys of the page layouts the plain grid won
+        self._gridPages = set()
+
+    def tileSize(self, cardSize):
+        width, height = cardSize
+        return (width + 2*self.bleed + self.gutter, height + 2*self.bleed + self.gutter)
+
+    def _maxCards(self, cardSize):
+        tileWidth, tileHeight = self.tileSize(cardSize)
+        return int((self.usableWidth*self.usableHeight) // (tileWidth*tileHeight))
+
+    def _gridLayout(self, cardSize, count):
+        tileWidth, tileHeight = self.tileSize(cardSize)
+        orientations = [(tileWidth, tileHeight, False)]
+        if self.allowRotation:
+            orientations.append((tileHeight, tileWidth, True))
+        w, h, rotated = max(orientations, key=lambda o: int(self.usableWidth // o[0]) * int(self.usableHeight // o[1]))
+        columns = int(self.usableWidth // w)
+        rows = int(self.usableHeight // h)
+        # Filled top row first, like the pages have always been
+        cells = [(column*w, self.usableHeight - (row+1)*h, rotated) for row in range(rows) for column in range(columns)]
+        return cells[:count]
+
+    def _packLayout(self, groups, heuristic):
+        """Fills one page from groups of (cardSize, count), biggest cards first. Returns [(groupIndex, x, y, rotated)]"""
+        if heuristic == 'grid':
+            if len(groups) != 1:
+                return []
+            return [(0, x, y, rotated) for x, y, rotated in self._gridLayout(*groups[0])]
+
+        page = MaxRectsPage(self.usableWidth, self.usableHeight, heuristic, self.allowRotation)
+        layout = list()
+        for groupIndex, (cardSize, count) in enumerate(groups):
+            for _ in range(count):
+                position = page.insert(*self.tileSize(cardSize))
+                if position is None:
+                    break
+                layout.append((groupIndex,) + position)
+        return layout
+
+    def _pageKey(self, groups):
+        # More cards than could ever fit on a page lay out the same, which lets every full page share a key
+        return tuple((cardSize, min(count, self._maxCards(cardSize))) for cardSize, count in groups)
+
+    def packPage(self, groups):
+        """The best layout for one page, see _packLayout. Repeated pages of the same cards are only packed once."""
+        key = self._pageKey(groups)
+        if key not in self._pageLayouts:
+            def coveredArea(layout):
+                return sum(self.tileSize(key[groupIndex][0])[0] * self.tileSize(key[groupIndex][0])[1] for groupIndex, *_ in layout)
+            layouts = [self._packLayout(key, heuristic) for heuristic in PACKING_HEURISTICS]
+            best = max(range(len(layouts)), key=lambda i: coveredArea(layouts[i]))
+            if PACKING_HEURISTICS[best] == 'grid':
+                self._gridPages.add(key)
+            self._pageLayouts[key] = layouts[best]
+        return self._pageLayouts[key]
+
+    def pageCapacity(self, cardSize) -> int:
+        """How many cards of one size a full page holds"""
+        capacity = len(self.packPage([(cardSize, self._maxCards(cardSize))]))
+        if capacity == 0:
+            width, height = cardSize
+            raise ValueError(f"a {width/POINTS_PER_IN:.2f}x{height/POINTS_PER_IN:.2f} in card doesn't fit on the page")
+        return capacity
+
+    def impose(self, cardSizes:list[tuple[float, float]]) -> list[list[tuple[int, Placement]]]:
+        """Assigns every card a page and a Placement, returning the pages as lists of (cardIndex, placement).
+
+        Cards of the same size keep their order, bigger cards are packed before smaller ones.
+        """
+        queues = dict()
+        for cardIndex, cardSize in enumerate(cardSizes):
+            queues.setdefault(tuple(cardSize), list()).append(cardIndex)
+        order = sorted(queues, key=lambda size: -size[0]*size[1])
+        nextCard = {size: 0 for size in order}
+
+        pages = list()
+        while True:
+            groups = [(size, len(queues[size]) - nextCard[size]) for size in order if nextCard[size] < len(queues[size])]
+            if not groups:
+                return pages
+
+            layout = self.packPage(groups)
+            if not layout:
+                width, height = groups[0][0]
+                raise ValueError(f"a {width/POINTS_PER_IN:.2f}x{height/POINTS_PER_IN:.2f} in card doesn't fit on the page")
+
+            placed = list()
+            for groupIndex, x, y, rotated in layout:
+                size = groups[groupIndex][0]
+                cardIndex = queues[size][nextCard[size]]
+                nextCard[size] += 1
+                placed.append((cardIndex, size, x, y, rotated))
+            if self.spread and self._pageKey(groups) in self._gridPages:
+                pages.append(self._spreadOut(placed))
+            else:
+                pages.append(self._centered(placed))
+
+    def _spreadOut(self, placed):
+        """Turns a plain grid of tiles into card placements, the room left over split evenly between the columns
+        and between the rows, half of it either side of every tile. Partly filled pages keep the full page's spacing.
+        """
+        _, cardSize, _, _, rotated = placed[0]
+        tileWidth, tileHeight = self.tileSize(cardSize)
+        if rotated:
+            tileWidth, tileHeight = tileHeight, tileWidth
+        columns = int(self.usableWidth // tileWidth)
+        rows = int(self.usableHeight // tileHeight)
+        paddingX = (self.usableWidth - columns*tileWidth) / columns
+        paddingY = (self.usableHeight - rows*tileHeight) / rows
+
+        placements = list()
+        for cardIndex, (width, height), x, y, rotated in placed:
+            column = round(x / tileWidth)
+            row = round(y / tileHeight)
+            left = self.margin + paddingX/2 + column*(tileWidth + paddingX)
+            bottom = self.margin + paddingY/2 + row*(tileHeight + paddingY)
+            placements.append((cardIndex, Placement(left + self.bleed, bottom + self.bleed, width, height, 90 if rotated else 0)))
+        return placements
+
+    def _centered(self, placed):
+        """Turns packed tiles into card placements, with the packed block centred on the page"""
+        tiles = list()
+        for cardIndex, (width, height), x, y, rotated in placed:
+            tileWidth, tileHeight = self.tileSize((width, height))
+            if rotated:
+                tileWidth, tileHeight = tileHeight, tileWidth
+            tiles.append((cardIndex, width, height, x, y, tileWidth, tileHeight, rotated))
+
+        blockWidth = max(x + tileWidth for _, _, _, x, _, tileWidth, _, _ in tiles) - self.gutter
+        blockHeight = max(y + tileHeight for _, _, _, _, y, _, tileHeight, _ in tiles) - self.gutter
+        offsetX = (self.pageWidth - blockWidth) / 2
+        offsetY = (self.pageHeight - blockHeight) / 2
+
+        placements = list()
+        for cardIndex, width, height, x, y, _, _, rotated in tiles:
+            placements.append((cardIndex, Placement(offsetX + x + self.bleed, offsetY + y + self.bleed, width, height, 90 if rotated else 0)))
+        return placements
+
+    def backPlacement(self, front:Placement) -> Placement:
+        """Where a card's back goes so it lands behind its front when the sheet is flipped top to bottom for duplex.
+
+        Flipping the sheet mirrors y. A sideways card also gets flipped end over end relative to an upright one,
+        which turning its back the other way round undoes, so the back's rotation is the front's negated.
+        """
+        y = self.pageHeight - front.y - front.pageHeight
+        return Placement(front.x, y, front.width, front.height, -front.rotation % 360)
+
+
+class SheetCache(object):
+    """Drawn sheets as one sheet PDFs, keyed by the cards on them and where they go, see PdfMaker.makeCachedPDF.
+
+    prune() forgets every sheet that wasn't asked for since the last prune, so only the current documents stay in memory.
+    """
+
+    def __init__(self) -> None:
+        self.sheets = dict()
+        # outputPath -> sheet keys it was last written with
+        self.documents = dict()
+        self._used = set()
+
+    def fetch(self, key) -> bytes:
+        sheetPdf = self.sheets.get(key)
+        if sheetPdf is not None:
+            self._used.add(key)
+        return sheetPdf
+
+    def store(self, key, sheetPdf:bytes):
+        self.sheets[key] = sheetPdf
+        self._used.add(key)
+
+    def prune(self) -> int:
+        """Drops the sheets not used since the last prune, returning how many were dropped"""
+        unused = [key for key in self.sheets if key not in self._used]
+        for key in unused:
+            del self.sheets[key]
+        self._used = set()
+        return len(unused)
+
+    def clear(self):
+        self.sheets = dict()
+        self.documents = dict()
+        self._used = set()
+
+
+def _useBinaryStreams():
+    # Streams are written as plain binary rather than ASCII85 text. Without reportlab's optional accelerator the
+    # ASCII85 encoder is pure Python and took most of the time spent embedding a card, and pypdf's decoder, used
+    # when merging, is just as slow. It's a process wide reportlab setting, so it's switched by every PdfMaker
+    # and in every worker process drawing for one, rather than as a side effect of importing this module
+    rl_config.useA85 = 0
+
+
 class PdfMaker(object):
 
-    def __init__(self, widthInInches, heightInInches) -> None:
+    def __init__(self, widthInInches, heightInInches, gutterInInches=None, bleedInInches=0, allowRotation=True, workers=1) -> None:
+        _useBinaryStreams()
         self.width = widthInInches * POINTS_PER_IN
         self.height = heightInInches * POINTS_PER_IN
         self.width_margin = MARGIN_IN_PTS
         self.height_margin = MARGIN_IN_PTS
+        self.bleed = bleedInInches * POINTS_PER_IN
+        gutter = gutterInInches*POINTS_PER_IN if gutterInInches is not None else None
+        self.imposer = Imposer(self.width, self.height, MARGIN_IN_PTS, gutter, self.bleed, allowRotation)
+        # Processes drawing PDFs, <= 0 means one per core
+        self.workers = workers if workers > 0 else (os.cpu_count() or 1)
         
         self.min_width = self.width_margin
         self.max_width = self.width - self.width_margin
@@ -26,69 +461,250 @@ class PdfMaker(object):
         self.max_height = self.height - self.height_margin
 
 
-    def generateTiledCoordinates(self, tile_width, tile_height):
-        width_range = self.max_width - self.min_width
-        width_count = int(width_range // tile_width)
-        width_surplus = width_range - (width_count * tile_width)
-        width_padding = width_surplus / width_count
+    def makePDF(self, frontAndBackImages:list[tuple[Path, Path]], outputPath:Path, imageSizeInInches:tuple[float, float]):
+        """Lays out cards that all share one size, see makeMixedPDF"""
+        self.makeMixedPDF([(front, back, imageSizeInInches) for front, back in frontAndBackImages], outputPath)
 
-        height_range = self.max_height - self.min_height
-        height_count = int(height_range // tile_height)
-        height_surplus = height_range - (height_count * tile_height)
-        height_padding = height_surplus / height_count
+    def makeMixedPDF(self, cards:list[tuple[Path, Path, tuple[float, float]]], outputPath:Path):
+        """Packs (front, back, sizeInInches) cards onto as few pages as the imposer manages, each page of
+        fronts followed by a page with the backs mirrored for duplex printing.
 
-        new_box_width = tile_width + width_padding
-        new_box_height = tile_height + height_padding
+        Images may be paths, PIL images, RawCards or encoded image bytes. Backs may be None.
+        """
+        self.makeDocuments([(cards, outputPath)])
 
+    def streamPDF(self, frontAndBackImages, outputPath:Path, imageSizeInInches:tuple[float, float], memoryBudget=None) -> list[Path]:
+        """makePDF for an iterator of (front, back), drawing each sheet as soon as a sheet's worth of cards has arrived.
 
-        coordinates = list()
-        backCoordinates = list()
-        for h in range(height_count):
-            for w in range(width_count):
-                height_pixels = int ((self.min_height + (height_padding/2) + (h * new_box_height)))
-                width_pixels = int( (self.min_width + (width_padding/2) + (w * new_box_width)) )
-                coordinates.append((width_pixels, height_pixels))
-                backCoordinates.append((width_pixels, int(self.height-height_pixels-tile_height)))
-            
+        Only one sheet of cards is held at a time, and the layout matches what makePDF gives for the same cards.
+        Every front is let go of once its sheet is drawn, so a deck rendered in memory takes no more memory than
+        a sheet of it. With a memoryBudget (see memoryBudget.py) fronts are released to the budget too, and once the
+        images embedded so far reach the budget's share for a PDF the document is saved and the rest of the deck
+        goes on in outputPath_2.pdf, outputPath_3.pdf and so on. Returns the paths written.
+        """
+        outputPath = Path(outputPath)
+        cardSize = (imageSizeInInches[0]*POINTS_PER_IN, imageSizeInInches[1]*POINTS_PER_IN)
+        sheetCapacity = self.imposer.pageCapacity(cardSize)
+        maxPdfBytes = memoryBudget.maxPdfBytes if memoryBudget is not None else None
 
-        
-        return coordinates, backCoordinates
-    
+        def volumePath(number):
+            return outputPath if number == 1 else outputPath.with_stem(f"{outputPath.stem}_{number}")
 
+        volumes = list()
+        volume = None
 
-    def makePDF(self, frontAndBackImages:list[tuple[Path, Path]], outputPath:Path, imageSizeInInches:tuple[float, float]):
+        def startVolume():
+            volumes.append(volumePath(len(volumes)+1))
+            myfile = Canvas(str(volumes[-1]), pagesize=(self.width, self.height))
+            return {'path': volumes[-1], 'canvas': myfile, 'placedImages': PlacedImages(myfile), 'sheets': 0}
 
-        imageWidth = imageSizeInInches[0] * POINTS_PER_IN
-        imageHeight = imageSizeInInches[1] * POINTS_PER_IN
-        coordinates, backCoordinates = self.generateTiledCoordinates(imageWidth, imageHeight)
+        def finishVolume(volume):
+            volume['canvas'].save()
+            logging.info(f"{volume['path'].name}: {volume['sheets']} sheets, {volume['placedImages'].report()}")
 
-        myfile = Canvas(str(outputPath), pagesize=(self.width, self.height))
-        count = 0
-        while count < len(frontAndBackImages):
-            nextPage = list()
-            for i, (x,y) in enumerate(coordinates):
-                if count >= len(frontAndBackImages):
-                    break
-                frontImage, backImage = frontAndBackImages[count]
-                myfile.drawImage(str(frontImage), x,y, width=imageWidth,height=imageHeight, mask='auto')
-                if backImage is not None:
-                    nextPage.append((i,backImage))
-                count+=1
+        def drawPending(pending):
+            nonlocal volume
+            if volume is None:
+                volume = startVolume()
+            for fronts, backs in self.imposeSheets([(front, back, imageSizeInInches) for front, back in pending]):
+                drawSheet(volume['placedImages'], fronts, backs, self.bleed)
+                volume['sheets'] += 1
+            for front, _ in pending:
+                volume['placedImages'].release(front)
+                if memoryBudget is not None:
+                    memoryBudget.release(front)
+            if maxPdfBytes is not None and volume['placedImages'].bytesEmbedded >= maxPdfBytes:
+                finishVolume(volume)
+                volume = None
+
+        pending = list()
+        for frontAndBack in frontAndBackImages:
+            pending.append(frontAndBack)
+            if len(pending) == sheetCapacity:
+                drawPending(pending)
+                pending = list()
+        if pending or not volumes:
+            drawPending(pending)
+        if volume is not None:
+            finishVolume(volume)
+
+        # Volumes a bigger build left behind would otherwise be printed along with this one
+        staleNumber = len(volumes) + 1
+        while volumePath(staleNumber).is_file():
+            volumePath(staleNumber).unlink()
+            staleNumber += 1
+        if len(volumes) > 1:
+            logging.warning(f"{outputPath.name} was split into {len(volumes)} volumes to stay within the memory budget")
+        return volumes
+
+    def imposeSheets(self, cards:list[tuple[Path, Path, tuple[float, float]]]) -> list[tuple[list, list]]:
+        """Each sheet's (fronts, backs), both lists of (image, Placement)"""
+        return [self._sheet(cards, page) for page in self.imposer.impose(self._cardSizes(cards))]
+
+    @staticmethod
+    def _cardSizes(cards) -> list[tuple[float, float]]:
+        return [(width*POINTS_PER_IN, height*POINTS_PER_IN) for _, _, (width, height) in cards]
+
+    def _sheet(self, cards, page:list[tuple[int, Placement]]) -> tuple[list, list]:
+        fronts = list()
+        backs = list()
+        for cardIndex, placement in page:
+            frontImage, backImage, _ = cards[cardIndex]
+            fronts.append((frontImage, placement))
+            if backImage is not None:
+                backs.append((backImage, self.imposer.backPlacement(placement)))
+        return (fronts, backs)
+
+    def makeCachedPDF(self, cards:list[tuple[Path, Path, tuple[float, float]]], cardKeys:list, outputPath:Path, sheetCache:'SheetCache') -> int:
+        """makeMixedPDF for a document that gets rebuilt over and over, redrawing only the sheets that changed since the last build.
+
+        cardKeys has a hashable key per card that changes whenever its front or back does. Sheets are kept in
+        sheetCache as one sheet PDFs and merged into outputPath, which is left alone when nothing on it changed.
+        Returns the number of sheets drawn.
+        """
+        outputPath = Path(outputPath)
+        if not pdfMergeAvailable():
+            logging.warning("pypdf isn't installed, the whole document is redrawn")
+            self.makeMixedPDF(cards, outputPath)
+            return len(self.imposeSheets(cards))
+
+        pageSize = (self.width, self.height)
+        sheetKeys = list()
+        sheetPdfs = list()
+        drawn = 0
+        for page in self.imposer.impose(self._cardSizes(cards)):
+            key = tuple((cardKeys[cardIndex], p.x, p.y, p.width, p.height, p.rotation) for cardIndex, p in page)
+            sheetPdf = sheetCache.fetch(key)
+            if sheetPdf is None:
+                buffer = io.BytesIO()
+                drawSheets((buffer, pageSize, self.bleed, [self._sheet(cards, page)]))
+                sheetPdf = buffer.getvalue()
+                sheetCache.store(key, sheetPdf)
+                drawn += 1
+            sheetKeys.append(key)
+            sheetPdfs.append(sheetPdf)
+
+        if sheetCache.documents.get(outputPath) == sheetKeys and outputPath.is_file():
+            return drawn
+        # Merged aside and swapped in, so a viewer reloading the document never sees it half written
+        temporaryPath = outputPath.with_suffix(".tmp")
+        mergePdfs([io.BytesIO(sheetPdf) for sheetPdf in sheetPdfs], temporaryPath)
+        os.replace(temporaryPath, outputPath)
+        sheetCache.documents[outputPath] = sheetKeys
+        logging.info(f"{outputPath.name}: {len(sheetPdfs)} sheets, {drawn} redrawn")
+        return drawn
+
+    def makeDocuments(self, documents:list[tuple[list, Path]]):
+        """Builds several (cards, outputPath) documents, see makeMixedPDF.
+
+        With more than one worker the documents are drawn in parallel, and big ones are split into runs of
+        sheets drawn in separate processes and merged back together in order.
+        """
+        pageSize = (self.width, self.height)
+        documentSheets = [(self.imposeSheets(cards), Path(outputPath)) for cards, outputPath in documents]
+
+        if self.workers <= 1:
+            for sheets, outputPath in documentSheets:
+                report = drawSheets((outputPath, pageSize, self.bleed, sheets))
+                logging.info(f"{outputPath.name}: {len(sheets)} sheets, {report}")
+            return
+
+        canMerge = pdfMergeAvailable()
+        if not canMerge:
+            logging.warning("pypdf isn't installed, documents won't be split across processes")
+
+        totalSheets = sum(len(sheets) for sheets, _ in documentSheets)
+        # Enough chunks to keep every worker busy, without making them so small merging dominates
+        sheetsPerChunk = max(MIN_SHEETS_PER_CHUNK, math.ceil(totalSheets / self.workers))
+
+        with tempfile.TemporaryDirectory(dir=documentSheets[0][1].parent) as chunkFolder:
+            jobs = list()
+            chunkPaths = list()
+            for documentIndex, (sheets, outputPath) in enumerate(documentSheets):
+                if not canMerge or len(sheets) <= sheetsPerChunk:
+                    jobs.append((outputPath, pageSize, self.bleed, sheets))
+                    chunkPaths.append(None)
+                    continue
+                paths = list()
+                for start in range(0, len(sheets), sheetsPerChunk):
+                    chunkPath = Path(chunkFolder) / f"{documentIndex}_{start}.pdf"
+                    jobs.append((chunkPath, pageSize, self.bleed, sheets[start:start+sheetsPerChunk]))
+                    paths.append(chunkPath)
+                chunkPaths.append(paths)
+
+            with ProcessPoolExecutor(max_workers=min(self.workers, len(jobs)), initializer=_useBinaryStreams) as executor:
+                reports = list(executor.map(drawSheets, jobs))
+
+            for (sheets, outputPath), paths in zip(documentSheets, chunkPaths):
+                if paths is not None:
+                    mergePdfs(paths, outputPath)
+                logging.info(f"{outputPath.name}: {len(sheets)} sheets in {len(paths) if paths else 1} chunks")
+        for report in reports:
+            logging.debug(report)
+
+
+def drawCard(placedImages:PlacedImages, image, placement:Placement, bleed):
+    if not bleed:
+        placedImages.draw(image, placement.x, placement.y, placement.width, placement.height, placement.rotation)
+        return
+
+    # Without bleed pixels in the art, the card is scaled up evenly until it covers the bleed, so a slightly off cut
+    # still shows no paper, and cut back to the bleed. The art keeps its shape and loses a sliver off its long sides
+    scale = max((placement.width + 2*bleed) / placement.width, (placement.height + 2*bleed) / placement.height)
+    overhangX = placement.pageWidth * (scale - 1) / 2
+    overhangY = placement.pageHeight * (scale - 1) / 2
+    canvas = placedImages.canvas
+    canvas.saveState()
+    clip = canvas.beginPath()
+    clip.rect(placement.x - bleed, placement.y - bleed, placement.pageWidth + 2*bleed, placement.pageHeight + 2*bleed)
+    canvas.clipPath(clip, stroke=0, fill=0)
+    placedImages.draw(image, placement.x - overhangX, placement.y - overhangY,
+                      placement.width * scale, placement.height * scale, placement.rotation)
+    canvas.restoreState()
+
+
+def drawSheets(job) -> str:
+    """Draws (outputPath, pageSize, bleed, sheets) into a PDF, every sheet a page of fronts then a page of backs.
+    outputPath may also be a file object. Returns the PlacedImages report. Takes a single tuple so it can be mapped over a process pool.
+    """
+    outputPath, pageSize, bleed, sheets = job
+    myfile = Canvas(outputPath if hasattr(outputPath, 'write') else str(outputPath), pagesize=pageSize)
+    placedImages = PlacedImages(myfile)
+
+    for fronts, backs in sheets:
+        drawSheet(placedImages, fronts, backs, bleed)
 
-            # To start the next page you must first render this canvas then call draw again 
-            myfile.showPage()
-            for i,image in nextPage:
-                x,y = backCoordinates[i]
-                myfile.drawImage(str(image), x,y, width=imageWidth,height=imageHeight, mask='auto')
-            myfile.showPage()
+    myfile.save()
+    return placedImages.report()
 
-        myfile.save()
 
-            
+def drawSheet(placedImages:PlacedImages, fronts:list, backs:list, bleed):
+    """Draws a page of (image, Placement) fronts, then a page of their backs"""
+    for image, placement in fronts:
+        drawCard(placedImages, image, placement, bleed)
+    # To start the next page you must first render this canvas then call draw again 
+    placedImages.canvas.showPage()
+    for image, placement in backs:
+        drawCard(placedImages, image, placement, bleed)
+    placedImages.canvas.showPage()
 
 
+def pdfMergeAvailable() -> bool:
+    try:
+        import pypdf
+    except ImportError:
+        return False
+    return True
 
-                
-            
 
+def mergePdfs(chunkPaths:list[Path], outputPath:Path):
+    """Concatenates the chunk PDFs, given as paths or file objects, into outputPath, folding the images every chunk embedded into one copy"""
+    # Only needed for chunked and cached builds, so it's imported here rather than made a hard dependency
+    import pypdf
 
+    writer = pypdf.PdfWriter()
+    for chunkPath in chunkPaths:
+        writer.append(chunkPath if hasattr(chunkPath, 'read') else str(chunkPath))
+    writer.compress_identical_objects()
+    with open(outputPath, 'wb') as f:
+        writer.write(f)
@@ -0,0 +1,137 @@
+from pathlib import Path
+from collections import defaultdict
+import logging
+
+from splendid import ResourceType
+
+
+class AssetGetter(object):
+
+    def __init__(self, assetsPath:Path, proxyStore:'ProxyStore'=None, manifest:'AssetManifest'=None) -> None:
+        self.assetsPath = assetsPath
+        # When set, card art is handed out as reduced proxies rather than the full resolution originals
+        self.proxyStore = proxyStore
+        # When set, folder listings come from the persisted index instead of globbing every time
+        self.manifest = manifest
+        resourceTypeFolder = "Resource Type Images"
+        self.resourceTypeToImage = {
+            ResourceType.Air: assetsPath/ resourceTypeFolder / "Air.png",
+            ResourceType.Water:assetsPath/ resourceTypeFolder / "Water.png",
+            ResourceType.Earth:assetsPath/ resourceTypeFolder / "Earth.png",
+            ResourceType.Fire:assetsPath/ resourceTypeFolder / "Fire.png",
+            ResourceType.WhiteLotus:assetsPath/ resourceTypeFolder / "WhiteLotus.png",
+        }
+
+        resourceCardFolder = "Resource Cards Images"
+        self.resourceTypeToResourceCardFolder = {
+            ResourceType.Air: assetsPath/ resourceCardFolder / "Air Nomads",
+            ResourceType.Water:assetsPath/ resourceCardFolder / "Water Tribe",
+            ResourceType.Earth:assetsPath/ resourceCardFolder / "Earth Kingdom",
+            ResourceType.Fire:assetsPath/ resourceCardFolder / "Fire Nation",
+            ResourceType.WhiteLotus:assetsPath/ resourceCardFolder / "White Lotus",
+        }
+
+    def listImages(self, folder:Path) -> list[Path]:
+        """The PNGs in folder sorted by name, so which card gets which art doesn't depend on the filesystem"""
+        if self.manifest is not None:
+            return self.manifest.listFolder(folder)
+        return sorted(Path(folder).glob("*.png"), key=lambda path: path.name)
+
+    def getAvatarImagesPath(self) -> list[Path]:
+        return self.listImages(self.assetsPath / "Avatar Coins")
+    
+    def getResourceImagePath(self, resourceType: ResourceType) -> Path:
+        return self.resourceTypeToImage[resourceType]
+
+    def getLevelIcon(self):
+        return self.assetsPath / "level_icon.png"
+        
+
+    def getResourceCardBackPath(self):
+        return self.assetsPath/ "ResourceCardBack.png"
+    
+
+    def getResourceCardImagePaths(self, resourceType: ResourceType) -> list[Path]:
+        """The source art for a resource type, see getResourceCardArt for what a card is drawn from"""
+        return self.listImages(self.resourceTypeToResourceCardFolder[resourceType])
+
+    def getResourceCardArt(self, imagePath:Path) -> Path:
+        """What a resource card with imagePath as its art is drawn from, its proxy when there's a proxy store.
+        Proxies are only built for the art that's handed out."""
+        if self.proxyStore is not None:
+            return self.proxyStore.getResourceCardProxy(imagePath)
+        return imagePath
+
+    def depre_loadAllResourceImagePaths(self):
+        ResourceCardFolderName = "Resource Cards Images"    
+        AirFolder = "Air Nomads"
+        EarthFolder = "Earth Kingdom"
+        FireFolder = "Fire Nation"
+        WaterFolder = "Water Tribe"
+        WhiteLotusFolder = "White Lotus"
+
+        folderNameToResourceType = {
+            AirFolder:ResourceType.Air,
+            EarthFolder:ResourceType.Earth,
+            FireFolder:ResourceType.Fire,
+            WaterFolder:ResourceType.Water,
+            WhiteLotusFolder:ResourceType.WhiteLotus
+        }
+
+        toReturn = defaultdict(list)
+
+        for folderName, resourceType in folderNameToResourceType.items():
+            path = self.assetsPath / ResourceCardFolderName / folderName
+            if path.is_dir():
+                images = Path(path).glob("*.png")
+                toReturn[resourceType] = list(images)
+            else:
+                logging.debug(f"path {path} doesn't exist")
+
+
+        return toReturn
+    
+    def getVipCardBackImageRaw(self):
+        return self.assetsPath / "VIPCardBack.png"
+    
+    def getVipImagePaths(self):
+        """The source VIP art, see getVipArt"""
+        return self.listImages(self.assetsPath / "VIP Images")
+
+    def getVipArt(self, imagePath:Path) -> Path:
+        """getResourceCardArt for VIP art"""
+        if self.proxyStore is not None:
+            return self.proxyStore.getVipProxy(imagePath)
+        return imagePath
+
+
+def assignResourceCardArt(resourceCards, assetGetter:AssetGetter):
+    """Hands each card without art the next image for the type it produces, yielding the cards that have art.
+
+    Cards of a type whose images have run out are left out. Cards are taken one at a time, so they can still
+    be arriving from the CSV.
+    """
+    resourceTypeToImageList = dict()
+    for type in ResourceType.allButAvatar():
+        resourceTypeToImageList[type] = assetGetter.getResourceCardImagePaths(type)
+
+    leftOut = defaultdict(int)
+    for card in resourceCards:
+        if card.imagePath is None:
+            if len(resourceTypeToImageList[card.produces]) == 0:
+                leftOut[card.produces] += 1
+                continue
+            card.imagePath = assetGetter.getResourceCardArt(resourceTypeToImageList[card.produces].pop())
+        yield card
+
+    for resourceType, count in leftOut.items():
+        logging.warning(f"ran out of {resourceType.name} card art, {count} {resourceType.name} cards left out")
+
+
+def assignVipCardArt(vipCards, assetGetter:AssetGetter):
+    """Hands each card without art the next VIP image, yielding the cards one at a time like assignResourceCardArt"""
+    vipImagesPaths = assetGetter.getVipImagePaths()
+    for card in vipCards:
+        if card.imagePath is None:
+            card.imagePath = assetGetter.getVipArt(vipImagesPaths.pop())
+        yield card
@@ -0,0 +1,137 @@
+import os
+import json
+import fnmatch
+import logging
+from pathlib import Path
+
+from PIL import Image, UnidentifiedImageError
+
+from renderCache import hashFile
+
+
+# Bump when the layout of the manifest file changes, older manifests are then rebuilt from scratch
+MANIFEST_VERSION = 1
+
+
+class AssetManifest(object):
+    """Persistent index of the art under an assets folder: size, mtime, pixel dimensions, mode and content hash.
+
+    Folders are scanned once per instance and only new or changed files (by size and mtime) are opened
+    and hashed, everything else is answered from the index. Listings are sorted by path relative to
+    the assets folder, so they come out the same on every machine.
+    Call save() to write the index back once done.
+    """
+
+    def __init__(self, assetsPath:Path, manifestPath:Path) -> None:
+        self.assetsPath = Path(assetsPath)
+        self.manifestPath = Path(manifestPath)
+        # relative posix path -> entry
+        self.entries = dict()
+        self.scannedFolders = dict()
+        self.indexed = 0
+        self.dirty = False
+        self._load()
+
+    def _load(self):
+        if not self.manifestPath.is_file():
+            return
+        try:
+            with open(self.manifestPath) as f:
+                manifest = json.load(f)
+        except (OSError, ValueError) as e:
+            logging.warning(f"ignoring unreadable asset manifest {self.manifestPath}: {e}")
+            return
+        if manifest.get('version') == MANIFEST_VERSION:
+            self.entries = manifest['entries']
+
+    def save(self):
+        logging.info(f"asset manifest: {self.indexed} files indexed, {len(self.entries)-self.indexed} unchanged")
+        if not self.dirty:
+            return
+        self.manifestPath.parent.mkdir(parents=True, exist_ok=True)
+        # Written aside and swapped in, so an interrupted save never leaves a half written manifest
+        temporaryPath = self.manifestPath.with_suffix(".tmp")
+        with open(temporaryPath, 'w') as f:
+            json.dump({'version': MANIFEST_VERSION, 'entries': self.entries}, f, sort_keys=True)
+        os.replace(temporaryPath, self.manifestPath)
+        self.dirty = False
+
+    def _key(self, path:Path) -> str:
+        return Path(path).relative_to(self.assetsPath).as_posix()
+
+    def _indexFile(self, path:Path, stat:os.stat_result) -> dict:
+        entry = {'size': stat.st_size, 'mtime': stat.st_mtime_ns, 'width': None, 'height': None, 'mode': None}
+        try:
+            with Image.open(path) as img:
+                entry['width'], entry['height'] = img.size
+                entry['mode'] = img.mode
+        except (UnidentifiedImageError, OSError) as e:
+            logging.warning(f"{path} is not a readable image: {e}")
+        entry['sha256'] = hashFile(path)
+        self.indexed += 1
+        return entry
+
+    def refreshFolder(self, folder:Path, pattern:str="*.png") -> list[str]:
+        """Brings the entries for the files in folder up to date, returning their keys in sorted order"""
+        folder = Path(folder)
+        prefix = self._key(folder) + "/"
+        if prefix == "./":
+            prefix = ""
+
+        present = set()
+        if folder.is_dir():
+            with os.scandir(folder) as scan:
+                for dirEntry in scan:
+                    if not dirEntry.is_file() or not fnmatch.fnmatch(dirEntry.name, pattern):
+                        continue
+                    key = prefix + dirEntry.name
+                    present.add(key)
+                    stat = dirEntry.stat()
+                    entry = self.entries.get(key)
+                    if entry is None or entry['size'] != stat.st_size or entry['mtime'] != stat.st_mtime_ns:
+                        self.entries[key] = self._indexFile(Path(dirEntry.path), stat)
+                        self.dirty = True
+
+        # Forget files that have gone from the folder
+        for key in [key for key in self.entries if key.startswith(prefix) and "/" not in key[len(prefix):] and fnmatch.fnmatch(key[len(prefix):], pattern)]:
+            if key not in present:
+                del self.entries[key]
+                self.dirty = True
+
+        keys = sorted(present)
+        self.scannedFolders[(folder, pattern)] = keys
+        return keys
+
+    def listFolder(self, folder:Path, pattern:str="*.png") -> list[Path]:
+        """Paths of the files in folder matching pattern, sorted, scanning the folder only the first time it's asked for"""
+        keys = self.scannedFolders.get((Path(folder), pattern))
+        if keys is None:
+            keys = self.refreshFolder(folder, pattern)
+        return [self.assetsPath / key for key in keys]
+
+    def refresh(self):
+        """Rescans every folder listed so far"""
+        for folder, pattern in list(self.scannedFolders):
+            self.refreshFolder(folder, pattern)
+
+    def describe(self, path:Path) -> dict:
+        """The index entry for a file in an already listed folder, or None if it isn't indexed.
+        Files outside the assets folder, such as proxies, are never indexed."""
+        try:
+            key = self._key(path)
+        except ValueError:
+            return None
+        return self.entries.get(key)
+
+    def digest(self, path:Path, stat:os.stat_result=None) -> str:
+        """The indexed sha256 of a file, or None if it isn't indexed or has changed since it was"""
+        entry = self.describe(path)
+        if entry is None:
+            return None
+        stat = stat or os.stat(path)
+        if entry['size'] != stat.st_size or entry['mtime'] != stat.st_mtime_ns:
+            return None
+        return entry['sha256']
+
+    def unreadableAssets(self) -> list[Path]:
+        return [self.assetsPath / key for key, entry in sorted(self.entries.items()) if entry['mode'] is None]
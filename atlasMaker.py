@@ -0,0 +1,159 @@
+import json
+import logging
+from pathlib import Path
+
+from PIL import Image
+
+import imageDrawing
+from cardStore import RawCard
+from instrumentation import getTracer
+
+
+# Largest deck sheet, in pixels, by default. Most tabletop tools and GPUs take textures up to 4096 on a side
+DEFAULT_MAX_SHEET_SIZE = (4096, 4096)
+# Largest grid of cards on one sheet by default, Tabletop Simulator's limit for a custom deck
+DEFAULT_MAX_GRID = (10, 7)
+
+# Formats a sheet can be written in, by file suffix
+ATLAS_FORMATS = ('png', 'jpg')
+JPEG_QUALITY = 90
+# Colour of the sheet behind the cards, and what transparent parts of a card are flattened onto
+SHEET_FILL = (0, 0, 0)
+
+
+def flatten(image:Image) -> Image:
+    """image as RGB, with anything transparent laid over SHEET_FILL. An RGB image is returned as it is."""
+    if image.mode == "RGB":
+        return image
+    if image.mode in ("RGBA", "LA", "PA") or (image.mode == "P" and 'transparency' in image.info):
+        rgba = image.convert("RGBA")
+        flattened = Image.new("RGB", image.size, SHEET_FILL)
+        flattened.paste(rgba, mask=rgba.getchannel("A"))
+        return flattened
+    return image.convert("RGB")
+
+
+def openCardImage(image) -> Image:
+    """A card front or back as an RGB PIL image, whatever form the build handed it over in"""
+    if isinstance(image, (str, Path)):
+        with Image.open(image) as opened:
+            opened.load()
+            return flatten(opened)
+    if isinstance(image, RawCard):
+        return flatten(image.open())
+    return flatten(image)
+
+
+class AtlasMaker(object):
+    """Lays decks out as deck sheets for digital tabletop tools: a few big images holding a grid of card faces each,
+    the backs written once each beside them, and a JSON index mapping every card to its cell.
+
+    Each sheet is filled in memory as the cards are rendered and written once it's full, so a deck is a handful
+    of large writes rather than a file per card.
+    """
+
+    def __init__(self, maxSheetSize:tuple[int, int]=DEFAULT_MAX_SHEET_SIZE, maxGrid:tuple[int, int]=DEFAULT_MAX_GRID, imageFormat:str='png', compressLevel:int=None) -> None:
+        if imageFormat not in ATLAS_FORMATS:
+            raise ValueError(f"unknown atlas format {imageFormat}, expected one of {', '.join(ATLAS_FORMATS)}")
+        self.maxSheetSize = maxSheetSize
+        self.maxGrid = maxGrid
+        self.imageFormat = imageFormat
+        self.compressLevel = compressLevel
+
+    def grid(self, cellSize:tuple[int, int]) -> tuple[int, int]:
+        """Columns and rows of cellSize cards that fit on a sheet"""
+        columns = min(self.maxGrid[0], self.maxSheetSize[0] // cellSize[0])
+        rows = min(self.maxGrid[1], self.maxSheetSize[1] // cellSize[1])
+        if columns < 1 or rows < 1:
+            raise ValueError(f"a {cellSize[0]}x{cellSize[1]} card doesn't fit on a {self.maxSheetSize[0]}x{self.maxSheetSize[1]} sheet")
+        return columns, rows
+
+    def _save(self, image:Image, path:Path):
+        with getTracer().stage("write sheet", file=path.name):
+            if self.imageFormat == 'jpg':
+                image.save(path, quality=JPEG_QUALITY, dpi=(imageDrawing.OUTPUT_DPI, imageDrawing.OUTPUT_DPI))
+            elif self.compressLevel is None:
+                image.save(path, dpi=(imageDrawing.OUTPUT_DPI, imageDrawing.OUTPUT_DPI))
+            else:
+                image.save(path, compress_level=self.compressLevel, dpi=(imageDrawing.OUTPUT_DPI, imageDrawing.OUTPUT_DPI))
+
+    def makeAtlas(self, frontAndBackImages, outputFolder:Path, deckName:str, cardSizeInInches:tuple[float, float]) -> dict:
+        """Draws an iterator of (front, back) into deckName_1.png, deckName_2.png and so on, with the backs in
+        deckName_back_1.png onwards and the index in deckName.json. Returns the index.
+
+        Cards are numbered in the order they arrive, and fill each sheet left to right, top to bottom. Every sheet
+        but the last is a full grid, the last is only as tall as the rows it uses. Fronts handed over as PIL images
+        are closed once they're on their sheet.
+        """
+        outputFolder = Path(outputFolder)
+        cellSize = tuple(int(x*imageDrawing.OUTPUT_DPI) for x in cardSizeInInches)
+        columns, rows = self.grid(cellSize)
+        perSheet = columns * rows
+
+        def sheetPath(number):
+            return outputFolder / f"{deckName}_{number}.{self.imageFormat}"
+
+        def backPath(number):
+            return outputFolder / f"{deckName}_back_{number}.{self.imageFormat}"
+
+        index = {'deck': deckName, 'cardSize': list(cellSize), 'columns': columns, 'rows': rows, 'sheets': [], 'backs': [], 'cards': []}
+        sheet = None
+        onSheet = 0
+        # Backs are shared by many cards, so they're written the first time they turn up. Images are told apart by identity
+        backNumbers = dict()
+
+        def finishSheet():
+            usedRows = -(-onSheet // columns)
+            image = sheet if usedRows == rows else sheet.crop((0, 0, columns*cellSize[0], usedRows*cellSize[1]))
+            path = sheetPath(len(index['sheets'])+1)
+            self._save(image, path)
+            index['sheets'].append({'file': path.name, 'size': list(image.size), 'columns': columns, 'rows': usedRows, 'cards': onSheet})
+
+        for front, back in frontAndBackImages:
+            if sheet is None:
+                sheet = Image.new("RGB", (columns*cellSize[0], rows*cellSize[1]), SHEET_FILL)
+                onSheet = 0
+            cell = onSheet
+            column, row = cell % columns, cell // columns
+            x, y = column*cellSize[0], row*cellSize[1]
+
+            image = openCardImage(front)
+            # Rendering rounds the odd card a pixel off, the grid has to stay exact for the tools to cut it up
+            cardImage = image if image.size == cellSize else image.resize(cellSize, Image.LANCZOS)
+            sheet.paste(cardImage, (x, y))
+            image.close()
+            if isinstance(front, Image.Image):
+                front.close()
+
+            backNumber = None
+            if back is not None:
+                backKey = str(back) if isinstance(back, (str, Path)) else id(back)
+                backNumber = backNumbers.get(backKey)
+                if backNumber is None:
+                    backNumber = len(index['backs'])
+                    backNumbers[backKey] = backNumber
+                    backImage = openCardImage(back)
+                    # Backs are rendered upside down to line up when printed double sided, on screen they're upright
+                    path = backPath(backNumber+1)
+                    self._save(backImage.transpose(Image.ROTATE_180), path)
+                    index['backs'].append({'file': path.name})
+
+            onSheet += 1
+            index['cards'].append({'sheet': len(index['sheets']), 'cell': cell, 'column': column, 'row': row, 'box': [x, y, x+cellSize[0], y+cellSize[1]], 'back': backNumber})
+            if onSheet == perSheet:
+                finishSheet()
+                sheet = None
+        if sheet is not None:
+            finishSheet()
+
+        # Sheets and backs a bigger build left behind would otherwise be picked up along with this one
+        for pathFor, written in ((sheetPath, len(index['sheets'])), (backPath, len(index['backs']))):
+            staleNumber = written + 1
+            while pathFor(staleNumber).is_file():
+                pathFor(staleNumber).unlink()
+                staleNumber += 1
+
+        with open(outputFolder / f"{deckName}.json", 'w') as f:
+            json.dump(index, f, indent=1)
+        logging.info(f"{deckName}: {len(index['cards'])} cards on {len(index['sheets'])} {columns}x{rows} sheets, {len(index['backs'])} backs")
+        return index
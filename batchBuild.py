@@ -0,0 +1,267 @@
+import json
+import time
+import logging
+import argparse
+import threading
+import traceback
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+
+from PDFMaker import PdfMaker, PAPER_SIZES_IN
+from deckLoader import DeckCache
+from renderCache import RenderCache, hashFile
+from renderPool import RenderPool
+from cardStore import CARD_STORES
+from assetGetter import AssetGetter
+from main import loadSharedImages, buildDecks, guaranteeFolder
+
+
+# Settings a job takes from the manifest's defaults when it doesn't give its own
+JOB_DEFAULTS = {
+    'assets': "assets",
+    'resourceCards': None,
+    'vipCards': None,
+    'paper': "letter",
+    'bleedIn': 0,
+    'gutterIn': None,
+    'rotate': True,
+    'singlePdf': False,
+    'images': True,
+    'cardStore': "png",
+}
+
+
+class DeckJob(object):
+    """One deck variant of a batch manifest. Paths are resolved against the manifest's folder.
+
+    resourceCards and vipCards default to the usual CSVs of the job's assets folder.
+    """
+
+    def __init__(self, name:str, output:Path, settings:dict, baseFolder:Path) -> None:
+        unknown = set(settings) - set(JOB_DEFAULTS)
+        if unknown:
+            raise ValueError(f"job {name} has unknown settings {sorted(unknown)}")
+        settings = {**JOB_DEFAULTS, **settings}
+        if settings['paper'] not in PAPER_SIZES_IN:
+            raise ValueError(f"job {name} asks for paper {settings['paper']}, expected one of {sorted(PAPER_SIZES_IN)}")
+        if settings['cardStore'] not in CARD_STORES:
+            raise ValueError(f"job {name} asks for card store {settings['cardStore']}, expected one of {CARD_STORES}")
+
+        self.name = name
+        self.output = baseFolder / output
+        self.assets = baseFolder / settings['assets']
+        self.resourceCards = baseFolder / settings['resourceCards'] if settings['resourceCards'] else self.assets / "resourceCards.csv"
+        self.vipCards = baseFolder / settings['vipCards'] if settings['vipCards'] else self.assets / "VIPCardsTriple.csv"
+        self.paper = settings['paper']
+        self.bleedIn = settings['bleedIn']
+        self.gutterIn = settings['gutterIn']
+        self.rotate = settings['rotate']
+        self.singlePdf = settings['singlePdf']
+        self.images = settings['images']
+        self.cardStore = settings['cardStore']
+
+
+def loadManifest(manifestPath:Path) -> list[DeckJob]:
+    """Reads a batch manifest, a JSON object like
+
+        {"defaults": {"paper": "a4"},
+         "jobs": [{"name": "base", "output": "out/base"},
+                  {"name": "bleed", "output": "out/bleed", "bleedIn": 0.125, "resourceCards": "variants/cheap.csv"}]}
+
+    where defaults and each job take the settings in JOB_DEFAULTS.
+    """
+    manifestPath = Path(manifestPath)
+    with open(manifestPath) as f:
+        manifest = json.load(f)
+
+    defaults = manifest.get('defaults', {})
+    jobs = list()
+    names = set()
+    for index, job in enumerate(manifest['jobs']):
+        job = dict(job)
+        name = job.pop('name', f"job{index}")
+        if name in names:
+            raise ValueError(f"more than one job is called {name}")
+        names.add(name)
+        if 'output' not in job:
+            raise ValueError(f"job {name} has no output folder")
+        output = job.pop('output')
+        jobs.append(DeckJob(name, Path(output), {**defaults, **job}, manifestPath.parent))
+    return jobs
+
+
+class JobRenderCache(object):
+    """One job's view of the batch's shared RenderCache, counting that job's own hits and misses"""
+
+    def __init__(self, shared:RenderCache) -> None:
+        self.shared = shared
+        self.hits = 0
+        self.misses = 0
+
+    def cardKey(self, card, sharedImages) -> str:
+        return self.shared.cardKey(card, sharedImages)
+
+    def fetch(self, key:str, outputPath:Path):
+        fetched = self.shared.fetch(key, outputPath)
+        if fetched is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return fetched
+
+    def store(self, key:str, rendered):
+        self.shared.store(key, rendered)
+
+
+class BatchBuilder(object):
+    """Builds every job of a manifest in one process.
+
+    Jobs whose shared icons are the same files, by content, share one loaded SplendidSharedAssetts and one
+    render pool, card backs are generated once per back image, and a card identical to one an earlier job
+    rendered comes out of the shared render cache. At most concurrentJobs jobs are built at once, see schedule.
+    """
+
+    def __init__(self, jobs:list[DeckJob], renderWorkers=1, pdfWorkers=1, concurrentJobs=2, renderCache:RenderCache=None, deckCache:DeckCache=None) -> None:
+        self.jobs = jobs
+        self.renderWorkers = renderWorkers
+        self.pdfWorkers = pdfWorkers
+        self.concurrentJobs = max(1, concurrentJobs)
+        self.renderCache = renderCache
+        self.deckCache = deckCache
+        # assets folder -> AssetGetter
+        self.assetGetters = dict()
+        # digests of the shared icons -> (shared assets, render pool)
+        self.sharedGroups = dict()
+        self._lock = threading.Lock()
+
+    def _assetGetter(self, assetsPath:Path) -> AssetGetter:
+        with self._lock:
+            if assetsPath not in self.assetGetters:
+                self.assetGetters[assetsPath] = AssetGetter(assetsPath)
+            return self.assetGetters[assetsPath]
+
+    @staticmethod
+    def _sharedGroupKey(assetGetter:AssetGetter) -> tuple[str, ...]:
+        sources = [assetGetter.getResourceImagePath(resourceType) for resourceType in sorted(assetGetter.resourceTypeToImage, key=lambda resourceType: resourceType.value)]
+        sources.append(assetGetter.getLevelIcon())
+        return tuple(hashFile(path) for path in sources)
+
+    def _sharedGroup(self, assetGetter:AssetGetter):
+        """The shared assets and render pool for the icons under assetGetter, loaded the first time they're asked for"""
+        key = self._sharedGroupKey(assetGetter)
+        with self._lock:
+            if key not in self.sharedGroups:
+                sharedImages = loadSharedImages(assetGetter)
+                renderPool = RenderPool(sharedImages, self.renderWorkers).__enter__()
+                self.sharedGroups[key] = (sharedImages, renderPool)
+            return self.sharedGroups[key]
+
+    def buildJob(self, job:DeckJob) -> dict:
+        """Builds one job, returning its entry of the summary report"""
+        start = time.perf_counter()
+        report = {'name': job.name, 'output': str(job.output)}
+        renderCache = JobRenderCache(self.renderCache) if self.renderCache is not None else None
+        try:
+            assetGetter = self._assetGetter(job.assets)
+            sharedImages, renderPool = self._sharedGroup(assetGetter)
+
+            outputImageFolderPath = None
+            if job.images:
+                outputImageFolderPath = job.output / "images"
+                guaranteeFolder(outputImageFolderPath)
+            else:
+                guaranteeFolder(job.output)
+
+            paperWidth, paperHeight = PAPER_SIZES_IN[job.paper]
+            pdfManager = PdfMaker(paperHeight, paperWidth, gutterInInches=job.gutterIn, bleedInInches=job.bleedIn, allowRotation=job.rotate, workers=self.pdfWorkers)
+            buildDecks(pdfManager, job.output, assetGetter, job.resourceCards, job.vipCards, outputImageFolderPath, sharedImages, renderPool, renderCache, self.deckCache, job.singlePdf, job.cardStore)
+            report['status'] = "ok"
+            report['pdfs'] = sorted(path.name for path in job.output.glob("*.pdf"))
+        except Exception as e:
+            # One broken variant shouldn't stop the rest of the release
+            logging.error(f"job {job.name} failed: {e}")
+            report['status'] = "failed"
+            report['error'] = "".join(traceback.format_exception_only(e)).strip()
+        report['seconds'] = round(time.perf_counter() - start, 3)
+        if renderCache is not None:
+            report['renderCacheHits'] = renderCache.hits
+            report['renderCacheMisses'] = renderCache.misses
+        return report
+
+    def schedule(self) -> tuple[list[DeckJob], list[DeckJob]]:
+        """Splits the jobs into two waves: the first job of every shared asset group, then all the others.
+
+        Shared icons are part of every card's cache key, so jobs of different groups never have a card in
+        common and the first wave can run side by side. Jobs of one group mostly do, and by the time the
+        second wave starts the first has put those cards in the render cache, rather than every job of the
+        group rendering them at once.
+        """
+        leaders = list()
+        followers = list()
+        seenGroups = set()
+        for job in self.jobs:
+            try:
+                group = self._sharedGroupKey(self._assetGetter(job.assets))
+            except OSError:
+                # Its icons can't be read, buildJob will report why
+                group = job.name
+            if group in seenGroups:
+                followers.append(job)
+            else:
+                seenGroups.add(group)
+                leaders.append(job)
+        return leaders, followers
+
+    def run(self) -> dict:
+        """Builds every job, returning the summary report. Jobs are reported in manifest order."""
+        start = time.perf_counter()
+        jobReports = dict()
+        try:
+            with ThreadPoolExecutor(max_workers=min(self.concurrentJobs, max(1, len(self.jobs)))) as executor:
+                for wave in self.schedule():
+                    for job, jobReport in zip(wave, executor.map(self.buildJob, wave)):
+                        jobReports[job.name] = jobReport
+        finally:
+            self.close()
+        jobReports = [jobReports[job.name] for job in self.jobs]
+
+        failed = sum(1 for jobReport in jobReports if jobReport['status'] != "ok")
+        return {
+            'jobs': jobReports,
+            'succeeded': len(jobReports) - failed,
+            'failed': failed,
+            'sharedAssetGroups': len(self.sharedGroups),
+            'seconds': round(time.perf_counter() - start, 3),
+        }
+
+    def close(self):
+        for _, renderPool in self.sharedGroups.values():
+            renderPool.__exit__(None, None, None)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build every deck variant listed in a manifest in one process")
+    parser.add_argument("manifest", type=Path, help="JSON manifest of deck jobs, see batchBuild.loadManifest")
+    parser.add_argument("--report", type=Path, help="where to write the summary report, defaults to batchReport.json beside the manifest")
+    parser.add_argument("--jobs", type=int, default=2, help="number of deck jobs built at once")
+    parser.add_argument("--workers", type=int, default=1, help="number of render processes shared by all jobs, 0 uses every core")
+    parser.add_argument("--pdf-workers", type=int, default=1, help="number of processes drawing each job's PDFs, 0 uses every core")
+    parser.add_argument("--no-render-cache", action="store_true", help="re-render every card, even ones an earlier job or run already rendered")
+    parser.add_argument("--render-cache-mb", type=int, default=512, help="size limit of the render cache")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    jobs = loadManifest(args.manifest)
+
+    cacheFolder = args.manifest.parent / "batchCache"
+    renderCache = None
+    if not args.no_render_cache:
+        renderCache = RenderCache(cacheFolder / "renderCache", maxBytes=args.render_cache_mb*1024*1024)
+    deckCache = DeckCache(cacheFolder / "deckCache")
+
+    report = BatchBuilder(jobs, renderWorkers=args.workers, pdfWorkers=args.pdf_workers, concurrentJobs=args.jobs, renderCache=renderCache, deckCache=deckCache).run()
+
+    reportPath = args.report or args.manifest.parent / "batchReport.json"
+    with open(reportPath, 'w') as f:
+        json.dump(report, f, indent=2)
+    logging.info(f"{report['succeeded']} of {len(jobs)} jobs built in {report['seconds']}s, report written to {reportPath}")
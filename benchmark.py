@@ -0,0 +1,165 @@
+import sys
+import json
+import time
+import shutil
+import logging
+import platform
+import argparse
+import tempfile
+import statistics
+from pathlib import Path
+
+import PIL
+import reportlab
+from PIL import Image
+
+import main
+import imageDrawing
+from PDFMaker import PdfMaker, US_LETTER_IN
+from splendid import ResourceType, ResourceCard, VIPCard
+from syntheticAssets import generateAssets
+
+
+DEFAULT_BUILD_SIZES = [100, 1000, 10000]
+# Deck used for the per function timings
+FUNCTION_DECK_SIZE = 50
+
+logger = logging.getLogger("benchmark")
+
+
+def timeCall(function, repeat:int) -> dict:
+    """Runs function repeat times, returning the timings in seconds"""
+    timings = list()
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        timings.append(time.perf_counter() - start)
+    return {
+        'runs': repeat,
+        'min': min(timings),
+        'median': statistics.median(timings),
+        'mean': statistics.fmean(timings),
+    }
+
+
+def decodeArt(artPath:Path):
+    with Image.open(artPath) as art:
+        art.load()
+
+
+def benchmarkFunctions(workFolder:Path, repeat:int) -> dict:
+    assetsPath = workFolder / "functionAssets"
+    resourceCardsCSV, vipCardsCSV = generateAssets(assetsPath, FUNCTION_DECK_SIZE)
+    assetGetter = main.AssetGetter(assetsPath)
+    sharedImages = main.loadSharedImages(assetGetter)
+
+    artPath = assetGetter.getResourceCardImagePaths(ResourceType.Air)[0]
+    with Image.open(artPath) as art:
+        art.load()
+    outputSize = tuple(x*imageDrawing.OUTPUT_DPI for x in imageDrawing.RESOURCE_CARD_SIZE_IN)
+    fill = imageDrawing.resourceTypeToPILColor[ResourceType.Air]
+    cropped = imageDrawing.symmetricalCrop(art, imageDrawing.IMG_BORDER_CROP_SYMMETRICAL, 0)
+    shrunk = imageDrawing.shrink_image(cropped, outputSize, fill)
+
+    resourceCard = ResourceCard(produces=ResourceType.Air, requires={ResourceType.Water: 2, ResourceType.Fire: 3}, level=2, victoryPoints=1)
+    resourceCard.imagePath = artPath
+    vipCard = VIPCard(requires={ResourceType.Water: 4, ResourceType.Earth: 4}, victoryPoints=3)
+    vipCard.imagePath = assetGetter.getVipImagePaths()[0]
+    renderedPath = workFolder / "rendered.png"
+
+    pdfFolder = workFolder / "functionPdf"
+    pdfFolder.mkdir(exist_ok=True)
+    resourceCards, _ = main.loadResourceCardsFromCsv(resourceCardsCSV)
+    imageTuples = main.generateResourceCards(resourceCards, assetGetter, pdfFolder, sharedImages)
+
+    benchmarks = {
+        # With symmetricalCrop and shrink_image this is most of processResourceCard, the pastes after them are the rest
+        'decodeArt': lambda: decodeArt(artPath),
+        'symmetricalCrop': lambda: imageDrawing.symmetricalCrop(art, imageDrawing.IMG_BORDER_CROP_SYMMETRICAL, 0),
+        'shrink_image': lambda: imageDrawing.shrink_image(cropped, outputSize, fill),
+        'add_border': lambda: imageDrawing.add_border(shrunk, fill),
+        'processResourceCard': lambda: imageDrawing.processResourceCard(resourceCard, None, sharedImages),
+        'processResourceCard_png': lambda: imageDrawing.processResourceCard(resourceCard, renderedPath, sharedImages),
+        'processVIPCard': lambda: imageDrawing.processVIPCard(vipCard, None, sharedImages),
+        f'PdfMaker.makePDF_{len(imageTuples)}cards': lambda: PdfMaker(US_LETTER_IN[1], US_LETTER_IN[0]).makePDF(imageTuples, workFolder / "bench.pdf", imageDrawing.RESOURCE_CARD_SIZE_IN),
+    }
+
+    results = dict()
+    for name, function in benchmarks.items():
+        # PDF assembly is far slower than the rest, so it gets fewer runs
+        runs = max(1, repeat // 10) if name.startswith('PdfMaker.makePDF') else repeat
+        results[name] = timeCall(function, runs)
+        logger.info(f"{name}: {results[name]['median']*1000:.2f} ms median")
+    return results
+
+
+def benchmarkBuilds(workFolder:Path, sizes:list[int], **mainOptions) -> dict:
+    results = dict()
+    for size in sizes:
+        assetsPath = workFolder / f"assets_{size}"
+        outputPath = workFolder / f"output_{size}"
+        resourceCardsCSV, vipCardsCSV = generateAssets(assetsPath, size)
+
+        start = time.perf_counter()
+        main.main(outputPath, main.AssetGetter(assetsPath), resourceCardsCSV, vipCardsCSV, **mainOptions)
+        seconds = time.perf_counter() - start
+
+        results[str(size)] = {'seconds': seconds, 'cardsPerSecond': size / seconds}
+        logger.info(f"{size} card build: {seconds:.2f} s")
+        shutil.rmtree(outputPath)
+        shutil.rmtree(assetsPath)
+    return results
+
+
+def environment() -> dict:
+    return {
+        'python': sys.version.split()[0],
+        'platform': platform.platform(),
+        'processor': platform.processor(),
+        'pillow': PIL.__version__,
+        'reportlab': reportlab.Version,
+    }
+
+
+def compareResults(previous:dict, current:dict) -> str:
+    """Lines of current/previous ratios for every timing both runs have, above 1 means slower"""
+    lines = list()
+    for name, timing in current.get('functions', {}).items():
+        if name in previous.get('functions', {}):
+            ratio = timing['median'] / previous['functions'][name]['median']
+            lines.append(f"{name}: {ratio:.2f}x")
+    for size, build in current.get('builds', {}).items():
+        if size in previous.get('builds', {}):
+            ratio = build['seconds'] / previous['builds'][size]['seconds']
+            lines.append(f"{size} card build: {ratio:.2f}x")
+    return "\n".join(lines)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the card pipeline against generated assets")
+    parser.add_argument("--output", type=Path, default=Path("bench_results.json"), help="where to write the JSON results")
+    parser.add_argument("--compare", type=Path, help="earlier results to compare against")
+    parser.add_argument("--sizes", type=int, nargs='*', default=DEFAULT_BUILD_SIZES, help="deck sizes for the end to end builds")
+    parser.add_argument("--repeat", type=int, default=20, help="runs per function benchmark")
+    parser.add_argument("--workers", type=int, default=1, help="render processes for the end to end builds")
+    args = parser.parse_args()
+
+    # The pipeline's own progress logging would drown out the results
+    logging.basicConfig(level=logging.WARNING)
+    logger.setLevel(logging.INFO)
+
+    with tempfile.TemporaryDirectory() as workFolder:
+        results = {
+            'timestamp': time.strftime("%Y-%m-%dT%H:%M:%S"),
+            'environment': environment(),
+            'functions': benchmarkFunctions(Path(workFolder), args.repeat),
+            'builds': benchmarkBuilds(Path(workFolder), args.sizes, renderWorkers=args.workers),
+        }
+
+    with open(args.output, 'w') as f:
+        json.dump(results, f, indent=2)
+    logger.info(f"results written to {args.output}")
+
+    if args.compare is not None:
+        with open(args.compare) as f:
+            logger.info("current / previous median:\n" + compareResults(json.load(f), results))
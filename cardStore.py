@@ -0,0 +1,133 @@
+import mmap
+import math
+import struct
+from pathlib import Path
+
+from PIL import Image
+
+import imageDrawing
+from instrumentation import getTracer
+
+
+# Kinds of intermediate store a build can keep its rendered cards in
+CARD_STORES = ('png', 'raw')
+
+RAW_MAGIC = b"SPRW"
+RAW_VERSION = 1
+# magic, version, slot width, slot height
+RAW_HEADER = struct.Struct("<4sHHH")
+# width, height and pixel layout of the card in a slot, 0 x 0 for a slot nothing was written to
+RAW_SLOT_HEADER = struct.Struct("<HHB")
+# Slots start on page boundaries so each card maps cleanly
+RAW_ALIGNMENT = 4096
+
+# Pixel layouts a raw slot can hold. RGB is padded to 4 bytes a pixel, which is how Pillow holds it in memory anyway
+RAW_MODES = {0: "RGBX", 1: "RGBA"}
+RAW_MODE_CODES = {mode: code for code, mode in RAW_MODES.items()}
+
+
+class PngCardStore(object):
+    """Rendered cards as one PNG file each in folder.
+
+    compressLevel is zlib's 0-9, None leaves it at Pillow's default. Lower levels trade disk space for encode time.
+    """
+
+    def __init__(self, folder:Path, compressLevel:int=None) -> None:
+        self.folder = Path(folder)
+        self.compressLevel = compressLevel
+
+    def target(self, index:int, fileName:str) -> Path:
+        return self.folder / fileName
+
+    def write(self, target:Path, image:Image) -> Path:
+        with getTracer().stage("png encode"):
+            if self.compressLevel is None:
+                image.save(target, dpi=(imageDrawing.OUTPUT_DPI, imageDrawing.OUTPUT_DPI))
+            else:
+                image.save(target, dpi=(imageDrawing.OUTPUT_DPI, imageDrawing.OUTPUT_DPI), compress_level=self.compressLevel)
+        return target
+
+
+class RawCard(object):
+    """A card rendered into a RawCardStore. open() maps its pixels straight out of the store's file."""
+
+    __slots__ = ('path', 'index', 'offset')
+
+    def __init__(self, path:Path, index:int, offset:int) -> None:
+        self.path = path
+        self.index = index
+        self.offset = offset
+
+    def open(self) -> Image:
+        """The card as a read only image backed by the mapped file, nothing is copied or decoded"""
+        with open(self.path, 'rb') as f:
+            mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        # Slots past the last one written aren't in the file at all
+        width = 0
+        if self.offset + RAW_SLOT_HEADER.size <= len(mapped):
+            width, height, modeCode = RAW_SLOT_HEADER.unpack_from(mapped, self.offset)
+        if width == 0:
+            raise ValueError(f"slot {self.index} of {self.path} was never written")
+        mode = RAW_MODES[modeCode]
+        start = self.offset + RAW_SLOT_HEADER.size
+        # The image holds on to the view, which keeps the mapping open for as long as the image is around
+        pixels = memoryview(mapped)[start:start + width*height*4]
+        return Image.frombuffer(mode, (width, height), pixels, "raw", mode, 0, 1)
+
+    def __repr__(self) -> str:
+        return f"RawCard({self.path}, {self.index})"
+
+
+class RawCardStore(object):
+    """Every card of a deck as uncompressed pixels in one file, each in a fixed size slot.
+
+    Skips the zlib encode when writing and the decode when the PDF is built, at the cost of a much bigger
+    file. A card's slot is found from its index alone, so render workers can fill slots in any order.
+    """
+
+    def __init__(self, path:Path, slotSize:tuple[int, int]) -> None:
+        self.path = Path(path)
+        self.slotSize = slotSize
+        slotWidth, slotHeight = slotSize
+        self.slotBytes = self._aligned(RAW_SLOT_HEADER.size + slotWidth*slotHeight*4)
+        self.dataOffset = self._aligned(RAW_HEADER.size)
+
+        with open(self.path, 'wb') as f:
+            f.write(RAW_HEADER.pack(RAW_MAGIC, RAW_VERSION, slotWidth, slotHeight))
+
+    @staticmethod
+    def _aligned(size:int) -> int:
+        return math.ceil(size / RAW_ALIGNMENT) * RAW_ALIGNMENT
+
+    @classmethod
+    def forCardSize(cls, path:Path, cardSizeInInches:tuple[float, float]):
+        slotSize = tuple(math.ceil(x*imageDrawing.OUTPUT_DPI) for x in cardSizeInInches)
+        return cls(path, slotSize)
+
+    def target(self, index:int, fileName:str) -> RawCard:
+        return RawCard(self.path, index, self.dataOffset + index*self.slotBytes)
+
+    def write(self, target:RawCard, image:Image) -> RawCard:
+        width, height = image.size
+        if width > self.slotSize[0] or height > self.slotSize[1]:
+            raise ValueError(f"a {width}x{height} card doesn't fit the {self.slotSize[0]}x{self.slotSize[1]} slots of {self.path}")
+
+        if image.mode not in ("RGB", "RGBA"):
+            image = image.convert("RGBA" if image.mode in ("LA", "PA") or 'transparency' in image.info else "RGB")
+        mode = "RGBA" if image.mode == "RGBA" else "RGBX"
+
+        # Writes land in disjoint slots, so several processes can fill the same file at once
+        with open(self.path, 'r+b') as f:
+            f.seek(target.offset)
+            f.write(RAW_SLOT_HEADER.pack(width, height, RAW_MODE_CODES[mode]))
+            f.write(image.tobytes("raw", mode))
+        return target
+
+
+def openCardStore(kind:str, folder:Path, deckName:str, cardSizeInInches:tuple[float, float], compressLevel:int=None):
+    """The store for one deck's rendered cards, see CARD_STORES"""
+    if kind == 'png':
+        return PngCardStore(folder, compressLevel)
+    if kind == 'raw':
+        return RawCardStore.forCardSize(folder / f"{deckName}.rgba", cardSizeInInches)
+    raise ValueError(f"unknown card store {kind}, expected one of {CARD_STORES}")
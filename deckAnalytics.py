@@ -0,0 +1,180 @@
+import json
+import logging
+import argparse
+from pathlib import Path
+
+import numpy as np
+
+from splendid import ResourceType, ResourceCard, VIPCard, Deck, COST_ORDER, COST_INDEX
+from deckLoader import loadDeck, RESOURCE_CARD_SCHEMA, VIP_CARD_SCHEMA
+
+
+COLOR_NAMES = [resourceType.name for resourceType in COST_ORDER]
+
+# ResourceType.value -> column in a cost vector
+_producesToColumn = np.full(max(resourceType.value for resourceType in ResourceType) + 1, -1, dtype=np.int64)
+for _resourceType, _index in COST_INDEX.items():
+    _producesToColumn[_resourceType.value] = _index
+
+
+def asDeck(cards, cardType) -> Deck:
+    if isinstance(cards, Deck):
+        return cards
+    return Deck(cardType, cards)
+
+
+def deckColumns(deck:Deck) -> dict[str, np.ndarray]:
+    """Zero copy NumPy views over a Deck's columns, with blank costs counted as 0"""
+    costs = np.frombuffer(deck.costs, dtype=np.int8).reshape(-1, len(COST_ORDER))
+    return {
+        'produces': _producesToColumn[np.frombuffer(deck.produces, dtype=np.int8)],
+        'levels': np.frombuffer(deck.levels, dtype=np.int8).astype(np.int64),
+        'victoryPoints': np.frombuffer(deck.victoryPoints, dtype=np.int8).astype(np.int64),
+        'costs': np.maximum(costs, 0).astype(np.int64),
+    }
+
+
+def resourceCardStats(deck:Deck) -> list[dict]:
+    """One row per level: card count, cost totals and distribution by color, VP efficiency and produced colors"""
+    columns = deckColumns(deck)
+    levels = columns['levels']
+    costs = columns['costs']
+    victoryPoints = columns['victoryPoints']
+    produces = columns['produces']
+
+    uniqueLevels, levelIndex = np.unique(levels, return_inverse=True)
+    levelCount = len(uniqueLevels)
+    colorCount = len(COST_ORDER)
+
+    cardCounts = np.bincount(levelIndex, minlength=levelCount)
+    costByColor = np.zeros((levelCount, colorCount), dtype=np.int64)
+    np.add.at(costByColor, levelIndex, costs)
+    totalCosts = costs.sum(axis=1)
+    costTotals = np.bincount(levelIndex, weights=totalCosts, minlength=levelCount)
+    vpTotals = np.bincount(levelIndex, weights=victoryPoints, minlength=levelCount)
+
+    # Free cards would divide by zero, they're left out of the efficiency figure
+    paid = totalCosts > 0
+    efficiency = np.zeros(len(totalCosts))
+    efficiency[paid] = victoryPoints[paid] / totalCosts[paid]
+    efficiencyTotals = np.bincount(levelIndex[paid], weights=efficiency[paid], minlength=levelCount)
+    paidCounts = np.bincount(levelIndex[paid], minlength=levelCount)
+
+    producedCounts = np.bincount(levelIndex*colorCount + produces, minlength=levelCount*colorCount).reshape(levelCount, colorCount)
+
+    rows = list()
+    for i, level in enumerate(uniqueLevels):
+        colorShare = costByColor[i] / max(costTotals[i], 1)
+        rows.append({
+            'level': int(level),
+            'cards': int(cardCounts[i]),
+            'totalCost': int(costTotals[i]),
+            'meanCost': float(costTotals[i] / cardCounts[i]),
+            'costByColor': {name: int(count) for name, count in zip(COLOR_NAMES, costByColor[i])},
+            'costShareByColor': {name: round(float(share), 4) for name, share in zip(COLOR_NAMES, colorShare)},
+            'totalVictoryPoints': int(vpTotals[i]),
+            'meanVpPerGem': float(efficiencyTotals[i] / paidCounts[i]) if paidCounts[i] else 0.0,
+            'producesByColor': {name: int(count) for name, count in zip(COLOR_NAMES, producedCounts[i])},
+        })
+    return rows
+
+
+def vipReachability(vipDeck:Deck, resourceDeck:Deck) -> list[dict]:
+    """Whether the resource card pool produces enough of every color for each VIP card, and by how much it misses"""
+    vipCosts = deckColumns(vipDeck)['costs']
+    produces = deckColumns(resourceDeck)['produces']
+    pool = np.bincount(produces, minlength=len(COST_ORDER))
+
+    shortfall = np.maximum(vipCosts - pool, 0)
+    reachable = ~shortfall.any(axis=1)
+    required = vipCosts > 0
+    # How many spare cards the tightest required color has, big numbers mean an easy VIP
+    slack = np.where(required, pool - vipCosts, np.iinfo(np.int64).max).min(axis=1)
+
+    rows = list()
+    for i in range(len(vipCosts)):
+        rows.append({
+            'vip': i,
+            'victoryPoints': int(vipDeck.victoryPoints[i]),
+            'cardsRequired': int(vipCosts[i].sum()),
+            'reachable': bool(reachable[i]),
+            'slack': int(slack[i]) if required[i].any() else None,
+            'shortfallByColor': {name: int(count) for name, count in zip(COLOR_NAMES, shortfall[i]) if count},
+        })
+    return rows
+
+
+def analyzeDecks(resourceCards, vipCards=None) -> dict:
+    resourceDeck = asDeck(resourceCards, ResourceCard)
+    columns = deckColumns(resourceDeck)
+    report = {
+        'resourceCards': len(resourceDeck),
+        'poolByColor': {name: int(count) for name, count in zip(COLOR_NAMES, np.bincount(columns['produces'], minlength=len(COST_ORDER)))},
+        'levels': resourceCardStats(resourceDeck),
+    }
+    if vipCards is not None:
+        vipDeck = asDeck(vipCards, VIPCard)
+        report['vipCards'] = len(vipDeck)
+        report['vipReachability'] = vipReachability(vipDeck, resourceDeck)
+    return report
+
+
+def formatTable(rows:list[dict], columns:list[str]) -> str:
+    """Plain text table of the chosen columns, nested dicts are flattened to 'key:value' lists"""
+    def cell(value):
+        if isinstance(value, dict):
+            return " ".join(f"{key}:{count}" for key, count in value.items())
+        if isinstance(value, float):
+            return f"{value:.3f}"
+        return str(value)
+
+    cells = [[cell(row[column]) for column in columns] for row in rows]
+    widths = [max([len(column)] + [len(rowCells[i]) for rowCells in cells]) for i, column in enumerate(columns)]
+    lines = ["  ".join(column.ljust(width) for column, width in zip(columns, widths))]
+    for rowCells in cells:
+        lines.append("  ".join(value.ljust(width) for value, width in zip(rowCells, widths)))
+    return "\n".join(lines)
+
+
+def formatReport(report:dict) -> str:
+    sections = [
+        f"Resource cards: {report['resourceCards']}  pool: " + " ".join(f"{name}:{count}" for name, count in report['poolByColor'].items()),
+        formatTable(report['levels'], ['level', 'cards', 'totalCost', 'meanCost', 'meanVpPerGem', 'totalVictoryPoints']),
+        formatTable(report['levels'], ['level', 'costByColor']),
+        formatTable(report['levels'], ['level', 'producesByColor']),
+    ]
+    if 'vipReachability' in report:
+        sections.append(formatTable(report['vipReachability'], ['vip', 'victoryPoints', 'cardsRequired', 'reachable', 'slack', 'shortfallByColor']))
+    return "\n\n".join(sections)
+
+
+def loadCards(csvFile:Path, schema) -> list:
+    """loadDeck, logging the rows it couldn't parse like a build does. Those rows are left out of the report."""
+    cards, errors = loadDeck(csvFile, schema)
+    if len(errors) > 0:
+        logging.error(f"{len(errors)} bad rows in {csvFile}, left out of the report: {errors}")
+    return cards
+
+
+def writeReport(report:dict, outputPath:Path):
+    with open(outputPath, 'w') as f:
+        json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Balance statistics for Splendid deck CSVs")
+    parser.add_argument("resourceCardsCSV", type=Path)
+    parser.add_argument("vipCardsCSV", type=Path, nargs='?')
+    parser.add_argument("--json", type=Path, help="also write the report as JSON")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    resourceCards = loadCards(args.resourceCardsCSV, RESOURCE_CARD_SCHEMA)
+    vipCards = None
+    if args.vipCardsCSV is not None:
+        vipCards = loadCards(args.vipCardsCSV, VIP_CARD_SCHEMA)
+
+    report = analyzeDecks(resourceCards, vipCards)
+    print(formatReport(report))
+    if args.json is not None:
+        writeReport(report, args.json)
@@ -0,0 +1,244 @@
+import os
+import csv
+import time
+import struct
+import hashlib
+import threading
+from pathlib import Path
+
+from splendid import ResourceType, ResourceCard, VIPCard
+
+conversionColorToResourceType = {
+    'Black': ResourceType.Air,
+    'White': ResourceType.WhiteLotus,
+    'Blue': ResourceType.Water,
+    'Green':ResourceType.Earth,
+    'Red':ResourceType.Fire,
+    'Gold':ResourceType.Avatar
+}
+
+# no card requires gold
+requirementColumns = [(color, resourceType) for color, resourceType in conversionColorToResourceType.items() if resourceType != ResourceType.Avatar]
+
+
+class BadCSVRow(ValueError):
+    def __init__(self, csvRowNumber, rowContents, error):
+        super().__init__(f"Bad CSV Row. Row no.{csvRowNumber}, {error}: row contents {rowContents}")
+
+        self.rowNumber = csvRowNumber
+        self.previousError = error
+        self.rowContents = rowContents
+
+
+class CardSchema(object):
+    """How the columns of one kind of card CSV map onto the card's constructor.
+
+    fields are (keyword argument, column name, parse function). Requirement columns are shared by every schema.
+    """
+
+    def __init__(self, name:str, cardType, fields:list[tuple[str, str, object]]) -> None:
+        self.name = name
+        self.cardType = cardType
+        self.fields = fields
+
+    def compile(self, header:list[str]):
+        """Resolves every column against the CSV header once, returning a function that turns a row into a card"""
+        columnIndex = {column: index for index, column in enumerate(header)}
+
+        def index(column):
+            # Missing columns fail each row, exactly like a DictReader lookup would
+            return columnIndex.get(column, column)
+
+        fields = [(argument, index(column), parse) for argument, column, parse in self.fields]
+        requirements = [(index(color), resourceType) for color, resourceType in requirementColumns]
+        cardType = self.cardType
+
+        def parseRow(row:list[str]):
+            arguments = dict()
+            for argument, column, parse in fields:
+                if isinstance(column, str):
+                    raise KeyError(column)
+                arguments[argument] = parse(row[column])
+
+            requires = dict()
+            for column, resourceType in requirements:
+                if isinstance(column, str):
+                    raise KeyError(column)
+                if row[column] != '':
+                    requires[resourceType] = int(row[column])
+            return cardType(requires=requires, **arguments)
+
+        return parseRow
+
+    def toRecord(self, card) -> tuple[int, ...]:
+        produces = card.produces.value if isinstance(card, ResourceCard) else 0
+        level = card.level if isinstance(card, ResourceCard) else 0
+        # -1 marks a blank column, which is not the same as an explicit 0
+        costs = tuple(card.requires.get(resourceType, -1) for _, resourceType in requirementColumns)
+        return (level, card.victoryPoints, produces) + costs
+
+    def fromRecord(self, record:tuple[int, ...]):
+        level, victoryPoints, produces = record[:3]
+        requires = dict()
+        for (_, resourceType), count in zip(requirementColumns, record[3:]):
+            if count != -1:
+                requires[resourceType] = count
+
+        if self.cardType is ResourceCard:
+            return ResourceCard(produces=ResourceType(produces), requires=requires, level=level, victoryPoints=victoryPoints)
+        return VIPCard(requires=requires, victoryPoints=victoryPoints)
+
+
+RESOURCE_CARD_SCHEMA = CardSchema('resource', ResourceCard, [
+    ('level', 'Card Level', int),
+    ('victoryPoints', 'VP', int),
+    ('produces', 'Generates', conversionColorToResourceType.__getitem__),
+])
+
+VIP_CARD_SCHEMA = CardSchema('vip', VIPCard, [
+    ('victoryPoints', 'Victor Points', int),
+])
+
+
+class DeckReader(object):
+    """Yields the cards of a CSV deck while it is being parsed.
+
+    Rows that can't be parsed are skipped and collected in errors as BadCSVRow.
+    """
+
+    def __init__(self, csvFile:Path, schema:CardSchema) -> None:
+        self.csvFile = csvFile
+        self.schema = schema
+        self.errors = list()
+
+    def __iter__(self):
+        with open(self.csvFile, newline='\n') as csvfile:
+            reader = csv.reader(csvfile, delimiter=',', quotechar="'")
+            header = next(reader, None)
+            if header is None:
+                return
+            parseRow = self.schema.compile(header)
+
+            rowCount = 1
+            for row in reader:
+                # DictReader skips blank lines without counting them
+                if not row:
+                    continue
+                try:
+                    yield parseRow(row)
+                except (KeyError, ValueError, IndexError) as e:
+                    customError = BadCSVRow(rowCount, f"{dict(zip(header, row))}", e)
+                    self.errors.append(customError)
+                rowCount+=1
+
+
+DECK_CACHE_MAGIC = b'SPDK'
+DECK_CACHE_VERSION = 2
+# magic, version, card count, sha256 of the CSV it was built from, the CSV's size and mtime at the time, and when it was cached
+DECK_CACHE_HEADER = struct.Struct('<4sHI32sQqq')
+# level, victory points, produces, then one cost per requirement column
+DECK_CACHE_RECORD = struct.Struct(f'<3b{len(requirementColumns)}b')
+# Coarsest mtime resolution allowed for, some filesystems only keep seconds or even two seconds
+MTIME_GRANULARITY_NS = 2_000_000_000
+
+
+class DeckCache(object):
+    """Packed binary copies of parsed decks, so unchanged CSVs don't have to be parsed again.
+
+    Only decks without bad rows are cached, so errors are always reported from the CSV itself.
+    A CSV whose size and mtime are what they were when it was cached isn't read at all. One that was touched,
+    or was edited too close to being cached for its mtime to tell, is hashed instead.
+    """
+
+    def __init__(self, cacheFolder:Path) -> None:
+        self.cacheFolder = Path(cacheFolder)
+        self.cacheFolder.mkdir(parents=True, exist_ok=True)
+
+    def _cachePath(self, csvFile:Path, schema:CardSchema) -> Path:
+        # Keyed on the whole path, so same named CSVs from different asset folders each keep their own cache
+        pathDigest = hashlib.sha256(str(Path(csvFile).resolve()).encode()).hexdigest()[:16]
+        return self.cacheFolder / f"{Path(csvFile).stem}.{pathDigest}.{schema.name}.deck"
+
+    @staticmethod
+    def _digest(csvFile:Path) -> bytes:
+        return hashlib.sha256(Path(csvFile).read_bytes()).digest()
+
+    @staticmethod
+    def _stat(csvFile:Path) -> tuple[int, int]:
+        stat = Path(csvFile).stat()
+        return stat.st_size, stat.st_mtime_ns
+
+    def load(self, csvFile:Path, schema:CardSchema) -> list:
+        """Returns the cached cards, or None if there is no cache for the CSV as it is now"""
+        cachePath = self._cachePath(csvFile, schema)
+        if not cachePath.is_file():
+            return None
+
+        data = cachePath.read_bytes()
+        if len(data) < DECK_CACHE_HEADER.size:
+            return None
+        magic, version, count, digest, size, modified, cachedAt = DECK_CACHE_HEADER.unpack_from(data)
+        if magic != DECK_CACHE_MAGIC or version != DECK_CACHE_VERSION:
+            return None
+        if len(data) != DECK_CACHE_HEADER.size + count*DECK_CACHE_RECORD.size:
+            return None
+
+        records = memoryview(data)[DECK_CACHE_HEADER.size:]
+        csvStat = self._stat(csvFile)
+        # An edit in the same mtime tick as the cached version would keep its mtime, so a fresh mtime proves nothing
+        if csvStat != (size, modified) or modified >= cachedAt - MTIME_GRANULARITY_NS:
+            if digest != self._digest(csvFile):
+                return None
+            # Written again with the stat as it is now, so later loads can go by it
+            self._write(cachePath, count, digest, csvStat, records)
+
+        return [schema.fromRecord(record) for record in DECK_CACHE_RECORD.iter_unpack(records)]
+
+    def save(self, csvFile:Path, schema:CardSchema, cards:list):
+        try:
+            records = b''.join(DECK_CACHE_RECORD.pack(*schema.toRecord(card)) for card in cards)
+        except struct.error:
+            # A value too big for the packed format, this deck just doesn't get cached
+            return
+        # Stat taken before hashing, so an edit made in between is caught by the hash next time rather than missed
+        csvStat = self._stat(csvFile)
+        self._write(self._cachePath(csvFile, schema), len(cards), self._digest(csvFile), csvStat, records)
+
+    @staticmethod
+    def _write(cachePath:Path, count:int, digest:bytes, csvStat:tuple[int, int], records):
+        header = DECK_CACHE_HEADER.pack(DECK_CACHE_MAGIC, DECK_CACHE_VERSION, count, digest, *csvStat, time.time_ns())
+        # Written aside and moved into place, jobs building the same deck at once never see each other's half written file
+        temporaryPath = cachePath.with_suffix(f".{os.getpid()}.{threading.get_ident()}.tmp")
+        temporaryPath.write_bytes(header + records)
+        os.replace(temporaryPath, cachePath)
+
+
+def loadDeck(csvFile:Path, schema:CardSchema, deckCache:DeckCache=None) -> tuple[list, list[Exception]]:
+    cards, errors = streamDeck(csvFile, schema, deckCache)
+    return list(cards), errors
+
+
+def streamDeck(csvFile:Path, schema:CardSchema, deckCache:DeckCache=None):
+    """loadDeck for a build that gets going on the first cards while the rest of the CSV is still being parsed.
+
+    The cards come back as an iterable, and the errors as the list bad rows are added to as they're reached, so
+    it's only complete once every card has been taken. A deck the cache has comes back as a list.
+    """
+    if deckCache is not None:
+        cards = deckCache.load(csvFile, schema)
+        if cards is not None:
+            return cards, []
+
+    reader = DeckReader(csvFile, schema)
+    if deckCache is None:
+        return reader, reader.errors
+    return _cachedAsRead(reader, deckCache), reader.errors
+
+
+def _cachedAsRead(reader:DeckReader, deckCache:DeckCache):
+    cards = list()
+    for card in reader:
+        cards.append(card)
+        yield card
+    if len(reader.errors) == 0:
+        deckCache.save(reader.csvFile, reader.schema, cards)
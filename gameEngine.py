@@ -0,0 +1,378 @@
+import random
+import logging
+import argparse
+import statistics
+from pathlib import Path
+from itertools import combinations
+from concurrent.futures import ProcessPoolExecutor
+
+from splendid import ResourceCard, VIPCard, COST_ORDER, COST_INDEX
+from deckLoader import loadDeck, RESOURCE_CARD_SCHEMA, VIP_CARD_SCHEMA
+
+
+# Token slots follow the card cost vector, with the Avatar (gold) wildcard last
+GEM_COLORS = len(COST_ORDER)
+GOLD = GEM_COLORS
+TOKEN_SLOTS = GEM_COLORS + 1
+
+WINNING_POINTS = 15
+BOARD_SLOTS = 4
+MAX_RESERVED = 3
+MAX_TOKENS = 10
+TAKE_SAME_MINIMUM = 4
+# Games where nobody can make progress are called a draw after this many rounds
+MAX_ROUNDS = 100
+
+BANK_GEMS_FOR_PLAYERS = {2: 4, 3: 5, 4: 7}
+BANK_GOLD = 5
+
+# Moves are tuples whose first entry is one of these
+TAKE_DIFFERENT, TAKE_SAME, RESERVE, RESERVE_DECK, BUY, BUY_RESERVED, PASS = range(7)
+
+
+class CardTable(object):
+    """The cards of a deck flattened into tuples, which is all a game needs and cheap to send to other processes.
+
+    cards are (level, produced color, victory points, cost), vips are (victory points, cost).
+    Costs are per gem color in COST_ORDER, with blank costs as 0.
+    """
+
+    def __init__(self, resourceCards:list[ResourceCard], vipCards:list[VIPCard]) -> None:
+        self.cards = tuple(
+            (card.level, COST_INDEX[card.produces], card.victoryPoints, tuple(max(count, 0) for count in card.costVector))
+            for card in resourceCards
+        )
+        self.vips = tuple(
+            (card.victoryPoints, tuple(max(count, 0) for count in card.costVector))
+            for card in vipCards
+        )
+        self.levels = sorted({card[0] for card in self.cards})
+
+
+class GameState(object):
+    """Everything about a game in progress, held as flat lists of ints indexing into a CardTable.
+
+    board[level][slot] is a card index or -1 once that level's deck has run dry.
+    """
+    __slots__ = ('table', 'bank', 'tokens', 'bonuses', 'points', 'reserved', 'cardsBought',
+                 'decks', 'board', 'vips', 'currentPlayer', 'round', 'finalRound')
+
+    def __init__(self, table:CardTable, players:int, rng:random.Random) -> None:
+        if players not in BANK_GEMS_FOR_PLAYERS:
+            raise ValueError(f"Games need 2 to 4 players, not {players}")
+
+        self.table = table
+        self.bank = [BANK_GEMS_FOR_PLAYERS[players]]*GEM_COLORS + [BANK_GOLD]
+        self.tokens = [[0]*TOKEN_SLOTS for _ in range(players)]
+        self.bonuses = [[0]*GEM_COLORS for _ in range(players)]
+        self.points = [0]*players
+        self.reserved = [list() for _ in range(players)]
+        self.cardsBought = [0]*players
+
+        self.decks = list()
+        self.board = list()
+        for level in table.levels:
+            deck = [index for index, card in enumerate(table.cards) if card[0] == level]
+            rng.shuffle(deck)
+            self.board.append([deck.pop() if deck else -1 for _ in range(BOARD_SLOTS)])
+            self.decks.append(deck)
+
+        vips = list(range(len(table.vips)))
+        rng.shuffle(vips)
+        self.vips = vips[:players+1]
+
+        self.currentPlayer = 0
+        self.round = 0
+        self.finalRound = False
+
+    @property
+    def players(self) -> int:
+        return len(self.points)
+
+    def isOver(self) -> bool:
+        return (self.finalRound and self.currentPlayer == 0) or self.round >= MAX_ROUNDS
+
+    def winner(self):
+        """Seat of the winner, most points then fewest cards bought, or None for a draw"""
+        if self.round >= MAX_ROUNDS and not self.finalRound:
+            return None
+        best = max(range(self.players), key=lambda seat: (self.points[seat], -self.cardsBought[seat]))
+        tied = [seat for seat in range(self.players) if self.points[seat] == self.points[best] and self.cardsBought[seat] == self.cardsBought[best]]
+        return best if len(tied) == 1 else None
+
+
+def goldNeeded(state:GameState, player:int, cost:tuple) -> int:
+    """How many gold tokens player would have to spend on cost, more than they hold means they can't afford it"""
+    tokens = state.tokens[player]
+    bonuses = state.bonuses[player]
+    short = 0
+    for color in range(GEM_COLORS):
+        missing = cost[color] - bonuses[color] - tokens[color]
+        if missing > 0:
+            short += missing
+    return short
+
+
+def canAfford(state:GameState, player:int, cost:tuple) -> bool:
+    return goldNeeded(state, player, cost) <= state.tokens[player][GOLD]
+
+
+def legalMoves(state:GameState) -> list[tuple]:
+    player = state.currentPlayer
+    tokens = state.tokens[player]
+    bank = state.bank
+    cards = state.table.cards
+    heldTokens = sum(tokens)
+    moves = list()
+
+    for levelIndex, slots in enumerate(state.board):
+        for slot, card in enumerate(slots):
+            if card != -1 and canAfford(state, player, cards[card][3]):
+                moves.append((BUY, levelIndex, slot))
+    for reservedIndex, card in enumerate(state.reserved[player]):
+        if canAfford(state, player, cards[card][3]):
+            moves.append((BUY_RESERVED, reservedIndex))
+
+    # Token takes are limited so a player never goes over MAX_TOKENS, rather than having to hand tokens back
+    room = MAX_TOKENS - heldTokens
+    available = [color for color in range(GEM_COLORS) if bank[color] > 0]
+    takeCount = min(3, len(available), room)
+    if takeCount > 0:
+        for colors in combinations(available, takeCount):
+            moves.append((TAKE_DIFFERENT, colors))
+    if room >= 2:
+        for color in range(GEM_COLORS):
+            if bank[color] >= TAKE_SAME_MINIMUM:
+                moves.append((TAKE_SAME, color))
+
+    if len(state.reserved[player]) < MAX_RESERVED:
+        for levelIndex, slots in enumerate(state.board):
+            for slot, card in enumerate(slots):
+                if card != -1:
+                    moves.append((RESERVE, levelIndex, slot))
+            if state.decks[levelIndex]:
+                moves.append((RESERVE_DECK, levelIndex))
+
+    if not moves:
+        moves.append((PASS,))
+    return moves
+
+
+def _payFor(state:GameState, player:int, card:int):
+    level, color, victoryPoints, cost = state.table.cards[card]
+    tokens = state.tokens[player]
+    bonuses = state.bonuses[player]
+    for gem in range(GEM_COLORS):
+        owed = cost[gem] - bonuses[gem]
+        if owed <= 0:
+            continue
+        paid = min(owed, tokens[gem])
+        tokens[gem] -= paid
+        state.bank[gem] += paid
+        gold = owed - paid
+        tokens[GOLD] -= gold
+        state.bank[GOLD] += gold
+
+    bonuses[color] += 1
+    state.points[player] += victoryPoints
+    state.cardsBought[player] += 1
+
+
+def _takeFromBoard(state:GameState, levelIndex:int, slot:int) -> int:
+    card = state.board[levelIndex][slot]
+    deck = state.decks[levelIndex]
+    state.board[levelIndex][slot] = deck.pop() if deck else -1
+    return card
+
+
+def _gainReserveGold(state:GameState, player:int):
+    if state.bank[GOLD] > 0 and sum(state.tokens[player]) < MAX_TOKENS:
+        state.bank[GOLD] -= 1
+        state.tokens[player][GOLD] += 1
+
+
+def _visitVip(state:GameState, player:int):
+    bonuses = state.bonuses[player]
+    for vip in state.vips:
+        victoryPoints, cost = state.table.vips[vip]
+        if all(bonuses[color] >= cost[color] for color in range(GEM_COLORS)):
+            state.points[player] += victoryPoints
+            state.vips.remove(vip)
+            # Only one VIP visits per turn
+            return
+
+
+def applyMove(state:GameState, move:tuple):
+    player = state.currentPlayer
+    kind = move[0]
+
+    if kind == TAKE_DIFFERENT:
+        for color in move[1]:
+            state.bank[color] -= 1
+            state.tokens[player][color] += 1
+    elif kind == TAKE_SAME:
+        state.bank[move[1]] -= 2
+        state.tokens[player][move[1]] += 2
+    elif kind == RESERVE:
+        state.reserved[player].append(_takeFromBoard(state, move[1], move[2]))
+        _gainReserveGold(state, player)
+    elif kind == RESERVE_DECK:
+        state.reserved[player].append(state.decks[move[1]].pop())
+        _gainReserveGold(state, player)
+    elif kind == BUY:
+        _payFor(state, player, _takeFromBoard(state, move[1], move[2]))
+    elif kind == BUY_RESERVED:
+        _payFor(state, player, state.reserved[player].pop(move[1]))
+
+    _visitVip(state, player)
+    if state.points[player] >= WINNING_POINTS:
+        state.finalRound = True
+
+    state.currentPlayer = (player + 1) % state.players
+    if state.currentPlayer == 0:
+        state.round += 1
+
+
+def randomPolicy(state:GameState, moves:list[tuple], rng:random.Random) -> tuple:
+    return rng.choice(moves)
+
+
+def _moveCard(state:GameState, move:tuple) -> int:
+    if move[0] == BUY:
+        return state.board[move[1]][move[2]]
+    return state.reserved[state.currentPlayer][move[1]]
+
+
+def greedyPolicy(state:GameState, moves:list[tuple], rng:random.Random) -> tuple:
+    """Buys the most valuable card it can, otherwise collects the gems for the closest card on the board"""
+    cards = state.table.cards
+    player = state.currentPlayer
+
+    buys = [move for move in moves if move[0] in (BUY, BUY_RESERVED)]
+    if buys:
+        return max(buys, key=lambda move: (cards[_moveCard(state, move)][2], -sum(cards[_moveCard(state, move)][3]), rng.random()))
+
+    targets = [card for slots in state.board for card in slots if card != -1] + state.reserved[player]
+    if targets:
+        target = min(targets, key=lambda card: (goldNeeded(state, player, cards[card][3]) - cards[card][2], rng.random()))
+        cost = cards[target][3]
+        tokens = state.tokens[player]
+        bonuses = state.bonuses[player]
+        missing = [max(cost[color] - bonuses[color] - tokens[color], 0) for color in range(GEM_COLORS)]
+
+        def usefulness(move):
+            if move[0] == TAKE_DIFFERENT:
+                return sum(1 for color in move[1] if missing[color] > 0)
+            if move[0] == TAKE_SAME:
+                return min(missing[move[1]], 2)
+            return 0
+
+        takes = [move for move in moves if move[0] in (TAKE_DIFFERENT, TAKE_SAME)]
+        if takes:
+            best = max(takes, key=lambda move: (usefulness(move), rng.random()))
+            if usefulness(best) > 0:
+                return best
+
+    reserves = [move for move in moves if move[0] == RESERVE]
+    if reserves:
+        return max(reserves, key=lambda move: (cards[state.board[move[1]][move[2]]][2], rng.random()))
+    return rng.choice(moves)
+
+
+POLICIES = {
+    'random': randomPolicy,
+    'greedy': greedyPolicy,
+}
+
+
+def playGame(table:CardTable, policies:list, rng:random.Random) -> tuple:
+    """Plays one game, returning (winning seat or None, rounds played, final points)"""
+    state = GameState(table, len(policies), rng)
+    while not state.isOver():
+        moves = legalMoves(state)
+        applyMove(state, policies[state.currentPlayer](state, moves, rng))
+    return state.winner(), state.round, list(state.points)
+
+
+def _playGames(job) -> list[tuple]:
+    table, policyNames, firstGame, games, seed = job
+    rng = random.Random(seed)
+    results = list()
+    for game in range(firstGame, firstGame + games):
+        # Seats rotate every game so no policy always moves first
+        shift = game % len(policyNames)
+        seated = policyNames[shift:] + policyNames[:shift]
+        winner, rounds, _ = playGame(table, [POLICIES[name] for name in seated], rng)
+        results.append((None if winner is None else seated[winner], rounds))
+    return results
+
+
+def simulate(resourceCards:list[ResourceCard], vipCards:list[VIPCard], games:int, policyNames:list[str], workers:int=1, seed:int=0, chunkSize:int=500) -> dict:
+    """Self-plays games of a deck across a process pool and reports win rates per policy and game lengths.
+
+    policyNames gives the policy for each seat. Seats sharing a policy share its win rate.
+    """
+    if games < 1:
+        raise ValueError(f"Need at least 1 game to report on, not {games}")
+    for name in policyNames:
+        if name not in POLICIES:
+            raise ValueError(f"Unknown policy {name}, choose from {', '.join(POLICIES)}")
+
+    table = CardTable(resourceCards, vipCards)
+    jobs = [(table, list(policyNames), first, min(chunkSize, games-first), seed + first) for first in range(0, games, chunkSize)]
+
+    workers = workers if workers > 0 else None
+    if workers == 1 or len(jobs) <= 1:
+        chunks = map(_playGames, jobs)
+        results = [result for chunk in chunks for result in chunk]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            results = [result for chunk in executor.map(_playGames, jobs) for result in chunk]
+
+    wins = {name: 0 for name in policyNames}
+    draws = 0
+    for winner, _ in results:
+        if winner is None:
+            draws += 1
+        else:
+            wins[winner] += 1
+    lengths = [rounds for _, rounds in results]
+
+    return {
+        'games': games,
+        'players': len(policyNames),
+        'winRates': {name: wins[name] / games for name in wins},
+        'drawRate': draws / games,
+        'rounds': {
+            'mean': statistics.fmean(lengths),
+            'median': statistics.median(lengths),
+            'min': min(lengths),
+            'max': max(lengths),
+        },
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Self-play a Splendid deck to playtest it")
+    parser.add_argument("resourceCardsCSV", type=Path)
+    parser.add_argument("vipCardsCSV", type=Path)
+    parser.add_argument("--games", type=int, default=1000)
+    parser.add_argument("--policies", default="greedy,greedy", help="comma separated policy per seat: " + ", ".join(POLICIES))
+    parser.add_argument("--workers", type=int, default=0, help="number of processes, 0 uses every core")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    if args.games < 1:
+        parser.error("--games must be at least 1")
+
+    logging.basicConfig(level=logging.INFO)
+    resourceCards, errors = loadDeck(args.resourceCardsCSV, RESOURCE_CARD_SCHEMA)
+    vipCards, vipErrors = loadDeck(args.vipCardsCSV, VIP_CARD_SCHEMA)
+    for error in errors + vipErrors:
+        logging.error(error)
+
+    report = simulate(resourceCards, vipCards, args.games, args.policies.split(","), workers=args.workers, seed=args.seed)
+    logging.info(f"{report['games']} games, {report['players']} players")
+    for name, rate in report['winRates'].items():
+        logging.info(f"{name}: {rate:.1%} wins")
+    logging.info(f"draws: {report['drawRate']:.1%}")
+    logging.info(f"rounds: {report['rounds']}")
@@ -1,9 +1,13 @@
 import logging
+import threading
+from collections import OrderedDict
 from splendid import ResourceCard, ResourceType, VIPCard, ResourceToken
 
 from PIL import Image, ImageOps, ImageFont,  ImageDraw 
 from pathlib import Path
 
+from instrumentation import getTracer
+
 
 PLAYING_CARD_SIZE_IN = (2.5, 3.7)
 
@@ -17,9 +21,15 @@ BORDER_SIZE = 10
 
 TOKEN_DIAMETER_IN = 1.5
 
+# Bump whenever a change to this file alters the pixels of a rendered card, so cached renders get invalidated
+RENDERER_VERSION = 1
+
 # IMG_BORDER_CROP_SYMMETRICAL = 396
 IMG_BORDER_CROP_SYMMETRICAL = 400
 
+# PNG text chunk set on art that has already been cropped (see proxyStore), so it isn't cropped a second time
+PRECROPPED_INFO_KEY = "splendid-precropped"
+
 # Delicate colors background 
 # resourceTypeToPILColor = {
 #     ResourceType.Air: (249,239,210), 
@@ -53,12 +63,18 @@ class SplendidSharedAssetts(object):
     def __init__(self) -> None:
         self.resouceTypeToImage = dict()
         self.levelIcon = None
+        # Where every shared image came from, so caches can tell when one of them changes
+        self.sourcePaths = dict()
+        # (produces, card size) -> resource card overlay, see getResourceCardOverlay
+        self.resourceCardOverlays = dict()
 
     def loadResourceTypeImage(self, resourceType:ResourceType, imagePath:Path):
-        img = Image.open(imagePath)
-        image_produces = img.resize(size=self.producesSize)
-        image_requires = img.resize(size=self.requiresSize)
+        self.sourcePaths[resourceType.name] = imagePath
+        with Image.open(imagePath) as img:
+            image_produces = img.resize(size=self.producesSize)
+            image_requires = img.resize(size=self.requiresSize)
         self.resouceTypeToImage[resourceType] = (image_produces, image_requires)
+        self.resourceCardOverlays = {key: overlay for key, overlay in self.resourceCardOverlays.items() if key[0] != resourceType}
 
     def getProducesImage(self, resourceType:ResourceType):
         return self.resouceTypeToImage[resourceType][0]
@@ -66,31 +82,83 @@ class SplendidSharedAssetts(object):
     def getRequiresImage(self, resourceType:ResourceType):
         return self.resouceTypeToImage[resourceType][1]
     
+    def getResourceCardOverlay(self, resourceType:ResourceType, size:tuple[int,int]):
+        """Built once per (resourceType, size), see ResourceCardOverlay"""
+        key = (resourceType, size)
+        if key not in self.resourceCardOverlays:
+            self.resourceCardOverlays[key] = ResourceCardOverlay(size, resourceTypeToPILColor[resourceType], self.getProducesImage(resourceType))
+        return self.resourceCardOverlays[key]
+
     def loadLevelIcon(self, imagePath):
-        img = Image.open(imagePath)
-        self.levelIcon = img.resize(size=self.levelIconSize)
+        self.sourcePaths["levelIcon"] = imagePath
+        with Image.open(imagePath) as img:
+            self.levelIcon = img.resize(size=self.levelIconSize)
         
+# (fontname, fontsize) -> font, so each font file is only read from disk once per process
+_fontRegistry = dict()
+
 # def getFont(fontname='arial.ttf', fontsize=50):
 def getFont(fontname='Herculanum.ttf', fontsize=50):
-    try:
-        return ImageFont.truetype(fontname, fontsize)
-    except OSError:
-        logging.debug(f"could not find font {fontname}. Loading default instead")
-        return ImageFont.load_default(size=fontsize)
+    key = (fontname, fontsize)
+    if key not in _fontRegistry:
+        try:
+            _fontRegistry[key] = ImageFont.truetype(fontname, fontsize)
+        except OSError:
+            logging.debug(f"could not find font {fontname}. Loading default instead")
+            _fontRegistry[key] = ImageFont.load_default(size=fontsize)
+
+    return _fontRegistry[key]
+
 
-    return 
+NUMBER_FILL = 'white'
+NUMBER_STROKE_FILL = 'black'
+NUMBER_STROKE_WIDTH = 2
 
-def addNumber(draw:ImageDraw, number:int, centeredAt:tuple[int,int], font):
+# (font, text) -> rasterized number, see getNumberSprite
+_numberSprites = dict()
+
+def getNumberSprite(text:str, font):
+    """Rasterizes a stroked number once, returning (size, strokeMask, fillMask, offset).
+
+    Drawing the stroke colour through strokeMask and then the fill colour through fillMask is the same
+    two pass draw that ImageDraw.text does, so the pixels match drawing the text directly.
+    offset is where the masks sit relative to the point the text would have been drawn at.
+    """
+    key = (font, text)
+    if key not in _numberSprites:
+        _, _, w, h = font.getbbox(text)
+        left, top, right, bottom = font.getbbox(text, stroke_width=NUMBER_STROKE_WIDTH)
+        origin = (-left, -top)
+
+        strokeMask = Image.new("L", (right-left, bottom-top), 0)
+        ImageDraw.Draw(strokeMask).text(origin, text, fill=255, font=font, stroke_width=NUMBER_STROKE_WIDTH, stroke_fill=255)
+        fillMask = Image.new("L", strokeMask.size, 0)
+        ImageDraw.Draw(fillMask).text(origin, text, fill=255, font=font)
+
+        _numberSprites[key] = ((w, h), strokeMask, fillMask, (left, top))
+
+    return _numberSprites[key]
+
+def addNumber(image:Image, number:int, centeredAt:tuple[int,int], font):
 
     centerX, centerY = centeredAt
     text = str(number)
-    _, _, w, h = draw.textbbox(xy= (0, 0), text=text, font=font)
+    (w, h), strokeMask, fillMask, (offsetX, offsetY) = getNumberSprite(text, font)
 
     
     loc = (centerX-(w//2), centerY-(h//2))
     if loc[0] < 0 or loc[1] < 0:
         raise ValueError("Center at postion is smaller than the width of the number")
-    draw.text(loc,text,fill='white', font=font, stroke_width=2, stroke_fill='black')
+    draw = ImageDraw.Draw(image)
+    if draw.fontmode != "L":
+        # Palette and bilevel art get aliased text, which the sprites aren't, so it's drawn as it always was
+        draw.text(loc, text, fill=NUMBER_FILL, font=font, stroke_width=NUMBER_STROKE_WIDTH, stroke_fill=NUMBER_STROKE_FILL)
+        return
+
+    # draw.bitmap is what draw.text draws each pass with, so the colours are resolved for the art's mode the same way
+    box = (loc[0]+offsetX, loc[1]+offsetY)
+    draw.bitmap(box, strokeMask, fill=NUMBER_STROKE_FILL)
+    draw.bitmap(box, fillMask, fill=NUMBER_FILL)
 
 
 def addCardLevel(image, number:int, centeredAt:tuple[int,int], icon:Image, alignmentHorizontal=True):
@@ -108,30 +176,70 @@ def addCardLevel(image, number:int, centeredAt:tuple[int,int], icon:Image, align
 
 
 
+def saveCardImage(image:Image, output_path:Path):
+    """Writes a rendered image to disk. A None path means the caller only wants the image in memory"""
+    if output_path is not None:
+        with getTracer().stage("png encode"):
+            image.save(output_path, dpi=(OUTPUT_DPI,OUTPUT_DPI))
+
+
 def processToken(token:ResourceToken, output_path:Path):
-    img = Image.open(token.imagePath)
     pixels = int(TOKEN_DIAMETER_IN*OUTPUT_DPI)
-    tokenImg = img.resize(size=(pixels,pixels))
-    tokenImg.save(output_path, dpi=(OUTPUT_DPI,OUTPUT_DPI))
+    with Image.open(token.imagePath) as img:
+        tokenImg = img.resize(size=(pixels,pixels))
+    saveCardImage(tokenImg, output_path)
+    return tokenImg
+
+# Sets of backs kept at once. A build uses one of each kind, this leaves room for the old ones
+# a long running watcher or preview server leaves behind when a back is edited
+MAX_CARD_BACK_SETS = 4
+# (kind, source path, size, mtime, level icon id) -> (level icon, generated backs), least recently used first, see _cardBacks
+_cardBackRegistry = OrderedDict()
+# Render threads share the registry, and a set of backs is only worth building once
+_cardBackLock = threading.Lock()
+
+def _cardBacks(kind:str, imagePath:Path, iconImg:Image, generate) -> list:
+    """The backs generate() builds from imagePath, built once per process for as long as the file is unchanged.
+
+    The level icon is held on to with the backs so that its id() can't be recycled while it's part of a key.
+    Only the MAX_CARD_BACK_SETS most recently used sets are kept.
+    """
+    stat = Path(imagePath).stat()
+    key = (kind, str(imagePath), stat.st_size, stat.st_mtime_ns, id(iconImg))
+    with _cardBackLock:
+        if key not in _cardBackRegistry:
+            _cardBackRegistry[key] = (iconImg, generate())
+            while len(_cardBackRegistry) > MAX_CARD_BACK_SETS:
+                _cardBackRegistry.popitem(last=False)
+        _cardBackRegistry.move_to_end(key)
+        return _cardBackRegistry[key][1]
+
 
 def generateVIPCardBack(outputFolder:Path, imagePath:Path):
-    img = Image.open(imagePath)
-    card_size = VIP_CARD_SIZE_IN
-    output_size = tuple(x*OUTPUT_DPI for x in card_size)
-    border_color = "Black"
-    cardImage = shrink_image(img, output_size, border_color)
-    cardImage = cardImage.transpose(Image.ROTATE_180)
+    """Returns the path of the generated back, or the image itself when outputFolder is None"""
+    def generate():
+        card_size = VIP_CARD_SIZE_IN
+        output_size = tuple(x*OUTPUT_DPI for x in card_size)
+        border_color = "Black"
+        with Image.open(imagePath) as img:
+            cardImage = shrink_image(img, output_size, border_color)
+        return [cardImage.transpose(Image.ROTATE_180)]
+
+    cardImage, = _cardBacks("vip", imagePath, None, generate)
+    if outputFolder is None:
+        return cardImage
     output_path = outputFolder / "VIPCardBack.png"
-    cardImage.save(output_path, dpi=(OUTPUT_DPI,OUTPUT_DPI))
+    saveCardImage(cardImage, output_path)
     return output_path
 
 
 def processVIPCard(vipCard:VIPCard, output_path:Path, sharedImages:SplendidSharedAssetts):
-    img = Image.open(vipCard.imagePath)
     card_size = VIP_CARD_SIZE_IN
     output_size = tuple(x*OUTPUT_DPI for x in card_size)
     border_color = "Black"
-    new_image = shrink_image(img, output_size, "White")
+    # Closed as soon as it's been shrunk, the full size art is by far the biggest image a card touches
+    with Image.open(vipCard.imagePath) as img:
+        new_image = shrink_image(img, output_size, "White")
     cardImage = add_border(new_image, border_color, border_size=1)
 
 
@@ -141,7 +249,8 @@ def processVIPCard(vipCard:VIPCard, output_path:Path, sharedImages:SplendidShare
 
     reqW,reqH = sharedImages.requiresSize
     
-    numberOfrequirements = len(vipCard.requires)
+    requires = vipCard.requires
+    numberOfrequirements = len(requires)
 
     interstitialSpaces = ((bg_w - 2*BORDER_SIZE) - (numberOfrequirements*reqW)) // numberOfrequirements
     startingXOffset = BORDER_SIZE + interstitialSpaces//2
@@ -149,7 +258,7 @@ def processVIPCard(vipCard:VIPCard, output_path:Path, sharedImages:SplendidShare
     xOffset = startingXOffset
     yOffset = (bg_h-BORDER_SIZE-reqH-5)
     for resourceType in resourceTypeOrder:
-        if vipCard.requires.get(resourceType, 0) == 0:
+        if requires.get(resourceType, 0) == 0:
             continue
 
         y = yOffset
@@ -159,75 +268,112 @@ def processVIPCard(vipCard:VIPCard, output_path:Path, sharedImages:SplendidShare
 
 
 
-    ### Everything requiring a draw object
-    draw = ImageDraw.Draw(cardImage)
-
     # Add Numbers to image
     font = getFont()
-    addNumber(draw, vipCard.victoryPoints, (25,25), font)
+    addNumber(cardImage, vipCard.victoryPoints, (25,25), font)
 
     font = getFont(fontsize=35)
     # I'm doing here a second time instead of inline with the adding of resource, because I don't know if i can do that. 
     xOffset = startingXOffset+reqW
     for resourceType in resourceTypeOrder:
-        resourceCount = vipCard.requires.get(resourceType, 0)
+        resourceCount = requires.get(resourceType, 0)
         if resourceCount == 0:
             continue
 
         y = yOffset
-        addNumber(draw, resourceCount, (xOffset,y), font)
+        addNumber(cardImage, resourceCount, (xOffset,y), font)
         xOffset+= interstitialSpaces+reqW
 
-    cardImage.save(output_path, dpi=(OUTPUT_DPI,OUTPUT_DPI))
+    saveCardImage(cardImage, output_path)
+    return cardImage
 
 
 def generateResourceCardBacks(outputFolder:Path, imagePath:Path, iconImg:Image):
-    output_size = tuple(x*OUTPUT_DPI for x in RESOURCE_CARD_SIZE_IN)
+    """Returns the paths of the level 1-3 backs, or the images themselves when outputFolder is None"""
+    def generate():
+        output_size = tuple(x*OUTPUT_DPI for x in RESOURCE_CARD_SIZE_IN)
 
-    border_color = "white"
-    cardImage = Image.open(imagePath)
-    cardImage = shrink_image(cardImage, output_size, border_color)
-    cardImage = add_border(cardImage, "black", 1)
+        border_color = "white"
+        with Image.open(imagePath) as img:
+            cardImage = shrink_image(img, output_size, border_color)
+        cardImage = add_border(cardImage, "black", 1)
 
-    bg_w, bg_h = cardImage.size
+        bg_w, bg_h = cardImage.size
+
+        backs = list()
+        for i in range(1,4):
+            backImg = cardImage.copy()
+            addCardLevel(backImg, i, (20,bg_h//2), iconImg, alignmentHorizontal=False)
+            addCardLevel(backImg, i, (bg_w-20-iconImg.size[0],bg_h//2), iconImg, alignmentHorizontal=False)
+            backs.append(backImg.transpose(Image.ROTATE_180))
+        return backs
 
     generatedBackPaths = list()
 
-    for i in range(1,4):
-        backImg = cardImage.copy()
-        addCardLevel(backImg, i, (20,bg_h//2), iconImg, alignmentHorizontal=False)
-        addCardLevel(backImg, i, (bg_w-20-iconImg.size[0],bg_h//2), iconImg, alignmentHorizontal=False)
-        backImg = backImg.transpose(Image.ROTATE_180)
+    for i, backImg in enumerate(_cardBacks("resource", imagePath, iconImg, generate), 1):
+        if outputFolder is None:
+            generatedBackPaths.append(backImg)
+            continue
         output_path = outputFolder / f"ResourceCard_Back_{i}.png"
         generatedBackPaths.append(output_path)
-        backImg.save(output_path, dpi=(OUTPUT_DPI,OUTPUT_DPI))
+        saveCardImage(backImg, output_path)
 
     return generatedBackPaths
     
 
-def processResourceCard(resourceCard:ResourceCard, output_path:Path, sharedImages:SplendidSharedAssetts):
-    img = Image.open(resourceCard.imagePath)
+class ResourceCardOverlay(object):
+    """The parts of a resource card that only depend on what it produces: the colored border with its 1px
+    black edge, and the produces icon in the corner.
+
+    Kept as opaque border strips plus the icon tile rather than one card sized transparent layer, since
+    blending every pixel of the card costs more than the crops and expands this replaces.
+    Applying it gives the same pixels as add_border twice followed by pasting the icon.
+    """
+
+    def __init__(self, size:tuple[int,int], border_color, producesImage:Image) -> None:
+        bg_w, bg_h = size
+        frame = Image.new("RGB", size, border_color)
+        ImageDraw.Draw(frame).rectangle((0, 0, bg_w-1, bg_h-1), outline="black", width=1)
+        self.borderStrips = [
+            (box[:2], frame.crop(box)) for box in (
+                (0, 0, bg_w, BORDER_SIZE),
+                (0, bg_h-BORDER_SIZE, bg_w, bg_h),
+                (0, BORDER_SIZE, BORDER_SIZE, bg_h-BORDER_SIZE),
+                (bg_w-BORDER_SIZE, BORDER_SIZE, bg_w, bg_h-BORDER_SIZE),
+            )
+        ]
+
+        pImg_w, pImg_h = producesImage.size
+        self.producesOffset = ((bg_w - pImg_w)-BORDER_SIZE, BORDER_SIZE)
+        self.producesImage = producesImage
+
+    def applyTo(self, cardImage:Image):
+        for offset, strip in self.borderStrips:
+            cardImage.paste(strip, offset)
+        cardImage.paste(self.producesImage, self.producesOffset, mask=self.producesImage)
 
+
+def processResourceCard(resourceCard:ResourceCard, output_path:Path, sharedImages:SplendidSharedAssetts):
     # create background image
     card_size = RESOURCE_CARD_SIZE_IN
     output_size = tuple(x*OUTPUT_DPI for x in card_size)
     border_color = resourceTypeToPILColor[resourceCard.produces]
-    new_image = symmetricalCrop(img, IMG_BORDER_CROP_SYMMETRICAL, 0)
-    new_image = shrink_image(new_image, output_size, border_color)
-    cardImage = add_border(new_image, border_color)
-    cardImage = add_border(cardImage, "black", 1)
-
-    # Add produces in the corner
-    producesImage = sharedImages.getProducesImage(resourceCard.produces)
-    pImg_w, pImg_h = producesImage.size
+    # Closed as soon as it's been shrunk, the full size art is by far the biggest image a card touches
+    with Image.open(resourceCard.imagePath) as img:
+        new_image = img
+        if PRECROPPED_INFO_KEY not in img.info:
+            new_image = symmetricalCrop(img, IMG_BORDER_CROP_SYMMETRICAL, 0)
+        cardImage = shrink_image(new_image, output_size, border_color)
+
+    # Borders and the produces icon in the corner
+    sharedImages.getResourceCardOverlay(resourceCard.produces, cardImage.size).applyTo(cardImage)
     bg_w, bg_h = cardImage.size
-    offset = ((bg_w - pImg_w)-BORDER_SIZE, BORDER_SIZE)
-    cardImage.paste(producesImage, offset, mask=producesImage)
 
     # Add Requirements across the bottom. 
     # Implicit order
     # WhiteLotus, Water, Earth, Fire, Air
     resourceTypeOrder = [ResourceType.WhiteLotus, ResourceType.Water, ResourceType.Earth, ResourceType.Fire, ResourceType.Air]
+    requires = resourceCard.requires
 
     reqW,reqH = sharedImages.requiresSize
     
@@ -236,7 +382,7 @@ def processResourceCard(resourceCard:ResourceCard, output_path:Path, sharedImage
     
     yOffset = (bg_h-BORDER_SIZE-reqH-5)
     for index, resourceType in enumerate(resourceTypeOrder):
-        if resourceCard.requires.get(resourceType, 0) == 0:
+        if requires.get(resourceType, 0) == 0:
             continue
 
         x = (interstitialSpaces+reqW)*index+startingXOffset
@@ -249,26 +395,24 @@ def processResourceCard(resourceCard:ResourceCard, output_path:Path, sharedImage
     # addCardLevel(cardImage, resourceCard.level, (bg_w//2,20), sharedImages.levelIcon)
 
 
-    ### Everything requiring a draw object
-    draw = ImageDraw.Draw(cardImage)
-
     # Add Numbers to image
     font = getFont()
     if resourceCard.victoryPoints != 0:
-        addNumber(draw, resourceCard.victoryPoints, (25,25), font)
+        addNumber(cardImage, resourceCard.victoryPoints, (25,25), font)
 
     font = getFont(fontsize=35)
     # I'm doing here a second time instead of inline with the adding of resource, because I don't know if i can do that. 
     for index, resourceType in enumerate(resourceTypeOrder):
-        resourceCount = resourceCard.requires.get(resourceType, 0)
+        resourceCount = requires.get(resourceType, 0)
         if resourceCount == 0:
             continue
 
         x = (interstitialSpaces+reqW)*index+startingXOffset+reqW
         y = yOffset 
-        addNumber(draw, resourceCount, (x,y), font)
+        addNumber(cardImage, resourceCount, (x,y), font)
     
-    cardImage.save(output_path, dpi=(OUTPUT_DPI,OUTPUT_DPI))
+    saveCardImage(cardImage, output_path)
+    return cardImage
 
 
 def symmetricalCrop(img, shrinkX, shrinkY):
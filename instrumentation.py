@@ -0,0 +1,192 @@
+import os
+import sys
+import json
+import time
+import threading
+from pathlib import Path
+from contextlib import contextmanager, nullcontext
+from collections import defaultdict
+
+try:
+    import resource
+except ImportError:
+    # Not available on Windows, peak RSS just isn't reported there
+    resource = None
+
+
+# Upper bounds, in milliseconds, of the per card latency histogram buckets
+LATENCY_BUCKETS_MS = [1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000]
+
+
+def peakRssBytes() -> int:
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+def latencyHistogram(latencies:list[float]) -> dict:
+    counts = [0] * (len(LATENCY_BUCKETS_MS) + 1)
+    for seconds in latencies:
+        milliseconds = seconds * 1000
+        bucket = next((i for i, bound in enumerate(LATENCY_BUCKETS_MS) if milliseconds <= bound), len(LATENCY_BUCKETS_MS))
+        counts[bucket] += 1
+
+    ordered = sorted(latencies)
+    def percentile(fraction):
+        return ordered[min(len(ordered)-1, int(fraction*len(ordered)))] if ordered else None
+
+    labels = [f"<={bound}ms" for bound in LATENCY_BUCKETS_MS] + [f">{LATENCY_BUCKETS_MS[-1]}ms"]
+    return {
+        'count': len(latencies),
+        'p50': percentile(0.5),
+        'p90': percentile(0.9),
+        'p99': percentile(0.99),
+        'max': ordered[-1] if ordered else None,
+        'buckets': dict(zip(labels, counts)),
+    }
+
+
+class Tracer(object):
+    """Records nested stage timings, per card render latencies, peak RSS and how many Pillow images get created.
+
+    Counting images patches PIL.Image.Image.__init__ until close() is called.
+    """
+
+    def __init__(self) -> None:
+        self.origin = time.perf_counter()
+        self.events = list()
+        self.cardLatencies = defaultdict(list)
+        self.imageAllocations = 0
+        self._depth = threading.local()
+        self._lock = threading.Lock()
+        # Images are created from render threads too, and += on an attribute isn't atomic
+        self._allocationLock = threading.Lock()
+
+        from PIL import Image
+        self._imageClass = Image.Image
+        self._originalImageInit = Image.Image.__init__
+        tracer = self
+        originalInit = self._originalImageInit
+
+        allocationLock = self._allocationLock
+
+        def countingInit(image, *args, **kwargs):
+            with allocationLock:
+                tracer.imageAllocations += 1
+            originalInit(image, *args, **kwargs)
+
+        Image.Image.__init__ = countingInit
+
+    def close(self):
+        if self._originalImageInit is not None:
+            self._imageClass.__init__ = self._originalImageInit
+            self._originalImageInit = None
+
+    @contextmanager
+    def stage(self, name:str, **args):
+        depth = getattr(self._depth, 'value', 0)
+        self._depth.value = depth + 1
+        allocationsBefore = self.imageAllocations
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            end = time.perf_counter()
+            self._depth.value = depth
+            with self._lock:
+                self.events.append({
+                    'name': name,
+                    'start': start - self.origin,
+                    'duration': end - start,
+                    'depth': depth,
+                    'thread': threading.get_ident(),
+                    'imageAllocations': self.imageAllocations - allocationsBefore,
+                    'peakRss': peakRssBytes(),
+                    'args': args,
+                })
+
+    def recordCardLatency(self, kind:str, seconds:float):
+        with self._lock:
+            self.cardLatencies[kind].append(seconds)
+
+    def summary(self) -> dict:
+        stages = dict()
+        for event in self.events:
+            stage = stages.setdefault(event['name'], {'count': 0, 'total': 0.0, 'max': 0.0, 'imageAllocations': 0})
+            stage['count'] += 1
+            stage['total'] += event['duration']
+            stage['max'] = max(stage['max'], event['duration'])
+            stage['imageAllocations'] += event['imageAllocations']
+
+        return {
+            'wallTime': time.perf_counter() - self.origin,
+            'peakRss': peakRssBytes(),
+            'imageAllocations': self.imageAllocations,
+            'stages': stages,
+            'cardLatency': {kind: latencyHistogram(latencies) for kind, latencies in self.cardLatencies.items()},
+            'events': self.events,
+        }
+
+    def chromeTrace(self) -> dict:
+        """The stages as Chrome trace events, viewable in chrome://tracing or Perfetto"""
+        pid = os.getpid()
+        traceEvents = list()
+        for event in self.events:
+            traceEvents.append({
+                'name': event['name'],
+                'ph': 'X',
+                'ts': event['start'] * 1e6,
+                'dur': event['duration'] * 1e6,
+                'pid': pid,
+                'tid': event['thread'],
+                'args': dict(event['args'], imageAllocations=event['imageAllocations']),
+            })
+            if event['peakRss'] is not None:
+                traceEvents.append({
+                    'name': 'peak RSS',
+                    'ph': 'C',
+                    'ts': (event['start'] + event['duration']) * 1e6,
+                    'pid': pid,
+                    'args': {'bytes': event['peakRss']},
+                })
+        return {'traceEvents': traceEvents, 'displayTimeUnit': 'ms'}
+
+    def write(self, outputPath:Path):
+        """Writes the summary to outputPath and the Chrome trace next to it as <name>.chrome.json"""
+        outputPath = Path(outputPath)
+        with open(outputPath, 'w') as f:
+            json.dump(self.summary(), f, indent=2, default=str)
+        with open(outputPath.with_suffix('.chrome.json'), 'w') as f:
+            json.dump(self.chromeTrace(), f, default=str)
+
+
+class NullTracer(object):
+    """Stand in used while tracing is off, so instrumented code costs next to nothing"""
+
+    def stage(self, name:str, **args):
+        return nullcontext()
+
+    def recordCardLatency(self, kind:str, seconds:float):
+        pass
+
+
+_tracer = NullTracer()
+
+
+def getTracer():
+    return _tracer
+
+
+def enableTracing() -> Tracer:
+    global _tracer
+    _tracer = Tracer()
+    return _tracer
+
+
+def disableTracing():
+    global _tracer
+    if isinstance(_tracer, Tracer):
+        _tracer.close()
+    _tracer = NullTracer()
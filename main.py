@@ -1,175 +1,113 @@
-import csv
 from pathlib import Path
-from collections import defaultdict
+from collections import defaultdict, deque
+import os
+import time
 import logging
+import argparse
 
 import imageDrawing
-from PDFMaker import PdfMaker, US_LETTER_IN
+from PDFMaker import PdfMaker, SheetCache, US_LETTER_IN, PAPER_SIZES_IN
 
 
 from splendid import ResourceType, ResourceCard, VIPCard, ResourceToken
+from deckLoader import conversionColorToResourceType, BadCSVRow, DeckCache, loadDeck, streamDeck, RESOURCE_CARD_SCHEMA, VIP_CARD_SCHEMA
+from renderPool import RenderPool
+from renderCache import RenderCache, MemoryRenderCache
+from proxyStore import ProxyStore
+from assetManifest import AssetManifest
+from assetGetter import AssetGetter, assignResourceCardArt, assignVipCardArt
+from cardStore import CARD_STORES, openCardStore
+from memoryBudget import MemoryBudget, DEFAULT_MAX_IN_FLIGHT
+from atlasMaker import AtlasMaker, ATLAS_FORMATS
+import instrumentation
+from instrumentation import getTracer
 
-conversionColorToResourceType = {
-    'Black': ResourceType.Air,
-    'White': ResourceType.WhiteLotus,
-    'Blue': ResourceType.Water,
-    'Green':ResourceType.Earth,
-    'Red':ResourceType.Fire,
-    'Gold':ResourceType.Avatar
-}
-
-
-class AssetGetter(object):
-
-    def __init__(self, assetsPath:Path) -> None:
-        self.assetsPath = assetsPath
-        resourceTypeFolder = "Resource Type Images"
-        self.resourceTypeToImage = {
-            ResourceType.Air: assetsPath/ resourceTypeFolder / "Air.png",
-            ResourceType.Water:assetsPath/ resourceTypeFolder / "Water.png",
-            ResourceType.Earth:assetsPath/ resourceTypeFolder / "Earth.png",
-            ResourceType.Fire:assetsPath/ resourceTypeFolder / "Fire.png",
-            ResourceType.WhiteLotus:assetsPath/ resourceTypeFolder / "WhiteLotus.png",
-        }
-
-        resourceCardFolder = "Resource Cards Images"
-        self.resourceTypeToResourceCardFolder = {
-            ResourceType.Air: assetsPath/ resourceCardFolder / "Air Nomads",
-            ResourceType.Water:assetsPath/ resourceCardFolder / "Water Tribe",
-            ResourceType.Earth:assetsPath/ resourceCardFolder / "Earth Kingdom",
-            ResourceType.Fire:assetsPath/ resourceCardFolder / "Fire Nation",
-            ResourceType.WhiteLotus:assetsPath/ resourceCardFolder / "White Lotus",
-        }
-
-    def getAvatarImagesPath(self) -> Path:
-        path = self.assetsPath / "Avatar Coins"
-        return path.glob("*.png")
-    
-    def getResourceImagePath(self, resourceType: ResourceType) -> Path:
-        return self.resourceTypeToImage[resourceType]
-
-    def getLevelIcon(self):
-        return self.assetsPath / "level_icon.png"
-        
 
-    def getResourceCardBackPath(self):
-        return self.assetsPath/ "ResourceCardBack.png"
-    
+# Seconds between two looks at the files a watch is on
+WATCH_POLL_INTERVAL_S = 0.2
 
-    def getResourceCardImagePaths(self, resourceType: ResourceType) -> list[Path]:
-        path = self.resourceTypeToResourceCardFolder[resourceType]
-        images = Path(path).glob("*.png")
-        return list(images)
-
-    def depre_loadAllResourceImagePaths(self):
-        ResourceCardFolderName = "Resource Cards Images"    
-        AirFolder = "Air Nomads"
-        EarthFolder = "Earth Kingdom"
-        FireFolder = "Fire Nation"
-        WaterFolder = "Water Tribe"
-        WhiteLotusFolder = "White Lotus"
-
-        folderNameToResourceType = {
-            AirFolder:ResourceType.Air,
-            EarthFolder:ResourceType.Earth,
-            FireFolder:ResourceType.Fire,
-            WaterFolder:ResourceType.Water,
-            WhiteLotusFolder:ResourceType.WhiteLotus
-        }
-
-        toReturn = defaultdict(list)
-
-        for folderName, resourceType in folderNameToResourceType.items():
-            path = self.assetsPath / ResourceCardFolderName / folderName
-            if path.is_dir():
-                images = Path(path).glob("*.png")
-                toReturn[resourceType] = list(images)
-            else:
-                logging.debug(f"path {path} doesn't exist")
-
-
-        return toReturn
-    
-    def getVipCardBackImageRaw(self):
-        return self.assetsPath / "VIPCardBack.png"
-    
-    def getVipImagePaths(self):
-        path = self.assetsPath / "VIP Images"
-        images = Path(path).glob("*.png")
-        return list(images)
-
-class BadCSVRow(ValueError):
-    def __init__(self, csvRowNumber, rowContents, error):            
-        super().__init__(f"Bad CSV Row. Row no.{csvRowNumber}, {error}: row contents {rowContents}")
-
-        self.rowNumber = csvRowNumber
-        self.previousError = error
-        self.rowContents = rowContents
-
-
-def loadVIPCardsFromCsv(csvFile) -> tuple[list[ResourceCard], list[Exception]]:
-    with open(csvFile, newline='\n') as csvfile:
-        reader = csv.DictReader(csvfile, delimiter=',', quotechar="'")
-        cards = list()
-        errors = list()
-        rowCount = 1
-        for row in reader:
-            try:
-                victoryPoints = int(row['Victor Points']) 
-                requirements = dict()
-                for ogColor, resourceType in conversionColorToResourceType.items():
-                    # no resource card requires gold
-                    if resourceType == ResourceType.Avatar:
-                        continue
-                    if row[ogColor] != '':
-                        requirements[resourceType] = int(row[ogColor])
-                cards.append(VIPCard(requires=requirements, victoryPoints=victoryPoints))
-            except (KeyError,ValueError) as e:
-                customError = BadCSVRow(rowCount, f"{row}", e)
-                errors.append(customError)
-            rowCount+=1
-
-    return cards, errors
-
-
-def loadResourceCardsFromCsv(csvFile) -> tuple[list[ResourceCard], list[Exception]]:
-    with open(csvFile, newline='\n') as csvfile:
-        reader = csv.DictReader(csvfile, delimiter=',', quotechar="'")
-        cards = list()
-        errors = list()
-        rowCount = 1
-        for row in reader:
-            try:
-                cardLevel = int(row['Card Level'])
-                victoryPoints = 0 if row['VP'] == 0 else int(row['VP']) 
-                generates = conversionColorToResourceType[row['Generates']]
-                requirements = dict()
-                for ogColor, resourceType in conversionColorToResourceType.items():
-                    # no resource card requires gold
-                    if resourceType == ResourceType.Avatar:
-                        continue
-                    if row[ogColor] != '':
-                        requirements[resourceType] = int(row[ogColor])
-                cards.append(ResourceCard(
-                    produces=generates, 
-                    requires=requirements,
-                    level=cardLevel,
-                    victoryPoints=victoryPoints
-                ))
-            except (KeyError,ValueError) as e:
-                customError = BadCSVRow(rowCount, f"{row}", e)
-                errors.append(customError)
+def loadVIPCardsFromCsv(csvFile, deckCache:DeckCache=None) -> tuple[list[VIPCard], list[Exception]]:
+    return loadDeck(csvFile, VIP_CARD_SCHEMA, deckCache)
 
-            rowCount+=1
 
-        return cards, errors
+def loadResourceCardsFromCsv(csvFile, deckCache:DeckCache=None) -> tuple[list[ResourceCard], list[Exception]]:
+    return loadDeck(csvFile, RESOURCE_CARD_SCHEMA, deckCache)
 
 
+def guaranteeFolder(path:Path):
+    path.mkdir(parents=True, exist_ok=True)
 
 
+def outputImagePath(outputImageFolderPath:Path, fileName:str) -> Path:
+    # Without an image folder cards are only rendered in memory
+    if outputImageFolderPath is None:
+        return None
+    return outputImageFolderPath / fileName
+
+
+def cardOutputPath(outputImageFolderPath:Path, cardStore, index:int, fileName:str):
+    """Where the index'th rendered front goes, one of cardStore's targets when there is a store"""
+    if cardStore is not None:
+        return cardStore.target(index, fileName)
+    return outputImagePath(outputImageFolderPath, fileName)
+
+
+def renderCards(renderFunction, renderJobs, sharedImages, renderPool:RenderPool, renderCache:RenderCache=None, cardStore=None) -> list:
+    """Renders every (card, outputPath) job, returning each card's front as a path, or an image when its outputPath is None.
+
+    With a cardStore the outputPaths are its targets, see RenderPool.render.
+    """
+    return list(iterRenderedCards(renderFunction, renderJobs, sharedImages, renderPool, renderCache, cardStore))
+
+
+def iterRenderedCards(renderFunction, renderJobs, sharedImages, renderPool:RenderPool, renderCache:RenderCache=None, cardStore=None, memoryBudget:MemoryBudget=None):
+    """renderCards as a generator, yielding each front in job order as soon as it's ready.
+
+    renderJobs may be any iterable, each job is looked up in the render cache as it's reached.
+    With a memoryBudget cards are only rendered as fast as the caller takes them, see RenderPool.renderIter.
+    """
+    if renderPool is None:
+        renderPool = RenderPool(sharedImages)
+
+    if renderCache is None:
+        yield from renderPool.renderIter(renderFunction, renderJobs, cardStore, memoryBudget)
+        return
+
+    # (key, cached front or None) for every job looked up and not yet yielded, in job order
+    lookedUp = deque()
+    def missingJobs():
+        for card, outputPath in renderJobs:
+            with getTracer().stage("render cache lookup"):
+                key = renderCache.cardKey(card, sharedImages)
+                # Cached renders are PNGs, a card bound for a raw store or for no file at all gets the decoded render instead
+                cachedFront = renderCache.fetch(key, outputPath if isinstance(outputPath, Path) else None)
+            lookedUp.append((key, cachedFront))
+            if cachedFront is None:
+                yield (card, outputPath)
+
+    # Misses come back from the pool in job order, so they slot straight into the gaps between the hits
+    renderedFronts = renderPool.renderIter(renderFunction, missingJobs(), cardStore, memoryBudget)
+    heldFront = None
+    hits = misses = 0
+    while True:
+        if not lookedUp:
+            # Looking further ahead takes rendering the next miss, which is held until the hits before it are out
+            heldFront = next(renderedFronts, None)
+            if not lookedUp:
+                break
+        key, cachedFront = lookedUp.popleft()
+        if cachedFront is not None:
+            hits += 1
+            yield cachedFront
+            continue
 
-def guaranteeFolder(path:Path):
-    path.mkdir(parents=True, exist_ok=True)
+        renderedFront = heldFront if heldFront is not None else next(renderedFronts)
+        heldFront = None
+        misses += 1
+        with getTracer().stage("render cache store"):
+            renderCache.store(key, renderedFront)
+        yield renderedFront
+    logging.info(f"render cache: {hits} hits, {misses} misses")
 
 
 def generateTokenCards(assetGetter:AssetGetter, outputImageFolderPath, sharedImages):
@@ -210,16 +148,20 @@ def generateTokenCards(assetGetter:AssetGetter, outputImageFolderPath, sharedIma
     return imageTuples
 
 
-def generateResourceCards(resourceCards, assetGetter:AssetGetter, outputImageFolderPath, sharedImages):
+def generateResourceCards(resourceCards, assetGetter:AssetGetter, outputImageFolderPath, sharedImages, renderPool:RenderPool=None, renderCache:RenderCache=None, cardStore=None):
+    return list(iterResourceCards(resourceCards, assetGetter, outputImageFolderPath, sharedImages, renderPool, renderCache, cardStore))
+
+
+def iterResourceCards(resourceCards, assetGetter:AssetGetter, outputImageFolderPath, sharedImages, renderPool:RenderPool=None, renderCache:RenderCache=None, cardStore=None, memoryBudget:MemoryBudget=None):
+    """Renders the resource cards, yielding each card's (front, back) as soon as it's ready.
+
+    Fronts go into cardStore when one is given, otherwise they're PNGs in outputImageFolderPath.
+    memoryBudget limits how far rendering runs ahead, see iterRenderedCards.
+    """
     resourceCardBackPath = assetGetter.getResourceCardBackPath()
     resourceCardBackPaths = imageDrawing.generateResourceCardBacks(outputImageFolderPath,resourceCardBackPath,sharedImages.levelIcon)
     logging.info(f"Resource Cards Backs Generated")
     
-    resourceTypeToImageList = dict()
-
-    for type in ResourceType.allButAvatar():
-        resourceTypeToImageList[type] = assetGetter.getResourceCardImagePaths(type)
-
     cardsOfTypeProduced = {
         ResourceType.Air: 0,
         ResourceType.Water:0, 
@@ -228,112 +170,419 @@ def generateResourceCards(resourceCards, assetGetter:AssetGetter, outputImageFol
         ResourceType.WhiteLotus:0
     }
     
-    producedCards = list()
-    for card in resourceCards:
-        try:
-            if card.imagePath is None:
-                if len(resourceTypeToImageList[card.produces]) > 0:
-                    card.imagePath = resourceTypeToImageList[card.produces].pop()
-                else:
-                    continue
-            outputPath = outputImageFolderPath / f"{card.produces.name}_{cardsOfTypeProduced[card.produces]}.png"
-            imageDrawing.processResourceCard(card, outputPath, sharedImages)
-            card.renderedFrontImage = outputPath
-            card.renderedBackImage = resourceCardBackPaths[card.level-1]
+    # Images and output paths are assigned in deck order as the jobs are taken, so the result doesn't depend on the order cards get rendered in
+    producedCards = deque()
+    def renderJobs():
+        for card in assignResourceCardArt(resourceCards, assetGetter):
+            try:
+                outputPath = cardOutputPath(outputImageFolderPath, cardStore, sum(cardsOfTypeProduced.values()), f"{card.produces.name}_{cardsOfTypeProduced[card.produces]}.png")
+                card.renderedBackImage = resourceCardBackPaths[card.level-1]
+            except IndexError as e:
+                logging.error(e)
+                continue
 
             cardsOfTypeProduced[card.produces]+=1
             producedCards.append(card)
-        except IndexError as e:
-            logging.error(e)
+            yield (card, outputPath)
 
+    for renderedFront in iterRenderedCards(imageDrawing.processResourceCard, renderJobs(), sharedImages, renderPool, renderCache, cardStore, memoryBudget):
+        card = producedCards.popleft()
+        card.renderedFrontImage = renderedFront
+        yield (card.renderedFrontImage, card.renderedBackImage)
 
     logging.info(f"Resource Cards Generated")
     for resourceType, totalCount in cardsOfTypeProduced.items():
         logging.info(f"{resourceType.name}: {totalCount}")
 
-    imageTuples = [(card.renderedFrontImage, card.renderedBackImage) for card in producedCards]
 
-    return imageTuples
+def generateVipCards(vipCards, assetGetter:AssetGetter, outputImageFolderPath, sharedImages, renderPool:RenderPool=None, renderCache:RenderCache=None, cardStore=None):
+    return list(iterVipCards(vipCards, assetGetter, outputImageFolderPath, sharedImages, renderPool, renderCache, cardStore))
 
 
-def generateVipCards(vipCards, assetGetter:AssetGetter, outputImageFolderPath, sharedImages):
+def iterVipCards(vipCards, assetGetter:AssetGetter, outputImageFolderPath, sharedImages, renderPool:RenderPool=None, renderCache:RenderCache=None, cardStore=None, memoryBudget:MemoryBudget=None):
+    """Renders the VIP cards, yielding each card's (front, back) as soon as it's ready. See iterResourceCards for cardStore and memoryBudget."""
     vipcardBackImagePathRaw = assetGetter.getVipCardBackImageRaw()
     vipcardBackImagePath = imageDrawing.generateVIPCardBack(outputImageFolderPath, vipcardBackImagePathRaw)
     logging.info(f"VIP card back produced")
 
-    vipImagesPaths = assetGetter.getVipImagePaths()
-
     vipCardsProduced = 0
-    for card in vipCards:
-        if card.imagePath is None:
-            card.imagePath = vipImagesPaths.pop()
-        
-        outputPath = outputImageFolderPath / f"VIP_{vipCardsProduced}.png"
-        imageDrawing.processVIPCard(card, outputPath, sharedImages)
-        card.renderedFrontImage = outputPath
-        card.renderedBackImage = vipcardBackImagePath
-        vipCardsProduced+=1
+    producedCards = deque()
+    def renderJobs():
+        nonlocal vipCardsProduced
+        for card in assignVipCardArt(vipCards, assetGetter):
+            outputPath = cardOutputPath(outputImageFolderPath, cardStore, vipCardsProduced, f"VIP_{vipCardsProduced}.png")
+            card.renderedBackImage = vipcardBackImagePath
+            producedCards.append(card)
+            vipCardsProduced+=1
+            yield (card, outputPath)
 
+    for renderedFront in iterRenderedCards(imageDrawing.processVIPCard, renderJobs(), sharedImages, renderPool, renderCache, cardStore, memoryBudget):
+        card = producedCards.popleft()
+        card.renderedFrontImage = renderedFront
+        yield (card.renderedFrontImage, card.renderedBackImage)
 
     logging.info(f"VIP cards produced: {vipCardsProduced}")
 
-    imageTuples = [(card.renderedFrontImage, card.renderedBackImage) for card in vipCards]
+def loadSharedImages(assetGetter:AssetGetter) -> imageDrawing.SplendidSharedAssetts:
+    #Load resource type images
 
-    return imageTuples
+    with getTracer().stage("load shared assets"):
+        sharedImages = imageDrawing.SplendidSharedAssetts()
 
-def main(outputFolderPath, assetGetter:AssetGetter, resourceCardsCSV, vipCardsCSV):
+        # TODO the following asset Loading should probably be done in the Shared Asset Initializer
+        for resourceType in ResourceType.allButAvatar():
+            image = assetGetter.getResourceImagePath(resourceType)
+            sharedImages.loadResourceTypeImage(resourceType, image)
 
-    outputImageFolderPath = outputFolderPath / "images"
-    
+        sharedImages.loadLevelIcon( assetGetter.getLevelIcon())
+    return sharedImages
 
-    guaranteeFolder(outputImageFolderPath)
 
-    #Load resource type images
+def main(outputFolderPath, assetGetter:AssetGetter, resourceCardsCSV, vipCardsCSV, renderWorkers=1, renderCache:RenderCache=None, writeImages=True, deckCache:DeckCache=None, pdfManager:PdfMaker=None, combinePdfs=False, cardStoreKind='png', pngCompressLevel:int=None, memoryBudget:MemoryBudget=None, atlasMaker:AtlasMaker=None):
 
-    sharedImages = imageDrawing.SplendidSharedAssetts()
+    if atlasMaker is not None:
+        # Deck sheets take the place of the PDFs, and the cards are only ever rendered in memory
+        guaranteeFolder(outputFolderPath / "atlas")
+        sharedImages = loadSharedImages(assetGetter)
+        with getTracer().stage("build"), RenderPool(sharedImages, renderWorkers) as renderPool:
+            buildAtlases(atlasMaker, outputFolderPath / "atlas", assetGetter, resourceCardsCSV, vipCardsCSV, sharedImages, renderPool, renderCache, deckCache, memoryBudget)
+        return
 
-    # TODO the following asset Loading should probably be done in the Shared Asset Initializer
-    for resourceType in ResourceType.allButAvatar():
-        image = assetGetter.getResourceImagePath(resourceType)
-        sharedImages.loadResourceTypeImage(resourceType, image)
+    outputImageFolderPath = None
+    if writeImages:
+        outputImageFolderPath = outputFolderPath / "images"
+        guaranteeFolder(outputImageFolderPath)
+    else:
+        guaranteeFolder(outputFolderPath)
+
+    sharedImages = loadSharedImages(assetGetter)
+
+    if pdfManager is None:
+        pdfManager = PdfMaker(US_LETTER_IN[1], US_LETTER_IN[0])
+
+    with getTracer().stage("build"), RenderPool(sharedImages, renderWorkers) as renderPool:
+        buildDecks(pdfManager, outputFolderPath, assetGetter, resourceCardsCSV, vipCardsCSV, outputImageFolderPath, sharedImages, renderPool, renderCache, deckCache, combinePdfs, cardStoreKind, pngCompressLevel, memoryBudget)
 
-    sharedImages.loadLevelIcon( assetGetter.getLevelIcon())
 
-    pdfManager = PdfMaker(US_LETTER_IN[1], US_LETTER_IN[0])
+def logBadRows(errors:list[BadCSVRow]):
+    logging.info(f"number of bad rows {len(errors)}")
+    if len(errors) > 0:
+        logging.error(f"{errors}")
+
+
+def buildDecks(pdfManager, outputFolderPath, assetGetter:AssetGetter, resourceCardsCSV, vipCardsCSV, outputImageFolderPath, sharedImages, renderPool:RenderPool, renderCache:RenderCache=None, deckCache:DeckCache=None, combinePdfs=False, cardStoreKind='png', pngCompressLevel:int=None, memoryBudget:MemoryBudget=None):
+    """Renders both decks into ResourceCards.pdf and VIPCards.pdf, or packs them together into Cards.pdf when combinePdfs is set.
+
+    Rendered fronts are kept in outputImageFolderPath, as PNGs or in one raw file per deck depending on cardStoreKind.
+    A memoryBudget makes it a bounded memory build: each deck is streamed into its PDF with rendering held to the
+    pace of the PDF writer, see streamPDF for how a deck too big for the budget is split.
+    """
+    if memoryBudget is not None and combinePdfs:
+        raise ValueError("a bounded memory build can't pack both decks into one PDF, that needs every card at once")
 
     # Generate Tokens Pdf
     # tokenTuples = generateTokenCards(assetGetter, outputImageFolderPath, sharedImages)
     # pdfManager.makePDF(tokenTuples, outputFolderPath/"Tokens.pdf" ,(imageDrawing.TOKEN_DIAMETER_IN, imageDrawing.TOKEN_DIAMETER_IN))
 
+    # A deck headed for its own single process PDF is written page by page while its cards are still being parsed and rendered
+    streaming = (pdfManager.workers <= 1 or memoryBudget is not None) and not combinePdfs
+
     # Generate Resource Pdf
-    resourceCards, errors = loadResourceCardsFromCsv(resourceCardsCSV)
-    logging.info(f"number of cards {len(resourceCards)}")
-    logging.info(f"number of bad rows {len(errors)}")
-    if len(errors) > 0:
-        logging.error(f"{errors}")
-    
-    imageTuples = generateResourceCards(resourceCards, assetGetter, outputImageFolderPath, sharedImages)
-    pdfManager.makePDF(imageTuples, outputFolderPath/"ResourceCards.pdf" ,imageDrawing.RESOURCE_CARD_SIZE_IN)
+    resourceStore = None
+    if outputImageFolderPath is not None:
+        resourceStore = openCardStore(cardStoreKind, outputImageFolderPath, "ResourceCards", imageDrawing.RESOURCE_CARD_SIZE_IN, pngCompressLevel)
+    if streaming:
+        # Bad rows are only all known once the whole deck has gone through
+        resourceCards, errors = streamDeck(resourceCardsCSV, RESOURCE_CARD_SCHEMA, deckCache)
+        resourceTuples = iterResourceCards(resourceCards, assetGetter, outputImageFolderPath, sharedImages, renderPool, renderCache, resourceStore, memoryBudget)
+        with getTracer().stage("render cards and make pdf", deck="resource"):
+            pdfManager.streamPDF(resourceTuples, outputFolderPath/"ResourceCards.pdf", imageDrawing.RESOURCE_CARD_SIZE_IN, memoryBudget)
+        logBadRows(errors)
+    else:
+        with getTracer().stage("parse csv", deck="resource"):
+            resourceCards, errors = loadResourceCardsFromCsv(resourceCardsCSV, deckCache)
+        logging.info(f"number of cards {len(resourceCards)}")
+        logBadRows(errors)
+        resourceTuples = iterResourceCards(resourceCards, assetGetter, outputImageFolderPath, sharedImages, renderPool, renderCache, resourceStore, memoryBudget)
+        with getTracer().stage("render cards", deck="resource", cards=len(resourceCards)):
+            resourceTuples = list(resourceTuples)
 
     # Genereate VIP Pdf
-    vipCards, errors = loadVIPCardsFromCsv(vipCardsCSV)    
+    vipStore = None
+    if outputImageFolderPath is not None:
+        vipStore = openCardStore(cardStoreKind, outputImageFolderPath, "VIPCards", imageDrawing.VIP_CARD_SIZE_IN, pngCompressLevel)
+    if streaming:
+        vipCards, errors = streamDeck(vipCardsCSV, VIP_CARD_SCHEMA, deckCache)
+        vipTuples = iterVipCards(vipCards, assetGetter, outputImageFolderPath, sharedImages, renderPool, renderCache, vipStore, memoryBudget)
+        with getTracer().stage("render cards and make pdf", deck="vip"):
+            pdfManager.streamPDF(vipTuples, outputFolderPath/"VIPCards.pdf", imageDrawing.VIP_CARD_SIZE_IN, memoryBudget)
+        logBadRows(errors)
+        if memoryBudget is not None:
+            logging.info(f"memory budget: {memoryBudget.report()}")
+        return
+
+    with getTracer().stage("parse csv", deck="vip"):
+        vipCards, errors = loadVIPCardsFromCsv(vipCardsCSV, deckCache)
     logging.info(f"number of Vip cards {len(vipCards)}")
-    logging.info(f"number of bad rows {len(errors)}")
+    logBadRows(errors)
+    vipTuples = iterVipCards(vipCards, assetGetter, outputImageFolderPath, sharedImages, renderPool, renderCache, vipStore, memoryBudget)
+    with getTracer().stage("render cards", deck="vip", cards=len(vipCards)):
+        vipTuples = list(vipTuples)
+
+    resourceDocument = [(front, back, imageDrawing.RESOURCE_CARD_SIZE_IN) for front, back in resourceTuples]
+    vipDocument = [(front, back, imageDrawing.VIP_CARD_SIZE_IN) for front, back in vipTuples]
+    if combinePdfs:
+        # Mixing the sizes lets the smaller VIP cards fill the gaps the resource cards leave
+        documents = [(resourceDocument + vipDocument, outputFolderPath/"Cards.pdf")]
+    else:
+        documents = [(resourceDocument, outputFolderPath/"ResourceCards.pdf"), (vipDocument, outputFolderPath/"VIPCards.pdf")]
+
+    # Both documents are built together, so with PDF workers they're drawn side by side
+    with getTracer().stage("make pdf", documents=len(documents)):
+        pdfManager.makeDocuments(documents)
+
+
+def buildAtlases(atlasMaker:AtlasMaker, outputFolderPath, assetGetter:AssetGetter, resourceCardsCSV, vipCardsCSV, sharedImages, renderPool:RenderPool, renderCache:RenderCache=None, deckCache:DeckCache=None, memoryBudget:MemoryBudget=None):
+    """Renders both decks straight into deck sheets for digital tabletop tools, see AtlasMaker.makeAtlas"""
+    with getTracer().stage("parse csv", deck="resource"):
+        resourceCards, errors = loadResourceCardsFromCsv(resourceCardsCSV, deckCache)
     if len(errors) > 0:
         logging.error(f"{errors}")
+    resourceTuples = iterResourceCards(resourceCards, assetGetter, None, sharedImages, renderPool, renderCache, None, memoryBudget)
+    with getTracer().stage("render cards and make atlas", deck="resource", cards=len(resourceCards)):
+        atlasMaker.makeAtlas(resourceTuples, outputFolderPath, "ResourceCards", imageDrawing.RESOURCE_CARD_SIZE_IN)
 
-    imageTuples = generateVipCards(vipCards, assetGetter, outputImageFolderPath, sharedImages)
-    pdfManager.makePDF(imageTuples, outputFolderPath/"VIPCards.pdf" ,imageDrawing.VIP_CARD_SIZE_IN)
+    with getTracer().stage("parse csv", deck="vip"):
+        vipCards, errors = loadVIPCardsFromCsv(vipCardsCSV, deckCache)
+    if len(errors) > 0:
+        logging.error(f"{errors}")
+    vipTuples = iterVipCards(vipCards, assetGetter, None, sharedImages, renderPool, renderCache, None, memoryBudget)
+    with getTracer().stage("render cards and make atlas", deck="vip", cards=len(vipCards)):
+        atlasMaker.makeAtlas(vipTuples, outputFolderPath, "VIPCards", imageDrawing.VIP_CARD_SIZE_IN)
+
+
+def snapshotFiles(paths:list[Path]) -> dict[str, tuple[int, int]]:
+    """(size, mtime) of every file in paths, folders are walked all the way down"""
+    snapshot = dict()
+    pending = [str(path) for path in paths]
+    while pending:
+        path = pending.pop()
+        try:
+            if not os.path.isdir(path):
+                stat = os.stat(path)
+                snapshot[path] = (stat.st_size, stat.st_mtime_ns)
+                continue
+            with os.scandir(path) as scan:
+                for entry in scan:
+                    if entry.is_dir():
+                        pending.append(entry.path)
+                    else:
+                        stat = entry.stat()
+                        snapshot[entry.path] = (stat.st_size, stat.st_mtime_ns)
+        except FileNotFoundError:
+            # Deleted between being listed and being looked at, it's simply not part of the snapshot
+            continue
+    return snapshot
+
+
+class DeckWatcher(object):
+    """Rebuilds the PDFs every time the CSVs or the assets change, redoing only what the change touched.
+
+    Shared assets, fonts and the render pool stay loaded between builds. Cards whose row and art are unchanged
+    reuse their render from the last build, and only the sheets holding a changed card are redrawn.
+    Cards are only ever rendered in memory. Editing a shared icon or a card back starts over from scratch.
+    """
+
+    def __init__(self, outputFolderPath:Path, assetGetter:AssetGetter, resourceCardsCSV:Path, vipCardsCSV:Path, pdfManager:PdfMaker, renderWorkers=1, renderCache:RenderCache=None, deckCache:DeckCache=None, combinePdfs=False) -> None:
+        self.outputFolderPath = outputFolderPath
+        self.assetGetter = assetGetter
+        self.resourceCardsCSV = resourceCardsCSV
+        self.vipCardsCSV = vipCardsCSV
+        self.pdfManager = pdfManager
+        self.renderWorkers = renderWorkers
+        self.deckCache = deckCache
+        self.combinePdfs = combinePdfs
+        self.renderCache = MemoryRenderCache(renderCache, assetGetter.manifest)
+        self.sheetCache = SheetCache()
+        self.sharedImages = None
+        self.renderPool = None
+
+    def watchedPaths(self) -> list[Path]:
+        return [self.assetGetter.assetsPath, self.resourceCardsCSV, self.vipCardsCSV]
+
+    def sharedInputs(self) -> set[str]:
+        """Files every card depends on, as opposed to the CSVs and card art which only affect some of them"""
+        paths = list(self.sharedImages.sourcePaths.values())
+        paths.extend([self.assetGetter.getResourceCardBackPath(), self.assetGetter.getVipCardBackImageRaw()])
+        return {str(path) for path in paths}
+
+    def _loadSharedImages(self):
+        self.close()
+        self.sharedImages = loadSharedImages(self.assetGetter)
+        # Worker processes are handed the shared assets when they start, so they're started again along with them
+        self.renderPool = RenderPool(self.sharedImages, self.renderWorkers).__enter__()
+        self.sheetCache.clear()
+
+    def build(self, changed:set[str]=None):
+        """Brings the PDFs up to date. changed is the files edited since the last build, None for a first build."""
+        start = time.perf_counter()
+        # Art can change in the same batch as a shared input, so the listing is brought up to date either way
+        if changed and self.assetGetter.manifest is not None:
+            self.assetGetter.manifest.refresh()
+        if self.sharedImages is None or changed is None or changed & self.sharedInputs():
+            self._loadSharedImages()
+
+        resourceCards, errors = loadResourceCardsFromCsv(self.resourceCardsCSV, self.deckCache)
+        if len(errors) > 0:
+            logging.error(f"{errors}")
+        resourceTuples = list(iterResourceCards(resourceCards, self.assetGetter, None, self.sharedImages, self.renderPool, self.renderCache))
+        # The level 1-3 backs only change along with the shared inputs, so the level stands in for the back
+        resourceKeys = [(self.renderCache.cardKey(card, self.sharedImages), card.level) for card in resourceCards if card.renderedFrontImage is not None]
+
+        vipCards, errors = loadVIPCardsFromCsv(self.vipCardsCSV, self.deckCache)
+        if len(errors) > 0:
+            logging.error(f"{errors}")
+        vipTuples = list(iterVipCards(vipCards, self.assetGetter, None, self.sharedImages, self.renderPool, self.renderCache))
+        vipKeys = [(self.renderCache.cardKey(card, self.sharedImages), 'vip') for card in vipCards]
+
+        resourceDocument = [(front, back, imageDrawing.RESOURCE_CARD_SIZE_IN) for front, back in resourceTuples]
+        vipDocument = [(front, back, imageDrawing.VIP_CARD_SIZE_IN) for front, back in vipTuples]
+        if self.combinePdfs:
+            documents = [(resourceDocument + vipDocument, resourceKeys + vipKeys, self.outputFolderPath/"Cards.pdf")]
+        else:
+            documents = [(resourceDocument, resourceKeys, self.outputFolderPath/"ResourceCards.pdf"), (vipDocument, vipKeys, self.outputFolderPath/"VIPCards.pdf")]
+
+        drawn = 0
+        for cards, cardKeys, outputPath in documents:
+            drawn += self.pdfManager.makeCachedPDF(cards, cardKeys, outputPath, self.sheetCache)
+
+        # Whatever the decks no longer use would otherwise pile up over a long session
+        self.renderCache.prune()
+        self.sheetCache.prune()
+        logging.info(f"rebuilt in {time.perf_counter()-start:.2f}s, {drawn} sheets redrawn")
+
+    def watch(self, pollInterval:float=WATCH_POLL_INTERVAL_S):
+        """Builds, then rebuilds after every change until interrupted"""
+        guaranteeFolder(self.outputFolderPath)
+        snapshot = snapshotFiles(self.watchedPaths())
+        self.build()
+        logging.info(f"watching {self.assetGetter.assetsPath} for changes")
+        while True:
+            time.sleep(pollInterval)
+            current = snapshotFiles(self.watchedPaths())
+            if current == snapshot:
+                continue
+            # Editors often save in several writes, hold off until the files have settled
+            settled = None
+            while settled != current:
+                settled = current
+                time.sleep(pollInterval)
+                current = snapshotFiles(self.watchedPaths())
+
+            changed = {path for path in current.keys() | snapshot.keys() if current.get(path) != snapshot.get(path)}
+            snapshot = current
+            logging.info(f"{len(changed)} files changed: {', '.join(sorted(Path(path).name for path in changed)[:5])}")
+            try:
+                self.build(changed)
+            except Exception:
+                # A half finished edit shouldn't end the session, the next save gets another go
+                logging.exception("rebuild failed")
+
+    def close(self):
+        if self.renderPool is not None:
+            self.renderPool.__exit__(None, None, None)
+            self.renderPool = None
 
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate printable Splendid card PDFs")
+    parser.add_argument("--workers", type=int, default=1, help="number of render processes, 0 uses every core")
+    parser.add_argument("--no-render-cache", action="store_true", help="re-render every card even if it hasn't changed")
+    parser.add_argument("--no-images", action="store_true", help="only write the PDFs, skipping the per card PNGs")
+    parser.add_argument("--proxies", action="store_true", help="render from pre-cropped, reduced copies of the card art")
+    parser.add_argument("--no-deck-cache", action="store_true", help="always parse the CSVs instead of loading the parsed decks from the last run")
+    parser.add_argument("--no-asset-manifest", action="store_true", help="glob the asset folders instead of using the indexed listing from the last run")
+    parser.add_argument("--pdf-workers", type=int, help="number of processes drawing PDFs, 0 uses every core, defaults to --workers")
+    parser.add_argument("--paper", choices=sorted(PAPER_SIZES_IN), default="letter", help="paper size to print on, in landscape")
+    parser.add_argument("--bleed-in", type=float, default=0, help="bleed around every card, in inches")
+    parser.add_argument("--gutter-in", type=float, default=None, help="space between neighbouring cards, in inches. By default a sheet's spare room is shared out between its cards")
+    parser.add_argument("--no-rotate", action="store_true", help="keep every card upright instead of turning some sideways to fit more on a sheet")
+    parser.add_argument("--single-pdf", action="store_true", help="pack both decks together into Cards.pdf")
+    parser.add_argument("--card-store", choices=CARD_STORES, default="png", help="keep rendered cards as PNGs, or as uncompressed pixels in one file per deck, which skips encoding and decoding them")
+    parser.add_argument("--png-compress-level", type=int, choices=range(10), help="zlib level for the card PNGs, lower is faster and bigger")
+    parser.add_argument("--trace", type=Path, help="write stage timings, render latencies and memory use to this JSON file, plus a Chrome trace beside it")
+    parser.add_argument("--render-cache-mb", type=int, default=512, help="size limit of the render cache")
+    parser.add_argument("--max-rss-mb", type=int, help="bounded memory build: hold rendering back to stay under this resident size, splitting PDFs into volumes if they won't fit")
+    parser.add_argument("--max-in-flight", type=int, help=f"bounded memory build: most cards rendered but not yet in the PDF at once, defaults to {DEFAULT_MAX_IN_FLIGHT}")
+    parser.add_argument("--atlas", action="store_true", help="write deck sheets for digital tabletop tools into output/atlas instead of the PDFs: grids of card faces, the backs and a JSON index of the cells")
+    parser.add_argument("--atlas-max-size", type=int, default=4096, help="largest width and height of a deck sheet, in pixels")
+    parser.add_argument("--atlas-format", choices=ATLAS_FORMATS, default="png", help="image format of the deck sheets")
+    parser.add_argument("--watch", action="store_true", help="keep running, rebuilding the PDFs whenever the CSVs or assets change. Cards are only rendered in memory")
+    args = parser.parse_args()
+
     logging.basicConfig(level=logging.INFO)
     outputFolderPath = Path("C:\\Users\\G\\code\\splendid\\output")
 
     assetsPath = Path("assets")
-    assetGetter = AssetGetter(assetsPath)
+    proxyStore = None
+    if args.proxies:
+        proxyStore = ProxyStore(outputFolderPath / "proxies")
+    manifest = None
+    if not args.no_asset_manifest:
+        manifest = AssetManifest(assetsPath, outputFolderPath / "assetManifest.json")
+    assetGetter = AssetGetter(assetsPath, proxyStore, manifest)
 
     resourceCardsCSV = assetsPath / "resourceCards.csv"
     vipCardsCSV = assetsPath / "VIPCardsTriple.csv"
 
-    main(outputFolderPath, assetGetter, resourceCardsCSV, vipCardsCSV)
\ No newline at end of file
+    renderCache = None
+    if not args.no_render_cache:
+        renderCache = RenderCache(outputFolderPath / "renderCache", maxBytes=args.render_cache_mb*1024*1024, manifest=manifest)
+
+    deckCache = None
+    if not args.no_deck_cache:
+        deckCache = DeckCache(outputFolderPath / "deckCache")
+
+    paperWidth, paperHeight = PAPER_SIZES_IN[args.paper]
+    pdfWorkers = args.workers if args.pdf_workers is None else args.pdf_workers
+    pdfManager = PdfMaker(paperHeight, paperWidth, gutterInInches=args.gutter_in, bleedInInches=args.bleed_in, allowRotation=not args.no_rotate, workers=pdfWorkers)
+
+    memoryBudget = None
+    if args.max_rss_mb is not None or args.max_in_flight is not None:
+        if args.single_pdf:
+            parser.error("--single-pdf needs every card at once, it can't be part of a bounded memory build")
+        maxRssBytes = args.max_rss_mb*1024*1024 if args.max_rss_mb is not None else None
+        memoryBudget = MemoryBudget(args.max_in_flight or DEFAULT_MAX_IN_FLIGHT, maxRssBytes)
+
+    atlasMaker = None
+    if args.atlas:
+        if args.single_pdf or args.watch:
+            parser.error("--atlas writes deck sheets instead of PDFs, it can't be combined with --single-pdf or --watch")
+        atlasMaker = AtlasMaker((args.atlas_max_size, args.atlas_max_size), imageFormat=args.atlas_format, compressLevel=args.png_compress_level)
+
+    tracer = None
+    if args.trace is not None:
+        tracer = instrumentation.enableTracing()
+
+    try:
+        if args.watch:
+            watcher = DeckWatcher(outputFolderPath, assetGetter, resourceCardsCSV, vipCardsCSV, pdfManager, renderWorkers=args.workers, renderCache=renderCache, deckCache=deckCache, combinePdfs=args.single_pdf)
+            try:
+                watcher.watch()
+            except KeyboardInterrupt:
+                pass
+            finally:
+                watcher.close()
+        else:
+            main(outputFolderPath, assetGetter, resourceCardsCSV, vipCardsCSV, renderWorkers=args.workers, renderCache=renderCache, writeImages=not args.no_images, deckCache=deckCache, pdfManager=pdfManager, combinePdfs=args.single_pdf, cardStoreKind=args.card_store, pngCompressLevel=args.png_compress_level, memoryBudget=memoryBudget, atlasMaker=atlasMaker)
+
+        if proxyStore is not None:
+            proxyStore.prune()
+
+        if manifest is not None:
+            manifest.save()
+    finally:
+        # Written even when the build fails or is interrupted, that's when the trace is wanted most
+        if tracer is not None:
+            instrumentation.disableTracing()
+            tracer.write(args.trace)
\ No newline at end of file
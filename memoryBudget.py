@@ -0,0 +1,75 @@
+import os
+import logging
+
+from PIL import Image
+
+
+# Rendered cards a build may hold at once, by default, between a render worker picking one up and it being drawn into the PDF
+DEFAULT_MAX_IN_FLIGHT = 16
+
+# Share of the RSS budget the images embedded in one PDF may take before the rest of the deck goes into another volume.
+# reportlab holds every image of a document until it's saved and then joins the whole file into one string, so the
+# document's peak is a few times this.
+PDF_SHARE_OF_BUDGET = 0.25
+
+
+def currentRssBytes() -> int:
+    """Resident size of this process right now, None where it can't be told cheaply"""
+    try:
+        with open("/proc/self/statm") as f:
+            residentPages = int(f.read().split()[1])
+        return residentPages * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+class MemoryBudget(object):
+    """Limits on what a build holds in memory at once, for decks too big to hold whole.
+
+    maxInFlight caps the cards that have been handed to the render workers but not yet drawn into the PDF.
+    maxRssBytes, when given, is the resident size the build tries to stay under. Once over it the renderers
+    are held back to one card ahead of the PDF writer, and documents are split into volumes small enough for
+    reportlab to save within it. The budget covers the building process, each render worker holds one card at a time.
+    """
+
+    def __init__(self, maxInFlight:int=DEFAULT_MAX_IN_FLIGHT, maxRssBytes:int=None) -> None:
+        self.maxInFlight = max(1, maxInFlight)
+        self.maxRssBytes = maxRssBytes
+        # How many times rendering was held back, and the largest RSS seen while checking
+        self.throttled = 0
+        self.peakRssBytes = 0
+        if maxRssBytes is not None and currentRssBytes() is None:
+            logging.warning("the resident size of this process can't be read here, only the in flight cap applies")
+
+    @property
+    def maxPdfBytes(self) -> int:
+        """Image bytes one PDF volume may embed, None for no limit"""
+        if self.maxRssBytes is None:
+            return None
+        return int(self.maxRssBytes * PDF_SHARE_OF_BUDGET)
+
+    def overBudget(self) -> bool:
+        if self.maxRssBytes is None:
+            return False
+        rss = currentRssBytes()
+        if rss is None:
+            return False
+        self.peakRssBytes = max(self.peakRssBytes, rss)
+        return rss > self.maxRssBytes
+
+    def inFlightLimit(self) -> int:
+        """How many cards may be in flight right now"""
+        if self.overBudget():
+            self.throttled += 1
+            return 1
+        return self.maxInFlight
+
+    @staticmethod
+    def release(image):
+        """Frees the pixels of a card image that has been drawn and won't be needed again. Paths and RawCards are left alone."""
+        if isinstance(image, Image.Image):
+            image.close()
+
+    def report(self) -> str:
+        peak = f", peak RSS {self.peakRssBytes // (1024*1024)}MB" if self.peakRssBytes else ""
+        return f"rendering held back {self.throttled} times{peak}"
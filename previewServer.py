@@ -0,0 +1,267 @@
+import io
+import html
+import logging
+import argparse
+import threading
+from pathlib import Path
+from collections import OrderedDict
+from urllib.parse import urlsplit, parse_qsl, quote
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+import imageDrawing
+from deckLoader import RESOURCE_CARD_SCHEMA, VIP_CARD_SCHEMA, requirementColumns
+from renderCache import CardKeys
+from proxyStore import ProxyStore
+from assetGetter import AssetGetter, assignResourceCardArt, assignVipCardArt
+from main import loadSharedImages, loadResourceCardsFromCsv, loadVIPCardsFromCsv
+
+
+DEFAULT_MAX_PREVIEW_BYTES = 64 * 1024 * 1024
+
+# Previews are thrown away after a look, so they're encoded for speed rather than size
+PREVIEW_COMPRESS_LEVEL = 1
+
+
+class PreviewCache(object):
+    """Rendered PNGs in memory, least recently used dropped first once they add up to more than maxBytes"""
+
+    def __init__(self, maxBytes:int=DEFAULT_MAX_PREVIEW_BYTES) -> None:
+        self.maxBytes = maxBytes
+        self.entries = OrderedDict()
+        self.totalBytes = 0
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key:str) -> bytes:
+        png = self.entries.get(key)
+        if png is None:
+            self.misses += 1
+            return None
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return png
+
+    def put(self, key:str, png:bytes):
+        if key in self.entries:
+            self.totalBytes -= len(self.entries.pop(key))
+        self.entries[key] = png
+        self.totalBytes += len(png)
+        while self.totalBytes > self.maxBytes and len(self.entries) > 1:
+            _, evicted = self.entries.popitem(last=False)
+            self.totalBytes -= len(evicted)
+
+
+class CardPreviewer(object):
+    """Renders single cards to PNG on demand, with the shared assets loaded once up front.
+
+    Cards come either from the decks, by their position in the deck, or from ad hoc parameters named after
+    the CSV's own columns. Renders are cached by card content, so an edit to a card is never served stale.
+    """
+
+    kinds = {
+        'resource': (RESOURCE_CARD_SCHEMA, imageDrawing.processResourceCard),
+        'vip': (VIP_CARD_SCHEMA, imageDrawing.processVIPCard),
+    }
+
+    def __init__(self, assetGetter:AssetGetter, resourceCardsCSV:Path, vipCardsCSV:Path, maxBytes:int=DEFAULT_MAX_PREVIEW_BYTES) -> None:
+        self.assetGetter = assetGetter
+        self.csvFiles = {'resource': Path(resourceCardsCSV), 'vip': Path(vipCardsCSV)}
+        self.sharedImages = loadSharedImages(assetGetter)
+        self.cardKeys = CardKeys(assetGetter.manifest)
+        self.cache = PreviewCache(maxBytes)
+        # kind -> ((size, mtime) of its CSV, cards), so decks are only read again once their CSV changes
+        self._decks = dict()
+        # Guards the decks, the preview cache and _renderLocks. It's never held while a card renders
+        self._lock = threading.Lock()
+        # card key -> (lock, requests holding or waiting on it), so each card is rendered once however many ask
+        # for it at a time, while different cards render side by side
+        self._renderLocks = dict()
+
+    def deck(self, kind:str) -> list:
+        """The cards of a deck in CSV order, with their art assigned like a full build would"""
+        with self._lock:
+            return self._loadDeck(kind)
+
+    def _loadDeck(self, kind:str) -> list:
+        csvFile = self.csvFiles[kind]
+        stat = csvFile.stat()
+        version = (stat.st_size, stat.st_mtime_ns)
+        loaded = self._decks.get(kind)
+        if loaded is not None and loaded[0] == version:
+            return loaded[1]
+
+        if kind == 'resource':
+            cards, errors = loadResourceCardsFromCsv(csvFile)
+            cards = list(assignResourceCardArt(cards, self.assetGetter))
+        else:
+            cards, errors = loadVIPCardsFromCsv(csvFile)
+            cards = list(assignVipCardArt(cards, self.assetGetter))
+        for error in errors:
+            logging.warning(error)
+        self._decks[kind] = (version, cards)
+        return cards
+
+    def deckCard(self, kind:str, index:int):
+        cards = self.deck(kind)
+        if not 0 <= index < len(cards):
+            raise IndexError(f"the {kind} deck has {len(cards)} cards, there is no card {index}")
+        return cards[index]
+
+    def adHocCard(self, kind:str, parameters:dict[str, str]):
+        """A card built from parameters named like the CSV columns, e.g. VP=2&Blue=3. art picks an image by file name."""
+        schema, _ = self.kinds[kind]
+        columns = [column for _, column, _ in schema.fields] + [color for color, _ in requirementColumns]
+        # Requirement columns left out are blank, just like empty cells. Costs outside what a card can hold are a ValueError
+        card = schema.compile(columns)([parameters.get(column, '') for column in columns])
+        if kind == 'vip' and len(card.requires) == 0:
+            # The requirements are spaced out across the card, there's no laying out none
+            raise ValueError("a VIP card needs at least one requirement")
+
+        images = self.artChoices(kind, card)
+        art = parameters.get('art')
+        if art is not None:
+            images = [image for image in images if image.name == art]
+        if len(images) == 0:
+            raise ValueError(f"no art {art or ''} for this card")
+        card.imagePath = self.assetGetter.getResourceCardArt(images[0]) if kind == 'resource' else self.assetGetter.getVipArt(images[0])
+        return card
+
+    def artChoices(self, kind:str, card) -> list[Path]:
+        if kind == 'resource':
+            return self.assetGetter.getResourceCardImagePaths(card.produces)
+        return self.assetGetter.getVipImagePaths()
+
+    def renderPng(self, kind:str, card) -> bytes:
+        key = self.cardKeys.cardKey(card, self.sharedImages)
+        with self._lock:
+            png = self.cache.get(key)
+            if png is not None:
+                return png
+            renderLock, waiting = self._renderLocks.get(key, (None, 0))
+            if renderLock is None:
+                renderLock = threading.Lock()
+            self._renderLocks[key] = (renderLock, waiting + 1)
+
+        try:
+            with renderLock:
+                with self._lock:
+                    # Whoever held the lock before may have rendered this very card
+                    png = self.cache.entries.get(key)
+                if png is None:
+                    png = self._render(kind, card)
+                    with self._lock:
+                        self.cache.put(key, png)
+                return png
+        finally:
+            with self._lock:
+                renderLock, waiting = self._renderLocks[key]
+                if waiting == 1:
+                    del self._renderLocks[key]
+                else:
+                    self._renderLocks[key] = (renderLock, waiting - 1)
+
+    def _render(self, kind:str, card) -> bytes:
+        _, renderFunction = self.kinds[kind]
+        cardImage = renderFunction(card, None, self.sharedImages)
+        buffer = io.BytesIO()
+        cardImage.save(buffer, format="PNG", compress_level=PREVIEW_COMPRESS_LEVEL)
+        return buffer.getvalue()
+
+    def indexPage(self) -> str:
+        """Every card of both decks, each linking to its full size preview"""
+        sections = list()
+        for kind in self.kinds:
+            cards = self.deck(kind)
+            images = "\n".join(f'<a href="/{kind}/{index}.png"><img src="/{kind}/{index}.png" loading="lazy" width="200" title="{html.escape(repr(card))}"></a>' for index, card in enumerate(cards))
+            sections.append(f"<h2>{kind} ({len(cards)} cards)</h2>\n{images}")
+        return "<!doctype html>\n<title>Splendid card preview</title>\n" + "\n".join(sections)
+
+
+class PreviewRequestHandler(BaseHTTPRequestHandler):
+    """Routes for a CardPreviewer:
+
+    /                        every card of both decks
+    /resource/<index>.png    a card of the resource deck, by its position in the deck, and /vip/<index>.png likewise
+    /resource.png?<columns>  an ad hoc card, e.g. /resource.png?Card Level=2&VP=1&Generates=Red&Blue=3, and /vip.png likewise
+    """
+
+    previewer:CardPreviewer = None
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        parts = [part for part in url.path.split("/") if part]
+        try:
+            if len(parts) == 0:
+                self.reply(200, "text/html; charset=utf-8", self.previewer.indexPage().encode())
+                return
+            if len(parts) == 1 and parts[0].endswith(".png") and parts[0][:-4] in CardPreviewer.kinds:
+                kind = parts[0][:-4]
+                card = self.previewer.adHocCard(kind, dict(parse_qsl(url.query, keep_blank_values=True)))
+            elif len(parts) == 2 and parts[0] in CardPreviewer.kinds and parts[1].endswith(".png"):
+                kind = parts[0]
+                card = self.previewer.deckCard(kind, int(parts[1][:-4]))
+            else:
+                self.reply(404, "text/plain", f"nothing at {quote(url.path)}".encode())
+                return
+        except IndexError as e:
+            self.reply(404, "text/plain", str(e).encode())
+            return
+        except (KeyError, ValueError) as e:
+            self.reply(400, "text/plain", f"bad card: {e}".encode())
+            return
+        except Exception as e:
+            self.failed(e)
+            return
+
+        try:
+            png = self.previewer.renderPng(kind, card)
+        except Exception as e:
+            self.failed(e)
+            return
+        self.reply(200, "image/png", png)
+
+    def failed(self, error:Exception):
+        """Answers with a 500 rather than dropping the connection, the server carries on with the next request"""
+        logging.exception(f"{self.path} failed")
+        self.reply(500, "text/plain", f"failed: {error!r}".encode())
+
+    def reply(self, status:int, contentType:str, body:bytes):
+        self.send_response(status)
+        self.send_header("Content-Type", contentType)
+        self.send_header("Content-Length", str(len(body)))
+        # The same URL shows a different card once the CSV is edited
+        self.send_header("Cache-Control", "no-store")
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        logging.debug(format % args)
+
+
+def makeServer(previewer:CardPreviewer, host:str="127.0.0.1", port:int=8000) -> ThreadingHTTPServer:
+    handler = type("BoundPreviewRequestHandler", (PreviewRequestHandler,), {'previewer': previewer})
+    return ThreadingHTTPServer((host, port), handler)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serve previews of single Splendid cards, rendered on demand")
+    parser.add_argument("--assets", type=Path, default=Path("assets"), help="assets folder, holding the card CSVs")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--cache-mb", type=int, default=64, help="memory kept for rendered previews")
+    parser.add_argument("--proxies", type=Path, help="render from reduced copies of the card art kept in this folder")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    proxyStore = ProxyStore(args.proxies) if args.proxies is not None else None
+    assetGetter = AssetGetter(args.assets, proxyStore)
+    previewer = CardPreviewer(assetGetter, args.assets / "resourceCards.csv", args.assets / "VIPCardsTriple.csv", maxBytes=args.cache_mb*1024*1024)
+
+    server = makeServer(previewer, args.host, args.port)
+    logging.info(f"previewing cards on http://{args.host}:{server.server_address[1]}/")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
@@ -0,0 +1,71 @@
+import hashlib
+import logging
+from pathlib import Path
+
+from PIL import Image, PngImagePlugin
+
+import imageDrawing
+
+
+# Bump when the way proxies are built changes, so old proxies are rebuilt
+PROXY_VERSION = 1
+
+
+class ProxyStore(object):
+    """On disk copies of the source art, pre-cropped and reduced to just above the size they're rendered at.
+
+    Proxies are named after the source's path, size and modification time, so editing a source
+    picks up a fresh proxy automatically. prune() clears out the ones nothing asked for.
+    """
+
+    def __init__(self, proxyFolder:Path) -> None:
+        self.proxyFolder = Path(proxyFolder)
+        self.proxyFolder.mkdir(parents=True, exist_ok=True)
+        self.handedOut = set()
+        self.built = 0
+
+    def getResourceCardProxy(self, sourcePath:Path) -> Path:
+        outputSize = tuple(x*imageDrawing.OUTPUT_DPI for x in imageDrawing.RESOURCE_CARD_SIZE_IN)
+        return self._getProxy(sourcePath, imageDrawing.IMG_BORDER_CROP_SYMMETRICAL, outputSize)
+
+    def getVipProxy(self, sourcePath:Path) -> Path:
+        outputSize = tuple(x*imageDrawing.OUTPUT_DPI for x in imageDrawing.VIP_CARD_SIZE_IN)
+        return self._getProxy(sourcePath, 0, outputSize)
+
+    def _getProxy(self, sourcePath:Path, cropX:int, outputSize:tuple[int,int]) -> Path:
+        stat = sourcePath.stat()
+        identity = f"{sourcePath.resolve()}|{stat.st_size}|{stat.st_mtime_ns}|{cropX}|{outputSize}|{PROXY_VERSION}"
+        proxyPath = self.proxyFolder / f"{hashlib.sha1(identity.encode()).hexdigest()}.png"
+        if not proxyPath.is_file():
+            self._buildProxy(sourcePath, proxyPath, cropX, outputSize)
+            self.built += 1
+        self.handedOut.add(proxyPath.name)
+        return proxyPath
+
+    def _buildProxy(self, sourcePath:Path, proxyPath:Path, cropX:int, outputSize:tuple[int,int]):
+        targetW, targetH = outputSize
+        with Image.open(sourcePath) as img:
+            sourceW, sourceH = img.size
+            # shrink_image fits the art inside the card, reducing by the whole part of that ratio keeps every pixel it needs
+            factor = max(1, int(max((sourceW - 2*cropX)/targetW, sourceH/targetH)))
+
+            proxy = img
+            if cropX:
+                proxy = imageDrawing.symmetricalCrop(proxy, cropX, 0)
+            if factor > 1:
+                proxy = proxy.reduce(factor)
+
+            info = PngImagePlugin.PngInfo()
+            if cropX:
+                info.add_text(imageDrawing.PRECROPPED_INFO_KEY, str(cropX))
+            # Proxies are rebuilt rarely and read every run, so favour speed over size
+            proxy.save(proxyPath, pnginfo=info, compress_level=1)
+
+    def prune(self):
+        """Deletes every proxy that wasn't handed out by this store"""
+        removed = 0
+        for proxyPath in self.proxyFolder.glob("*.png"):
+            if proxyPath.name not in self.handedOut:
+                proxyPath.unlink()
+                removed += 1
+        logging.info(f"proxies: {self.built} built, {len(self.handedOut)} used, {removed} stale removed")
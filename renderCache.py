@@ -0,0 +1,219 @@
+import os
+import json
+import shutil
+import hashlib
+import threading
+from pathlib import Path
+from collections import OrderedDict
+
+from PIL import Image
+
+import imageDrawing
+from cardStore import RawCard
+from splendid import ResourceCard, VIPCard
+
+
+DEFAULT_MAX_CACHE_BYTES = 512 * 1024 * 1024
+
+
+def hashFile(path:Path) -> str:
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class CardKeys(object):
+    """Hashes of everything that affects a rendered card's pixels, so renders can be looked up by what went into them"""
+
+    def __init__(self, manifest:'AssetManifest'=None) -> None:
+        # (path, size, mtime) -> digest, so art shared between runs of the same process is only hashed once
+        self._fileDigests = dict()
+        self._environmentDigests = dict()
+        # When set, art it has already indexed is keyed by the digest it recorded rather than hashed again
+        self.manifest = manifest
+
+    def _digestFile(self, path:Path) -> str:
+        stat = os.stat(path)
+        fileKey = (str(path), stat.st_size, stat.st_mtime_ns)
+        if fileKey not in self._fileDigests:
+            digest = self.manifest.digest(path, stat) if self.manifest is not None else None
+            self._fileDigests[fileKey] = digest if digest is not None else hashFile(path)
+        return self._fileDigests[fileKey]
+
+    def _environmentDigest(self, sharedImages:imageDrawing.SplendidSharedAssetts) -> str:
+        """Digest of the inputs every card shares: shared icons, fonts and layout constants"""
+        # The source digests are part of the key, so shared images reloaded from edited files are never matched to the old ones
+        sources = tuple((name, self._digestFile(path)) for name, path in sorted(sharedImages.sourcePaths.items()))
+        cacheKey = (id(sharedImages), sources)
+        if cacheKey in self._environmentDigests:
+            return self._environmentDigests[cacheKey]
+
+        fonts = list()
+        for font in (imageDrawing.getFont(), imageDrawing.getFont(fontsize=35)):
+            # Pillow's built in default font has no file behind it, its name is the best we can do
+            fontPath = getattr(font, 'path', None)
+            fonts.append(self._digestFile(fontPath) if isinstance(fontPath, str) and os.path.isfile(fontPath) else repr(font.getname()))
+
+        environment = {
+            'rendererVersion': imageDrawing.RENDERER_VERSION,
+            'outputDpi': imageDrawing.OUTPUT_DPI,
+            'borderSize': imageDrawing.BORDER_SIZE,
+            'crop': imageDrawing.IMG_BORDER_CROP_SYMMETRICAL,
+            'resourceCardSize': imageDrawing.RESOURCE_CARD_SIZE_IN,
+            'vipCardSize': imageDrawing.VIP_CARD_SIZE_IN,
+            'colors': {resourceType.name: color for resourceType, color in imageDrawing.resourceTypeToPILColor.items()},
+            'sharedImages': dict(sources),
+            'fonts': fonts,
+        }
+        digest = hashlib.sha256(json.dumps(environment, sort_keys=True).encode()).hexdigest()
+        self._environmentDigests[cacheKey] = digest
+        return digest
+
+    def cardKey(self, card, sharedImages:imageDrawing.SplendidSharedAssetts) -> str:
+        # Blank and 0 costs lay out differently on VIP cards, so the costs are hashed exactly as given
+        fields = {
+            'costs': list(card.costVector),
+            'victoryPoints': card.victoryPoints,
+            'art': self._digestFile(card.imagePath),
+            'environment': self._environmentDigest(sharedImages),
+        }
+        if isinstance(card, ResourceCard):
+            fields['kind'] = 'resource'
+            fields['produces'] = card.produces.name
+            fields['level'] = card.level
+        elif isinstance(card, VIPCard):
+            fields['kind'] = 'vip'
+        else:
+            raise TypeError(f"Can't build a render cache key for {card}")
+
+        return hashlib.sha256(json.dumps(fields, sort_keys=True).encode()).hexdigest()
+
+
+class RenderCache(CardKeys):
+    """Persistent store of rendered card PNGs, addressed by a hash of everything that affects their pixels.
+
+    Entries are evicted least recently used first once the cache grows past maxBytes.
+    One cache can be shared by threads building different decks at once.
+    """
+
+    def __init__(self, cacheFolder:Path, maxBytes:int=DEFAULT_MAX_CACHE_BYTES, manifest:'AssetManifest'=None) -> None:
+        super().__init__(manifest)
+        self.cacheFolder = Path(cacheFolder)
+        self.cacheFolder.mkdir(parents=True, exist_ok=True)
+        self.maxBytes = maxBytes
+        self.hits = 0
+        self.misses = 0
+
+        # Entry name -> size, least recently used first. The folder is only scanned here, from then on the order is
+        # kept up to date as entries are used, with the mtimes carrying it over to the next run
+        entries = [(entry.stat(), entry.name) for entry in self.cacheFolder.glob("*.png")]
+        entries.sort(key=lambda entry: entry[0].st_mtime_ns)
+        self._entrySizes = OrderedDict((name, stat.st_size) for stat, name in entries)
+        self._totalBytes = sum(self._entrySizes.values())
+        # Held while an entry is read or written, so eviction never pulls one out from under another thread
+        self._lock = threading.Lock()
+
+    def fetch(self, key:str, outputPath:Path):
+        """Copies a cached render to outputPath and returns it, or None on a miss.
+
+        When outputPath is None the render is decoded and returned as an image. Handing out the entry's own path
+        would leave it to be evicted by the stores that follow before the caller got round to reading it.
+        """
+        entry = self.cacheFolder / f"{key}.png"
+        with self._lock:
+            if key + ".png" not in self._entrySizes:
+                self.misses += 1
+                return None
+
+            # Touch the entry so eviction sees it as recently used, in this run and the next
+            os.utime(entry)
+            self._entrySizes.move_to_end(key + ".png")
+            self.hits += 1
+            if outputPath is None:
+                with Image.open(entry) as image:
+                    return image.copy()
+            shutil.copyfile(entry, outputPath)
+        return outputPath
+
+    def store(self, key:str, rendered):
+        """Adds a render, given either as the path it was written to, the RawCard it was written to or as the image itself"""
+        entryName = key + ".png"
+        entry = self.cacheFolder / entryName
+        with self._lock:
+            if isinstance(rendered, Path):
+                shutil.copyfile(rendered, entry)
+            elif isinstance(rendered, RawCard):
+                image = rendered.open()
+                # Raw stores pad RGB out to RGBX, which PNG can't hold
+                imageDrawing.saveCardImage(image.convert("RGB") if image.mode == "RGBX" else image, entry)
+            else:
+                imageDrawing.saveCardImage(rendered, entry)
+            self._totalBytes += entry.stat().st_size - self._entrySizes.get(entryName, 0)
+            self._entrySizes[entryName] = entry.stat().st_size
+            self._entrySizes.move_to_end(entryName)
+            self._evict()
+
+    def evict(self):
+        with self._lock:
+            self._evict()
+
+    def _evict(self):
+        while self._totalBytes > self.maxBytes and self._entrySizes:
+            entryName, size = self._entrySizes.popitem(last=False)
+            self._totalBytes -= size
+            (self.cacheFolder / entryName).unlink(missing_ok=True)
+
+
+class MemoryRenderCache(CardKeys):
+    """Rendered cards held in memory under the same keys as RenderCache, for a long running process rebuilding the same decks.
+
+    Misses fall through to backing, a RenderCache, when one is given, and new renders are stored in it too.
+    prune() forgets every card that wasn't asked for since the last prune, so only the current decks stay in memory.
+    """
+
+    def __init__(self, backing:RenderCache=None, manifest:'AssetManifest'=None) -> None:
+        super().__init__(manifest)
+        self.backing = backing
+        self.entries = dict()
+        self._used = set()
+
+    def cardKey(self, card, sharedImages:imageDrawing.SplendidSharedAssetts) -> str:
+        if self.backing is not None:
+            # Shares the backing cache's file digests rather than hashing all the art a second time
+            return self.backing.cardKey(card, sharedImages)
+        return super().cardKey(card, sharedImages)
+
+    def fetch(self, key:str, outputPath:Path):
+        """The rendered card, or None on a miss. When outputPath is given the card is written there and outputPath returned."""
+        rendered = self.entries.get(key)
+        if rendered is None and self.backing is not None:
+            rendered = self.backing.fetch(key, None)
+            if rendered is not None:
+                self.entries[key] = rendered
+        if rendered is None:
+            return None
+
+        self._used.add(key)
+        if outputPath is None:
+            return rendered
+        if isinstance(rendered, Path):
+            shutil.copyfile(rendered, outputPath)
+        else:
+            imageDrawing.saveCardImage(rendered, outputPath)
+        return outputPath
+
+    def store(self, key:str, rendered):
+        self.entries[key] = rendered
+        self._used.add(key)
+        if self.backing is not None:
+            self.backing.store(key, rendered)
+
+    def prune(self) -> int:
+        """Drops the cards not used since the last prune, returning how many were dropped"""
+        unused = [key for key in self.entries if key not in self._used]
+        for key in unused:
+            del self.entries[key]
+        self._used = set()
+        return len(unused)
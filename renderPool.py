@@ -0,0 +1,109 @@
+import os
+import time
+import logging
+from pathlib import Path
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+from instrumentation import getTracer
+
+
+# Each worker process receives the shared assets once, when it starts, rather than with every card
+_workerSharedImages = None
+
+
+def _initWorker(sharedImages):
+    global _workerSharedImages
+    _workerSharedImages = sharedImages
+
+
+def _renderedFront(renderFunction, card, outputPath, sharedImages, cardStore=None):
+    """Renders one card, returning what was rendered along with how long it took.
+
+    With a cardStore, outputPath is one of its targets and the store writes the card, otherwise the render function does.
+    """
+    start = time.perf_counter()
+    if cardStore is not None and outputPath is not None:
+        rendered = cardStore.write(outputPath, renderFunction(card, None, sharedImages))
+    else:
+        cardImage = renderFunction(card, outputPath, sharedImages)
+        # Once the card is on disk its path is all anyone needs, and it's far cheaper to send back than the pixels
+        rendered = outputPath if outputPath is not None else cardImage
+    return rendered, time.perf_counter() - start
+
+
+def _renderInWorker(job):
+    renderFunction, card, outputPath, cardStore = job
+    return _renderedFront(renderFunction, card, outputPath, _workerSharedImages, cardStore)
+
+
+class RenderPool(object):
+    """Renders cards either in process or across a pool of worker processes.
+
+    workers <= 0 means one worker per core. A single worker renders in the calling process.
+    """
+
+    def __init__(self, sharedImages, workers=1) -> None:
+        self.sharedImages = sharedImages
+        self.workers = workers if workers > 0 else (os.cpu_count() or 1)
+        self.executor = None
+
+    def __enter__(self):
+        if self.workers > 1:
+            self.executor = ProcessPoolExecutor(
+                max_workers=self.workers,
+                initializer=_initWorker,
+                initargs=(self.sharedImages,)
+            )
+            logging.info(f"Rendering with {self.workers} worker processes")
+        return self
+
+    def __exit__(self, *exc):
+        if self.executor is not None:
+            self.executor.shutdown()
+            self.executor = None
+
+    def render(self, renderFunction, jobs:list[tuple[object, Path]], cardStore=None) -> list:
+        """Calls renderFunction(card, outputPath, sharedImages) for every job.
+
+        Returns, in job order, the output path of each card, or the rendered image for jobs whose outputPath is None.
+        With a cardStore (see cardStore.py) the outputPaths are its targets, and what it wrote is returned instead.
+        """
+        return list(self.renderIter(renderFunction, jobs, cardStore))
+
+    def renderIter(self, renderFunction, jobs:list[tuple[object, Path]], cardStore=None, memoryBudget=None):
+        """render, yielding each card as soon as it and every card before it are done.
+
+        With a memoryBudget (see memoryBudget.py) workers are only handed a card once there's room for it in
+        flight, so they can't run further ahead of whoever is consuming the cards than the budget allows.
+
+        jobs may be any iterable, such as cards still being parsed. Rendering in process or to a budget takes them
+        one at a time as it goes, a pool without a budget takes them all up front to split them into chunks.
+        """
+        if self.executor is None:
+            results = (_renderedFront(renderFunction, card, outputPath, self.sharedImages, cardStore) for card, outputPath in jobs)
+        elif memoryBudget is not None:
+            results = self._boundedResults(renderFunction, jobs, cardStore, memoryBudget)
+        else:
+            workerJobs = [(renderFunction, card, outputPath, cardStore) for card, outputPath in jobs]
+            if len(workerJobs) <= 1:
+                results = (_renderedFront(renderFunction, card, outputPath, self.sharedImages, cardStore) for _, card, outputPath, _ in workerJobs)
+            else:
+                # A few chunks per worker keeps the pickling overhead low without leaving cores idle at the tail
+                chunksize = max(1, len(workerJobs) // (self.workers * 4))
+                results = self.executor.map(_renderInWorker, workerJobs, chunksize=chunksize)
+
+        tracer = getTracer()
+        for rendered, seconds in results:
+            tracer.recordCardLatency(renderFunction.__name__, seconds)
+            yield rendered
+
+    def _boundedResults(self, renderFunction, jobs, cardStore, memoryBudget):
+        # Submitted one card at a time, executor.map would queue the whole deck up front and keep every result until it's read
+        pending = deque()
+        for card, outputPath in jobs:
+            while len(pending) >= memoryBudget.inFlightLimit():
+                yield pending.popleft().result()
+            pending.append(self.executor.submit(_renderInWorker, (renderFunction, card, outputPath, cardStore)))
+        while pending:
+            yield pending.popleft().result()
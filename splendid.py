@@ -1,5 +1,6 @@
 from pathlib import Path
 from enum import Enum
+from array import array
 
 
 class ResourceType(Enum):
@@ -17,7 +18,30 @@ class ResourceType(Enum):
     def allButAvatar(cls):
         return [ResourceType.Air, ResourceType.Water, ResourceType.Earth, ResourceType.Fire, ResourceType.WhiteLotus]
 
+# Cards keep what they require as one slot per resource type, in ResourceType.allButAvatar() order
+COST_ORDER = ResourceType.allButAvatar()
+COST_INDEX = {resourceType: index for index, resourceType in enumerate(COST_ORDER)}
+# Marks a cost that was left blank, which isn't the same as an explicit 0
+NO_COST = -1
+# Costs are held as signed chars, and so are a Deck's levels and victory points
+MAX_COST = 127
+
+
+def requiresToCostVector(requires:dict[ResourceType,int]) -> array:
+    costs = array('b', [NO_COST]*len(COST_ORDER))
+    for resourceType, count in requires.items():
+        if not 0 <= count <= MAX_COST:
+            raise ValueError(f"{resourceType.name} cost {count} is outside 0 to {MAX_COST}")
+        costs[COST_INDEX[resourceType]] = count
+    return costs
+
+
+def costVectorToRequires(costs) -> dict[ResourceType,int]:
+    return {resourceType: count for resourceType, count in zip(COST_ORDER, costs) if count != NO_COST}
+
+
 class ResourceToken(object):
+    __slots__ = ('resourceType', 'imagePath', 'renderedFrontImage')
     resourceType:ResourceType
     imagePath: Path
     renderedFrontImage:Path
@@ -28,14 +52,25 @@ class ResourceToken(object):
         self.renderedFrontImage = None
 
 class VIPCard(object):
-    requires:dict[ResourceType,int]
+    __slots__ = ('costVector', 'victoryPoints', 'imagePath', 'renderedFrontImage', 'renderedBackImage')
+    costVector:array
     victoryPoints:int
     imagePath: Path
 
     def __init__(self, requires:dict[ResourceType,int], victoryPoints:int) -> None:
-        self.requires = requires
+        self.costVector = requiresToCostVector(requires)
         self.victoryPoints = victoryPoints
         self.imagePath = None
+        self.renderedFrontImage = None
+        self.renderedBackImage = None
+
+    @property
+    def requires(self) -> dict[ResourceType,int]:
+        return costVectorToRequires(self.costVector)
+
+    @requires.setter
+    def requires(self, requires:dict[ResourceType,int]):
+        self.costVector = requiresToCostVector(requires)
 
     def __repr__(self) -> str:
         resrouceStrings = list() 
@@ -47,8 +82,9 @@ class VIPCard(object):
     
 
 class ResourceCard(object):
+    __slots__ = ('produces', 'costVector', 'victoryPoints', 'level', 'imagePath', 'renderedFrontImage', 'renderedBackImage')
     produces:ResourceType
-    requires:dict[ResourceType,int]
+    costVector:array
     victoryPoints:int
     level:int
     imagePath: Path
@@ -57,13 +93,21 @@ class ResourceCard(object):
 
     def __init__(self, produces:ResourceType, requires:dict[ResourceType,int], level:int, victoryPoints:int) -> None:
         self.produces = produces
-        self.requires = requires
+        self.costVector = requiresToCostVector(requires)
         self.victoryPoints = victoryPoints
         self.level = level
         self.imagePath = None
         self.renderedFrontImage = None
         self.renderedBackImage = None
 
+    @property
+    def requires(self) -> dict[ResourceType,int]:
+        return costVectorToRequires(self.costVector)
+
+    @requires.setter
+    def requires(self, requires:dict[ResourceType,int]):
+        self.costVector = requiresToCostVector(requires)
+
 
     def __repr__(self) -> str:
         resrouceStrings = list() 
@@ -72,4 +116,60 @@ class ResourceCard(object):
                 continue
             resrouceStrings.append(f"{resource}: {count}")
         return f"Splendid.ResourceCard(level: {self.level}, produces: {self.produces}, VP: {self.victoryPoints}, requires:[{', '.join(resrouceStrings)}], imagePath: {self.imagePath}"
-        
+
+
+class Deck(object):
+    """Many cards of one type, stored as parallel columns instead of one object per card.
+
+    costs is flat, holding each card's cost vector back to back. produces and level are 0 for VIP cards.
+    Indexing builds a card object from its row, changes made to that card aren't written back.
+    """
+
+    def __init__(self, cardType, cards=()) -> None:
+        self.cardType = cardType
+        self.produces = array('b')
+        self.levels = array('b')
+        self.victoryPoints = array('b')
+        self.costs = array('b')
+        self.imagePaths = list()
+        for card in cards:
+            self.append(card)
+
+    def append(self, card):
+        if not isinstance(card, self.cardType):
+            raise TypeError(f"Deck of {self.cardType.__name__} can't hold {card}")
+        level = card.level if self.cardType is ResourceCard else 0
+        for name, value in (('level', level), ('victory points', card.victoryPoints)):
+            if not 0 <= value <= MAX_COST:
+                raise ValueError(f"{name} {value} of {card} is outside 0 to {MAX_COST}")
+        if self.cardType is ResourceCard:
+            self.produces.append(card.produces.value)
+            self.levels.append(card.level)
+        else:
+            self.produces.append(0)
+            self.levels.append(0)
+        self.victoryPoints.append(card.victoryPoints)
+        self.costs.extend(card.costVector)
+        self.imagePaths.append(card.imagePath)
+
+    def __len__(self) -> int:
+        return len(self.victoryPoints)
+
+    def __getitem__(self, index:int):
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError(f"Deck index {index} out of range")
+
+        if self.cardType is ResourceCard:
+            card = ResourceCard(produces=ResourceType(self.produces[index]), requires={}, level=self.levels[index], victoryPoints=self.victoryPoints[index])
+        else:
+            card = VIPCard(requires={}, victoryPoints=self.victoryPoints[index])
+        start = index*len(COST_ORDER)
+        card.costVector = self.costs[start:start+len(COST_ORDER)]
+        card.imagePath = self.imagePaths[index]
+        return card
+
+    def __iter__(self):
+        for index in range(len(self)):
+            yield self[index]
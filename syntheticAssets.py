@@ -0,0 +1,107 @@
+import os
+import csv
+import random
+from pathlib import Path
+
+from PIL import Image, ImageOps, ImageDraw
+
+from splendid import COST_ORDER
+from deckLoader import conversionColorToResourceType, requirementColumns
+from assetGetter import AssetGetter
+
+
+ART_SIZE = (1920, 1080)
+VIP_ART_SIZE = (800, 800)
+# Only this many distinct images are drawn per folder, the rest are hard links to them so big decks stay cheap on disk
+UNIQUE_ART_PER_FOLDER = 8
+
+resourceTypeToColorName = {resourceType: color for color, resourceType in conversionColorToResourceType.items()}
+
+
+def _tintedGradient(size:tuple[int,int], rng:random.Random) -> Image:
+    """A gradient rather than a flat fill, so decoding and resizing cost something like real art does"""
+    gradient = Image.linear_gradient("L").rotate(rng.randrange(360))
+    dark = tuple(rng.randrange(128) for _ in range(3))
+    light = tuple(rng.randrange(128, 256) for _ in range(3))
+    return ImageOps.colorize(gradient, dark, light).resize(size)
+
+
+def _icon(size:tuple[int,int], rng:random.Random) -> Image:
+    icon = Image.new("RGBA", size, (0, 0, 0, 0))
+    disc = Image.new("RGBA", size, tuple(rng.randrange(256) for _ in range(3)) + (255,))
+    mask = Image.new("L", size, 0)
+    ImageDraw.Draw(mask).ellipse((0, 0, size[0]-1, size[1]-1), fill=255)
+    icon.paste(disc, (0, 0), mask)
+    return icon
+
+
+def _writeFolder(folder:Path, count:int, size:tuple[int,int], rng:random.Random):
+    folder.mkdir(parents=True, exist_ok=True)
+    for i in range(count):
+        path = folder / f"{i}.png"
+        if i < UNIQUE_ART_PER_FOLDER:
+            _tintedGradient(size, rng).save(path, compress_level=1)
+        else:
+            path.unlink(missing_ok=True)
+            os.link(folder / f"{i % UNIQUE_ART_PER_FOLDER}.png", path)
+
+
+def generateDeckCsvs(assetsPath:Path, resourceCardCount:int, vipCardCount:int, rng:random.Random) -> dict:
+    """Writes resourceCards.csv and VIPCardsTriple.csv, returning how many resource cards produce each resource type"""
+    colors = [color for color, _ in requirementColumns]
+    producedCounts = {resourceType: 0 for resourceType in COST_ORDER}
+
+    with open(assetsPath / "resourceCards.csv", 'w', newline='\n') as csvfile:
+        writer = csv.writer(csvfile, quotechar="'")
+        writer.writerow(['Card Level', 'VP', 'Generates'] + colors)
+        for _ in range(resourceCardCount):
+            level = rng.randint(1, 3)
+            produces = rng.choice(COST_ORDER)
+            producedCounts[produces] += 1
+            costs = [''] * len(colors)
+            for column in rng.sample(range(len(colors)), rng.randint(1, 4)):
+                costs[column] = str(rng.randint(1, level + 3))
+            writer.writerow([level, rng.randint(0, level + 1), resourceTypeToColorName[produces]] + costs)
+
+    with open(assetsPath / "VIPCardsTriple.csv", 'w', newline='\n') as csvfile:
+        writer = csv.writer(csvfile, quotechar="'")
+        writer.writerow(['Victor Points'] + colors)
+        for _ in range(vipCardCount):
+            costs = [''] * len(colors)
+            for column in rng.sample(range(len(colors)), 3):
+                costs[column] = str(rng.randint(3, 4))
+            writer.writerow([3] + costs)
+
+    return producedCounts
+
+
+def generateAssets(assetsPath:Path, resourceCardCount:int, vipCardCount:int=10, seed:int=0) -> tuple[Path, Path]:
+    """Builds an assets folder laid out like the real one, with enough art for every card in the generated CSVs.
+
+    Returns the paths of the resource card and VIP card CSVs.
+    """
+    rng = random.Random(seed)
+    assetsPath = Path(assetsPath)
+    assetsPath.mkdir(parents=True, exist_ok=True)
+
+    producedCounts = generateDeckCsvs(assetsPath, resourceCardCount, vipCardCount, rng)
+
+    assetGetter = AssetGetter(assetsPath)
+    for resourceType in COST_ORDER:
+        iconPath = assetGetter.getResourceImagePath(resourceType)
+        iconPath.parent.mkdir(parents=True, exist_ok=True)
+        _icon((128, 128), rng).save(iconPath)
+        _writeFolder(assetGetter.resourceTypeToResourceCardFolder[resourceType], producedCounts[resourceType], ART_SIZE, rng)
+
+    _writeFolder(assetsPath / "VIP Images", vipCardCount, VIP_ART_SIZE, rng)
+
+    avatarFolder = assetsPath / "Avatar Coins"
+    avatarFolder.mkdir(parents=True, exist_ok=True)
+    for i in range(5):
+        _icon((256, 256), rng).save(avatarFolder / f"{i}.png")
+
+    _icon((40, 40), rng).save(assetGetter.getLevelIcon())
+    _tintedGradient((1200, 675), rng).save(assetGetter.getResourceCardBackPath())
+    _tintedGradient((750, 750), rng).save(assetGetter.getVipCardBackImageRaw())
+
+    return assetsPath / "resourceCards.csv", assetsPath / "VIPCardsTriple.csv"
@@ -1,9 +1,25 @@
+import tempfile
 import unittest
-from main import *
+from collections import Counter
+from assetGetter import *
+from main import loadResourceCardsFromCsv
+from syntheticAssets import generateAssets
 
 class TestStringMethods(unittest.TestCase):
-    
-    assetGetter = AssetGetter(Path("assets"))
+
+    @classmethod
+    def setUpClass(cls):
+        cls.folder = tempfile.TemporaryDirectory()
+        assetsPath = Path(cls.folder.name)
+        resourceCardsCSV, _ = generateAssets(assetsPath, resourceCardCount=20, vipCardCount=10)
+        cls.assetGetter = AssetGetter(assetsPath)
+        resourceCards, _ = loadResourceCardsFromCsv(resourceCardsCSV)
+        # generateAssets draws one piece of art for every card producing a resource
+        cls.cardsProducing = Counter(card.produces for card in resourceCards)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.folder.cleanup()
 
     def test_getLevelIcon(self):
         imagePath = self.assetGetter.getLevelIcon()
@@ -48,7 +64,7 @@ class TestStringMethods(unittest.TestCase):
             if (type == ResourceType.Avatar):
                 continue
             imagePaths = self.assetGetter.getResourceCardImagePaths(type)
-            assert len(imagePaths) >= 30
+            assert len(imagePaths) == self.cardsProducing[type]
             for imagePath in imagePaths:
                 assert imagePath.is_file()
         
@@ -0,0 +1,264 @@
+import io
+import tempfile
+import unittest
+import weakref
+from pathlib import Path
+from unittest import mock
+
+from PIL import Image
+from reportlab import rl_config
+from reportlab.pdfgen.canvas import Canvas
+
+import PDFMaker
+from PDFMaker import Imposer, PdfMaker, PlacedImages, US_LETTER_IN, POINTS_PER_IN, MARGIN_IN_PTS
+from memoryBudget import MemoryBudget
+
+RESOURCE_CARD = (4*POINTS_PER_IN, 2.25*POINTS_PER_IN)
+VIP_CARD = (2.5*POINTS_PER_IN, 2.5*POINTS_PER_IN)
+
+
+def overlaps(a, b):
+    return a.x < b.x+b.pageWidth and b.x < a.x+a.pageWidth and a.y < b.y+b.pageHeight and b.y < a.y+a.pageHeight
+
+
+class TestPlacedImages(unittest.TestCase):
+
+    def test_repeatedBackIsEmbeddedOnce(self):
+        with tempfile.TemporaryDirectory() as folder:
+            backPath = Path(folder) / "back.png"
+            Image.effect_noise((60, 34), 64).convert("RGB").save(backPath)
+            for back in (backPath, Image.open(backPath)):
+                output = io.BytesIO()
+                placedImages = PlacedImages(Canvas(output))
+                for page in range(2):
+                    for i in range(5):
+                        placedImages.draw(back, 10 + 70*i, 10, 60, 34, rotation=90*i)
+                    placedImages.canvas.showPage()
+                placedImages.canvas.save()
+
+                assert (placedImages.distinctImages, placedImages.placements) == (1, 10)
+                assert placedImages.bytesEmbedded > 0
+                assert placedImages.bytesSaved == 9 * placedImages.bytesEmbedded
+                assert output.getvalue().count(b"/Subtype /Image") == 1
+
+
+class TestImposer(unittest.TestCase):
+
+    def setUp(self):
+        self.imposer = Imposer(US_LETTER_IN[1]*POINTS_PER_IN, US_LETTER_IN[0]*POINTS_PER_IN)
+
+    def assertValidPage(self, imposer, page):
+        placements = [placement for _, placement in page]
+        for i, placement in enumerate(placements):
+            assert placement.x >= MARGIN_IN_PTS - 1e-6 and placement.x + placement.pageWidth <= imposer.pageWidth - MARGIN_IN_PTS + 1e-6
+            assert placement.y >= MARGIN_IN_PTS - 1e-6 and placement.y + placement.pageHeight <= imposer.pageHeight - MARGIN_IN_PTS + 1e-6
+            for other in placements[i+1:]:
+                assert not overlaps(placement, other)
+
+    def test_rotationFitsMoreThanTheGrid(self):
+        pages = self.imposer.impose([RESOURCE_CARD] * 14)
+        # The upright grid fits 6 resource cards on landscape Letter
+        assert [len(page) for page in pages] == [7, 7]
+        assert any(placement.rotation for _, placement in pages[0])
+        self.assertValidPage(self.imposer, pages[0])
+
+        upright = Imposer(self.imposer.pageWidth, self.imposer.pageHeight, allowRotation=False).impose([RESOURCE_CARD] * 14)
+        assert len(upright[0]) == 6
+        assert not any(placement.rotation for _, placement in upright[0])
+
+    def test_mixedSizesShareSheets(self):
+        cardSizes = [VIP_CARD] * 3 + [RESOURCE_CARD] * 10
+        pages = self.imposer.impose(cardSizes)
+        assert sorted(cardIndex for page in pages for cardIndex, _ in page) == list(range(len(cardSizes)))
+        for page in pages:
+            self.assertValidPage(self.imposer, page)
+            for cardIndex, placement in page:
+                assert (placement.width, placement.height) == cardSizes[cardIndex]
+
+    def test_gutterAndBleedKeepCardsApart(self):
+        imposer = Imposer(self.imposer.pageWidth, self.imposer.pageHeight, gutter=9, bleed=4.5)
+        page = imposer.impose([VIP_CARD] * 12)[0]
+        placements = [placement for _, placement in page]
+        for i, placement in enumerate(placements):
+            for other in placements[i+1:]:
+                gapX = max(other.x - placement.x - placement.pageWidth, placement.x - other.x - other.pageWidth)
+                gapY = max(other.y - placement.y - placement.pageHeight, placement.y - other.y - other.pageHeight)
+                assert max(gapX, gapY) >= 9 + 2*4.5 - 1e-6
+
+    def test_gridPagesKeepTheirOldSpacing(self):
+        imposer = Imposer(self.imposer.pageWidth, self.imposer.pageHeight, allowRotation=False)
+        cardWidth, cardHeight = RESOURCE_CARD
+        # The spacing generateTiledCoordinates gave: the room left over shared out, half either side of every card
+        usableWidth = imposer.pageWidth - 2*MARGIN_IN_PTS
+        usableHeight = imposer.pageHeight - 2*MARGIN_IN_PTS
+        columns, rows = int(usableWidth // cardWidth), int(usableHeight // cardHeight)
+        paddingX = (usableWidth - columns*cardWidth) / columns
+        paddingY = (usableHeight - rows*cardHeight) / rows
+        expected = {(round(MARGIN_IN_PTS + paddingX/2 + column*(cardWidth + paddingX), 6), round(MARGIN_IN_PTS + paddingY/2 + row*(cardHeight + paddingY), 6))
+                    for column in range(columns) for row in range(rows)}
+
+        full, partial = imposer.impose([RESOURCE_CARD] * 8)
+        assert {(round(placement.x, 6), round(placement.y, 6)) for _, placement in full} == expected
+        assert {(round(placement.x, 6), round(placement.y, 6)) for _, placement in partial} <= expected
+
+        # A gutter asks for the cards to be packed that far apart instead
+        packed = Imposer(imposer.pageWidth, imposer.pageHeight, gutter=0, allowRotation=False).impose([RESOURCE_CARD] * 6)[0]
+        assert min(placement.x for _, placement in packed) > MARGIN_IN_PTS + paddingX/2
+
+    def test_backsMirrorTheirFronts(self):
+        for _, front in self.imposer.impose([RESOURCE_CARD] * 7)[0]:
+            back = self.imposer.backPlacement(front)
+            assert back.x == front.x
+            assert back.y + back.pageHeight == self.imposer.pageHeight - front.y
+            assert (back.pageWidth, back.pageHeight) == (front.pageWidth, front.pageHeight)
+            assert back.rotation == -front.rotation % 360
+
+    def test_oversizedCardIsRejected(self):
+        with self.assertRaises(ValueError):
+            self.imposer.impose([(20*POINTS_PER_IN, 2*POINTS_PER_IN)])
+
+    def test_pdfMakerWritesBinaryStreams(self):
+        useA85 = rl_config.useA85
+        self.addCleanup(setattr, rl_config, 'useA85', useA85)
+        rl_config.useA85 = 1
+        PdfMaker(US_LETTER_IN[1], US_LETTER_IN[0])
+        assert rl_config.useA85 == 0
+
+    def test_makeMixedPDF(self):
+        front = Image.new("RGB", (60, 34), "red")
+        back = Image.new("RGB", (60, 34), "blue")
+        with tempfile.TemporaryDirectory() as folder:
+            outputPath = Path(folder) / "cards.pdf"
+            pdfMaker = PdfMaker(US_LETTER_IN[1], US_LETTER_IN[0], bleedInInches=0.125)
+            pdfMaker.makeMixedPDF([(front, back, (4, 2.25))] * 8 + [(back, None, (2.5, 2.5))], outputPath)
+            assert outputPath.read_bytes().startswith(b"%PDF")
+
+
+    def test_bleedScalesTheArtEvenly(self):
+        canvas = mock.MagicMock()
+        placedImages = mock.MagicMock(canvas=canvas)
+        image = Image.new("RGB", (60, 34), "red")
+        for rotation in (0, 90):
+            placement = PDFMaker.Placement(100, 50, 288, 162, rotation)
+            PDFMaker.drawCard(placedImages, image, placement, 9)
+            _, x, y, width, height, drawnRotation = placedImages.draw.call_args.args
+            assert drawnRotation == rotation
+            assert abs(width/height - 288/162) < 1e-9
+            # Covers the card and its bleed on every side
+            pageWidth, pageHeight = (height, width) if rotation else (width, height)
+            assert x <= 100 - 9 and x + pageWidth >= 100 + placement.pageWidth + 9
+            assert y <= 50 - 9 and y + pageHeight >= 50 + placement.pageHeight + 9
+            # and is cut back to it
+            canvas.beginPath.return_value.rect.assert_called_with(100 - 9, 50 - 9, placement.pageWidth + 18, placement.pageHeight + 18)
+            assert canvas.clipPath.called
+
+    def test_streamPDFDrawsEachSheetAsItsCardsArrive(self):
+        pulled = list()
+        def cards():
+            for i in range(15):
+                pulled.append(i)
+                yield (Image.new("RGB", (60, 34), (i*10, 0, 0)), None)
+
+        pulledAtEachSheet = list()
+        drawSheet = PDFMaker.drawSheet
+        def recordingDrawSheet(placedImages, fronts, backs, bleed):
+            pulledAtEachSheet.append((len(pulled), len(fronts)))
+            drawSheet(placedImages, fronts, backs, bleed)
+
+        with tempfile.TemporaryDirectory() as folder, mock.patch.object(PDFMaker, 'drawSheet', recordingDrawSheet):
+            PdfMaker(US_LETTER_IN[1], US_LETTER_IN[0]).streamPDF(cards(), Path(folder) / "cards.pdf", (4, 2.25))
+        # 7 resource cards to a sheet
+        assert pulledAtEachSheet == [(7, 7), (14, 7), (15, 1)]
+
+    def test_streamPDFKeepsNoFrontsPastTheirSheet(self):
+        fronts = list()
+        aliveAtEachCard = list()
+        def alive():
+            return sum(front() is not None for front in fronts)
+        def cards():
+            for i in range(50):
+                front = Image.new("RGB", (60, 34), (i*5, 0, 0))
+                fronts.append(weakref.ref(front))
+                aliveAtEachCard.append(alive())
+                yield (front, None)
+                del front
+
+        with tempfile.TemporaryDirectory() as folder:
+            pdfMaker = PdfMaker(US_LETTER_IN[1], US_LETTER_IN[0])
+            pdfMaker.streamPDF(cards(), Path(folder) / "cards.pdf", (4, 2.25))
+        # Never more than the 7 cards of the sheet being filled, and the one just handed over
+        assert max(aliveAtEachCard) <= 8
+        assert alive() == 0
+
+    def test_boundedStreamPDFSplitsIntoVolumesAndReleasesFronts(self):
+        fronts = [Image.effect_noise((60, 34), 64 + i) for i in range(15)]
+        back = Image.new("RGB", (60, 34), "blue")
+        # A budget this small lets every PDF volume take a single sheet
+        memoryBudget = MemoryBudget(maxRssBytes=4)
+        with tempfile.TemporaryDirectory() as folder:
+            outputPath = Path(folder) / "cards.pdf"
+            staleVolume = Path(folder) / "cards_4.pdf"
+            staleVolume.write_bytes(b"%PDF")
+
+            volumes = PdfMaker(US_LETTER_IN[1], US_LETTER_IN[0]).streamPDF(((front, back) for front in fronts), outputPath, (4, 2.25), memoryBudget)
+            assert volumes == [outputPath, Path(folder) / "cards_2.pdf", Path(folder) / "cards_3.pdf"]
+            assert all(volume.read_bytes().startswith(b"%PDF") for volume in volumes)
+            assert not staleVolume.exists()
+
+        for front in fronts:
+            with self.assertRaises(ValueError):
+                front.getpixel((0, 0))
+        # The back is shared between cards, it's theirs to let go of
+        back.getpixel((0, 0))
+
+    @unittest.skipUnless(PDFMaker.pdfMergeAvailable(), "pypdf isn't installed")
+    def test_chunkedDocumentsKeepPageOrder(self):
+        import pypdf
+
+        with tempfile.TemporaryDirectory() as folder:
+            folder = Path(folder)
+            cards = list()
+            for i in range(40):
+                imagePath = folder / f"{i}.png"
+                Image.new("RGB", (60, 34), (i*6, 0, 0)).save(imagePath)
+                cards.append((imagePath, folder / "0.png", (4, 2.25)))
+
+            PdfMaker(US_LETTER_IN[1], US_LETTER_IN[0]).makeMixedPDF(cards, folder / "serial.pdf")
+            with mock.patch.object(PDFMaker, 'MIN_SHEETS_PER_CHUNK', 2):
+                PdfMaker(US_LETTER_IN[1], US_LETTER_IN[0], workers=2).makeDocuments([(cards, folder / "chunked.pdf"), (cards[:3], folder / "small.pdf")])
+
+            def pageImages(path):
+                return [[image.data for image in page.images] for page in pypdf.PdfReader(str(path)).pages]
+            assert pageImages(folder / "chunked.pdf") == pageImages(folder / "serial.pdf")
+            assert len(pypdf.PdfReader(str(folder / "small.pdf")).pages) == 2
+
+    @unittest.skipUnless(PDFMaker.pdfMergeAvailable(), "pypdf isn't installed")
+    def test_cachedPDFRedrawsOnlyChangedSheets(self):
+        import pypdf
+
+        cards = [(Image.new("RGB", (60, 34), (i*6, 0, 0)), None, (4, 2.25)) for i in range(20)]
+        cardKeys = list(range(20))
+        with tempfile.TemporaryDirectory() as folder:
+            outputPath = Path(folder) / "cards.pdf"
+            pdfMaker = PdfMaker(US_LETTER_IN[1], US_LETTER_IN[0])
+            sheetCache = PDFMaker.SheetCache()
+            assert pdfMaker.makeCachedPDF(cards, cardKeys, outputPath, sheetCache) == 3
+            sheetCache.prune()
+
+            cards[9] = (Image.new("RGB", (60, 34), "green"), None, (4, 2.25))
+            cardKeys[9] = "edited"
+            assert pdfMaker.makeCachedPDF(cards, cardKeys, outputPath, sheetCache) == 1
+            assert sheetCache.prune() == 1
+
+            pdfMaker.makeMixedPDF(cards, Path(folder) / "full.pdf")
+            def pageImages(path):
+                return [[image.image.tobytes() for image in page.images] for page in pypdf.PdfReader(str(path)).pages]
+            assert pageImages(outputPath) == pageImages(Path(folder) / "full.pdf")
+
+            modified = outputPath.stat().st_mtime_ns
+            assert pdfMaker.makeCachedPDF(cards, cardKeys, outputPath, sheetCache) == 0
+            assert outputPath.stat().st_mtime_ns == modified
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,63 @@
+import os
+import shutil
+import tempfile
+import unittest
+from pathlib import Path
+
+from PIL import Image
+
+from assetManifest import AssetManifest
+from assetGetter import AssetGetter
+from splendid import ResourceType
+
+
+class TestAssetManifest(unittest.TestCase):
+
+    def setUp(self):
+        self.assetsPath = Path(tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, self.assetsPath)
+        self.manifestPath = self.assetsPath / "manifest.json"
+        self.vipFolder = self.assetsPath / "VIP Images"
+        self.vipFolder.mkdir()
+        for name, size in (("b.png", (30, 20)), ("a.png", (10, 10)), ("c.png", (5, 8))):
+            Image.new("RGB", size, "red").save(self.vipFolder / name)
+        (self.vipFolder / "notes.txt").write_text("not art")
+
+    def test_listsSortedAndDescribesFiles(self):
+        manifest = AssetManifest(self.assetsPath, self.manifestPath)
+        paths = manifest.listFolder(self.vipFolder)
+        assert [path.name for path in paths] == ["a.png", "b.png", "c.png"]
+
+        entry = manifest.describe(self.vipFolder / "b.png")
+        assert (entry['width'], entry['height'], entry['mode']) == (30, 20, "RGB")
+        assert len(entry['sha256']) == 64
+        # Proxies and other files outside the assets folder are never indexed
+        assert manifest.describe(self.assetsPath.parent / "elsewhere.png") is None
+
+    def test_onlyChangedFilesAreReindexed(self):
+        manifest = AssetManifest(self.assetsPath, self.manifestPath)
+        manifest.listFolder(self.vipFolder)
+        manifest.save()
+
+        Image.new("RGB", (12, 12), "blue").save(self.vipFolder / "a.png")
+        os.utime(self.vipFolder / "a.png", ns=(1, 1))
+        (self.vipFolder / "c.png").unlink()
+        (self.vipFolder / "d.png").write_bytes(b"broken")
+
+        reloaded = AssetManifest(self.assetsPath, self.manifestPath)
+        paths = reloaded.listFolder(self.vipFolder)
+        assert [path.name for path in paths] == ["a.png", "b.png", "d.png"]
+        assert reloaded.indexed == 2
+        assert reloaded.describe(self.vipFolder / "a.png")['width'] == 12
+        assert reloaded.describe(self.vipFolder / "c.png") is None
+        assert reloaded.unreadableAssets() == [self.vipFolder / "d.png"]
+
+    def test_assetGetterUsesManifest(self):
+        manifest = AssetManifest(self.assetsPath, self.manifestPath)
+        withManifest = AssetGetter(self.assetsPath, manifest=manifest).getVipImagePaths()
+        assert withManifest == AssetGetter(self.assetsPath).getVipImagePaths()
+        assert AssetGetter(self.assetsPath, manifest=manifest).getResourceCardImagePaths(ResourceType.Air) == []
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,86 @@
+import json
+import tempfile
+import unittest
+from pathlib import Path
+
+from PIL import Image
+
+import main
+from assetGetter import AssetGetter
+from atlasMaker import AtlasMaker
+from syntheticAssets import generateAssets
+
+# 30 x 15 pixels at the output DPI
+SMALL_CARD_IN = (0.2, 0.1)
+
+
+class TestAtlasMaker(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.TemporaryDirectory()
+        self.path = Path(self.folder.name)
+
+    def tearDown(self):
+        self.folder.cleanup()
+
+    def test_cardsFillSheetsAndIndexMapsThemToCells(self):
+        fronts = [Image.new("RGB", (30, 15), (i*10, 255-i*10, i)) for i in range(20)]
+        upsideDown = Image.new("RGB", (30, 15), "black")
+        upsideDown.putpixel((0, 0), (255, 0, 0))
+        backPath = self.path / "back.png"
+        Image.new("RGB", (30, 15), "blue").save(backPath)
+        cards = [(front, upsideDown if i % 2 else backPath) for i, front in enumerate(fronts)]
+        expected = [front.copy() for front in fronts]
+        (self.path / "Deck_3.png").touch()
+
+        # 3 columns and 6 rows fit in 100 x 100, so 20 cards take a full sheet and one row of another
+        index = AtlasMaker((100, 100)).makeAtlas(iter(cards), self.path, "Deck", SMALL_CARD_IN)
+
+        assert (index['columns'], index['rows']) == (3, 6)
+        assert [(sheet['file'], sheet['size'], sheet['cards']) for sheet in index['sheets']] == [("Deck_1.png", [90, 90], 18), ("Deck_2.png", [90, 15], 2)]
+        assert not (self.path / "Deck_3.png").exists()
+        assert json.loads((self.path / "Deck.json").read_text()) == index
+
+        sheets = [Image.open(self.path / sheet['file']) for sheet in index['sheets']]
+        for cell, card in zip(index['cards'], expected):
+            assert list(sheets[cell['sheet']].crop(cell['box']).getdata()) == list(card.getdata())
+        assert index['cards'][19] == {'sheet': 1, 'cell': 1, 'column': 1, 'row': 0, 'box': [30, 0, 60, 15], 'back': 1}
+
+        # Each back is written once, turned upright again
+        assert [card['back'] for card in index['cards'][:4]] == [0, 1, 0, 1]
+        assert [back['file'] for back in index['backs']] == ["Deck_back_1.png", "Deck_back_2.png"]
+        assert Image.open(self.path / "Deck_back_2.png").getpixel((29, 14)) == (255, 0, 0)
+        with self.assertRaises(ValueError):
+            fronts[0].load()
+
+    def test_transparentArtIsFlattenedForJpeg(self):
+        front = Image.new("RGBA", (30, 15), (255, 255, 255, 255))
+        front.paste((255, 255, 255, 0), (0, 0, 15, 15))
+        back = Image.new("RGBA", (30, 15), (0, 0, 255, 0))
+        index = AtlasMaker((100, 100), imageFormat='jpg').makeAtlas(iter([(front, back)]), self.path, "Deck", SMALL_CARD_IN)
+
+        sheet = Image.open(self.path / index['sheets'][0]['file'])
+        assert sheet.mode == "RGB"
+        # Transparent on the left, white on the right, give or take JPEG's losses
+        assert max(sheet.getpixel((5, 7))) < 16 and min(sheet.getpixel((25, 7))) > 240
+        assert max(Image.open(self.path / "Deck_back_1.jpg").getpixel((15, 7))) < 16
+
+    def test_cardTooBigForSheet(self):
+        with self.assertRaises(ValueError):
+            AtlasMaker((20, 100)).makeAtlas(iter([]), self.path, "Deck", SMALL_CARD_IN)
+
+    def test_buildWritesAtlasInsteadOfPdfs(self):
+        resourceCardsCSV, vipCardsCSV = generateAssets(self.path / "assets", resourceCardCount=4, vipCardCount=2)
+        output = self.path / "output"
+        main.main(output, AssetGetter(self.path / "assets"), resourceCardsCSV, vipCardsCSV, atlasMaker=AtlasMaker(imageFormat='jpg'))
+
+        resourceIndex = json.loads((output / "atlas" / "ResourceCards.json").read_text())
+        vipIndex = json.loads((output / "atlas" / "VIPCards.json").read_text())
+        assert (len(resourceIndex['cards']), len(vipIndex['cards'])) == (4, 2)
+        # The last sheet keeps the full width of the grid, so tools cut it up the same as the others
+        assert Image.open(output / "atlas" / "VIPCards_1.jpg").size == (3750, 375)
+        assert not list(output.glob("*.pdf"))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,60 @@
+import json
+import tempfile
+import unittest
+from pathlib import Path
+
+from batchBuild import BatchBuilder, loadManifest
+from renderCache import RenderCache
+from syntheticAssets import generateAssets
+
+
+class TestBatchBuild(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.TemporaryDirectory()
+        self.path = Path(self.folder.name)
+
+    def tearDown(self):
+        self.folder.cleanup()
+
+    def writeManifest(self, manifest:dict) -> Path:
+        manifestPath = self.path / "manifest.json"
+        manifestPath.write_text(json.dumps(manifest))
+        return manifestPath
+
+    def test_manifestDefaultsAndPaths(self):
+        jobs = loadManifest(self.writeManifest({
+            'defaults': {'paper': "a4"},
+            'jobs': [{'name': "base", 'output': "out/base"},
+                     {'name': "other", 'output': "out/other", 'paper': "letter", 'resourceCards': "variants/cheap.csv"}],
+        }))
+        assert [job.paper for job in jobs] == ["a4", "letter"]
+        assert jobs[0].resourceCards == self.path / "assets" / "resourceCards.csv"
+        assert jobs[1].resourceCards == self.path / "variants" / "cheap.csv"
+
+        with self.assertRaises(ValueError):
+            loadManifest(self.writeManifest({'jobs': [{'name': "base", 'output': "out", 'colour': "red"}]}))
+        with self.assertRaises(ValueError):
+            loadManifest(self.writeManifest({'jobs': [{'output': "a"}, {'name': "job0", 'output': "b"}]}))
+
+    def test_variantsShareRenders(self):
+        generateAssets(self.path / "assets", resourceCardCount=4, vipCardCount=2)
+        jobs = loadManifest(self.writeManifest({
+            'defaults': {'images': False},
+            'jobs': [{'name': "base", 'output': "out/base"},
+                     {'name': "a4", 'output': "out/a4", 'paper': "a4", 'singlePdf': True},
+                     {'name': "broken", 'output': "out/broken", 'assets': "missing"}],
+        }))
+        report = BatchBuilder(jobs, concurrentJobs=2, renderCache=RenderCache(self.path / "renderCache")).run()
+
+        base, a4, broken = report['jobs']
+        assert base['pdfs'] == ["ResourceCards.pdf", "VIPCards.pdf"]
+        assert a4['pdfs'] == ["Cards.pdf"]
+        # The first job of the group renders every card, the variant after it finds them all cached
+        assert base['renderCacheMisses'] == 6 and a4['renderCacheHits'] == 6 and a4['renderCacheMisses'] == 0
+        assert broken['status'] == "failed"
+        assert (report['succeeded'], report['failed'], report['sharedAssetGroups']) == (2, 1, 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,51 @@
+import pickle
+import tempfile
+import unittest
+from pathlib import Path
+
+from PIL import Image, ImageChops
+
+from cardStore import PngCardStore, RawCardStore, openCardStore
+
+
+class TestCardStores(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = Path(tempfile.mkdtemp())
+        gradient = Image.linear_gradient("L").resize((599, 337))
+        self.rgbCard = Image.merge("RGB", (gradient, gradient.transpose(Image.FLIP_LEFT_RIGHT), gradient))
+        self.rgbaCard = Image.merge("RGBA", (gradient, gradient, gradient, gradient.transpose(Image.FLIP_TOP_BOTTOM))).crop((0, 0, 375, 300))
+
+    def tearDown(self):
+        for path in self.folder.iterdir():
+            path.unlink()
+        self.folder.rmdir()
+
+    def test_rawCardsRoundTripInAnyOrder(self):
+        store = RawCardStore(self.folder / "deck.rgba", (600, 338))
+        # Workers fill slots out of order, and what they hand back has to survive pickling
+        second = pickle.loads(pickle.dumps(store.write(store.target(1, "b.png"), self.rgbaCard)))
+        first = store.write(store.target(0, "a.png"), self.rgbCard)
+
+        image = first.open()
+        assert image.size == self.rgbCard.size
+        assert ImageChops.difference(image.convert("RGB"), self.rgbCard).getbbox() is None
+        assert ImageChops.difference(second.open(), self.rgbaCard).getbbox() is None
+
+    def test_rawSlotsRejectOversizedCards(self):
+        store = RawCardStore(self.folder / "deck.rgba", (100, 100))
+        with self.assertRaises(ValueError):
+            store.write(store.target(0, "a.png"), self.rgbCard)
+        with self.assertRaises(ValueError):
+            store.target(0, "a.png").open()
+
+    def test_pngCompressLevel(self):
+        fast = PngCardStore(self.folder, compressLevel=0).write(self.folder / "fast.png", self.rgbCard)
+        small = openCardStore('png', self.folder, "deck", (4, 2.25), compressLevel=9).write(self.folder / "small.png", self.rgbCard)
+        assert fast.stat().st_size > small.stat().st_size
+        with Image.open(fast) as a, Image.open(small) as b:
+            assert ImageChops.difference(a, b).getbbox() is None
+
+
+if __name__ == '__main__':
+    unittest.main()
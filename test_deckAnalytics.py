@@ -0,0 +1,76 @@
+import tempfile
+import unittest
+from pathlib import Path
+
+from splendid import ResourceType, ResourceCard, VIPCard, Deck
+from deckLoader import RESOURCE_CARD_SCHEMA
+from deckAnalytics import analyzeDecks, formatReport, loadCards
+
+Air, Water, Earth, Fire, WhiteLotus = ResourceType.Air, ResourceType.Water, ResourceType.Earth, ResourceType.Fire, ResourceType.WhiteLotus
+
+
+class TestDeckAnalytics(unittest.TestCase):
+
+    def setUp(self):
+        self.resourceCards = [
+            ResourceCard(produces=Air, requires={Water: 2, Fire: 1}, level=1, victoryPoints=0),
+            ResourceCard(produces=Water, requires={Air: 3}, level=1, victoryPoints=1),
+            ResourceCard(produces=Water, requires={Earth: 4, WhiteLotus: 0}, level=2, victoryPoints=2),
+            # Free, so it's left out of the VP per gem figure
+            ResourceCard(produces=Fire, requires={}, level=2, victoryPoints=0),
+        ]
+        self.vipCards = [
+            VIPCard(requires={Water: 2, Air: 1}, victoryPoints=3),
+            VIPCard(requires={Earth: 1, Fire: 3}, victoryPoints=3),
+        ]
+
+    def test_levelStats(self):
+        report = analyzeDecks(self.resourceCards)
+        assert report['resourceCards'] == 4
+        assert report['poolByColor'] == {'Air': 1, 'Water': 2, 'Earth': 0, 'Fire': 1, 'WhiteLotus': 0}
+        assert 'vipReachability' not in report
+
+        levelOne, levelTwo = report['levels']
+        assert (levelOne['level'], levelOne['cards'], levelOne['totalCost'], levelOne['meanCost']) == (1, 2, 6, 3.0)
+        assert levelOne['costByColor'] == {'Air': 3, 'Water': 2, 'Earth': 0, 'Fire': 1, 'WhiteLotus': 0}
+        assert levelOne['costShareByColor'] == {'Air': 0.5, 'Water': 0.3333, 'Earth': 0.0, 'Fire': 0.1667, 'WhiteLotus': 0.0}
+        assert levelOne['totalVictoryPoints'] == 1
+        self.assertAlmostEqual(levelOne['meanVpPerGem'], (0/3 + 1/3) / 2)
+        assert levelOne['producesByColor'] == {'Air': 1, 'Water': 1, 'Earth': 0, 'Fire': 0, 'WhiteLotus': 0}
+
+        assert (levelTwo['level'], levelTwo['cards'], levelTwo['totalCost'], levelTwo['meanCost']) == (2, 2, 4, 2.0)
+        assert levelTwo['meanVpPerGem'] == 0.5
+        assert levelTwo['producesByColor'] == {'Air': 0, 'Water': 1, 'Earth': 0, 'Fire': 1, 'WhiteLotus': 0}
+
+    def test_vipReachability(self):
+        # Columnar decks give the same report as lists of cards
+        report = analyzeDecks(Deck(ResourceCard, self.resourceCards), Deck(VIPCard, self.vipCards))
+        assert report['vipCards'] == 2
+        easy, hard = report['vipReachability']
+        assert easy == {'vip': 0, 'victoryPoints': 3, 'cardsRequired': 3, 'reachable': True, 'slack': 0, 'shortfallByColor': {}}
+        assert hard == {'vip': 1, 'victoryPoints': 3, 'cardsRequired': 4, 'reachable': False, 'slack': -2, 'shortfallByColor': {'Earth': 1, 'Fire': 2}}
+        assert report == analyzeDecks(self.resourceCards, self.vipCards)
+
+    def test_emptyDecks(self):
+        report = analyzeDecks([], [])
+        assert report == {
+            'resourceCards': 0,
+            'poolByColor': {'Air': 0, 'Water': 0, 'Earth': 0, 'Fire': 0, 'WhiteLotus': 0},
+            'levels': [],
+            'vipCards': 0,
+            'vipReachability': [],
+        }
+        assert formatReport(report).startswith("Resource cards: 0")
+
+    def test_badRowsAreLogged(self):
+        with tempfile.TemporaryDirectory() as folder:
+            csvFile = Path(folder) / "resourceCards.csv"
+            csvFile.write_text("Card Level,VP,Generates,Black,White,Blue,Green,Red\n1,0,Blue,1,,0,2,\nx,0,Red,,,,,\n")
+            with self.assertLogs(level='ERROR') as logs:
+                cards = loadCards(csvFile, RESOURCE_CARD_SCHEMA)
+        assert len(cards) == 1
+        assert "1 bad rows" in logs.output[0]
+
+
+if __name__ == '__main__':
+    unittest.main()
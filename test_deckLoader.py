@@ -0,0 +1,178 @@
+import os
+import time
+import unittest
+import tempfile
+from pathlib import Path
+from unittest import mock
+
+import main
+import imageDrawing
+from assetGetter import AssetGetter
+from renderCache import RenderCache
+from splendid import ResourceType, ResourceCard, VIPCard
+from deckLoader import BadCSVRow, DeckReader, DeckCache, loadDeck, streamDeck, RESOURCE_CARD_SCHEMA, VIP_CARD_SCHEMA
+from syntheticAssets import generateAssets
+
+
+RESOURCE_CSV = """Card Level,VP,Generates,Black,White,Blue,Green,Red
+1,0,Blue,1,,0,2,
+2,1,Purple,1,1,1,1,1
+
+3,4,Red,,7,,,
+x,0,Red,,,,,
+"""
+
+VIP_CSV = """Victor Points,Black,White,Blue,Green,Red
+3,4,4,,,
+3,,,3,3,3
+"""
+
+
+class TestDeckLoader(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.TemporaryDirectory()
+        self.path = Path(self.folder.name)
+        self.resourceCsv = self.path / "resourceCards.csv"
+        self.resourceCsv.write_text(RESOURCE_CSV)
+        self.vipCsv = self.path / "VIPCards.csv"
+        self.vipCsv.write_text(VIP_CSV)
+
+    def tearDown(self):
+        self.folder.cleanup()
+
+    def test_readResourceCards(self):
+        reader = DeckReader(self.resourceCsv, RESOURCE_CARD_SCHEMA)
+        cards = list(reader)
+
+        assert len(cards) == 2
+        assert cards[0].level == 1
+        assert cards[0].produces == ResourceType.Water
+        # blank columns are left out, explicit zeroes are kept
+        assert cards[0].requires == {ResourceType.Air: 1, ResourceType.Water: 0, ResourceType.Earth: 2}
+        assert cards[1].victoryPoints == 4
+        assert cards[1].requires == {ResourceType.WhiteLotus: 7}
+
+        # the blank line isn't counted as a row
+        assert [error.rowNumber for error in reader.errors] == [2, 4]
+        for error in reader.errors:
+            assert isinstance(error, BadCSVRow)
+
+    def test_readerIsLazy(self):
+        reader = DeckReader(self.resourceCsv, RESOURCE_CARD_SCHEMA)
+        first = next(iter(reader))
+        assert isinstance(first, ResourceCard)
+        assert len(reader.errors) == 0
+
+    def test_costTooBigIsABadRow(self):
+        self.vipCsv.write_text(VIP_CSV + "3,,,300,,\n")
+        cards, errors = loadDeck(self.vipCsv, VIP_CARD_SCHEMA)
+        assert len(cards) == 2
+        assert [error.rowNumber for error in errors] == [3]
+
+    def test_missingColumnFailsEveryRow(self):
+        self.vipCsv.write_text("Black,White,Blue,Green,Red\n4,4,,,\n")
+        cards, errors = loadDeck(self.vipCsv, VIP_CARD_SCHEMA)
+        assert cards == []
+        assert len(errors) == 1
+        assert isinstance(errors[0].previousError, KeyError)
+
+    def test_deckCacheRoundTrip(self):
+        deckCache = DeckCache(self.path / "cache")
+        cards, errors = loadDeck(self.vipCsv, VIP_CARD_SCHEMA, deckCache)
+        assert errors == []
+
+        cached = deckCache.load(self.vipCsv, VIP_CARD_SCHEMA)
+        assert cached is not None
+        for card, cachedCard in zip(cards, cached):
+            assert isinstance(cachedCard, VIPCard)
+            assert cachedCard.victoryPoints == card.victoryPoints
+            assert list(cachedCard.requires.items()) == list(card.requires.items())
+
+    def test_deckCacheInvalidatedByEdit(self):
+        deckCache = DeckCache(self.path / "cache")
+        loadDeck(self.vipCsv, VIP_CARD_SCHEMA, deckCache)
+        self.vipCsv.write_text(VIP_CSV.replace("3,4,4", "5,4,4"))
+
+        assert deckCache.load(self.vipCsv, VIP_CARD_SCHEMA) is None
+        cards, _ = loadDeck(self.vipCsv, VIP_CARD_SCHEMA, deckCache)
+        assert cards[0].victoryPoints == 5
+
+    def test_sameNamedDecksKeepTheirOwnCache(self):
+        deckCache = DeckCache(self.path / "cache")
+        otherCsv = self.path / "other" / self.vipCsv.name
+        otherCsv.parent.mkdir()
+        otherCsv.write_text(VIP_CSV.replace("3,4,4", "5,4,4"))
+        loadDeck(self.vipCsv, VIP_CARD_SCHEMA, deckCache)
+        loadDeck(otherCsv, VIP_CARD_SCHEMA, deckCache)
+
+        assert deckCache.load(self.vipCsv, VIP_CARD_SCHEMA)[0].victoryPoints == 3
+        assert deckCache.load(otherCsv, VIP_CARD_SCHEMA)[0].victoryPoints == 5
+        assert sorted(path.suffix for path in (self.path / "cache").iterdir()) == [".deck", ".deck"]
+
+    def test_unchangedDeckIsntHashed(self):
+        deckCache = DeckCache(self.path / "cache")
+        # Edited well before it's cached, so its mtime can be trusted
+        os.utime(self.vipCsv, ns=(time.time_ns() - 10**10,)*2)
+        loadDeck(self.vipCsv, VIP_CARD_SCHEMA, deckCache)
+
+        with mock.patch.object(DeckCache, '_digest', side_effect=AssertionError("hashed an unchanged deck")):
+            assert len(deckCache.load(self.vipCsv, VIP_CARD_SCHEMA)) == 2
+
+        # Touched but not edited, it's hashed to tell and still loads
+        os.utime(self.vipCsv)
+        with mock.patch.object(DeckCache, '_digest', wraps=DeckCache._digest) as digest:
+            assert len(deckCache.load(self.vipCsv, VIP_CARD_SCHEMA)) == 2
+        assert digest.called
+
+    def test_streamDeckCollectsErrorsAndCachesAsItGoes(self):
+        deckCache = DeckCache(self.path / "cache")
+        cards, errors = streamDeck(self.resourceCsv, RESOURCE_CARD_SCHEMA)
+        cards = iter(cards)
+        next(cards)
+        assert errors == []
+        assert len(list(cards)) == 1
+        assert [error.rowNumber for error in errors] == [2, 4]
+
+        cards, errors = streamDeck(self.vipCsv, VIP_CARD_SCHEMA, deckCache)
+        cards = iter(cards)
+        next(cards)
+        assert deckCache.load(self.vipCsv, VIP_CARD_SCHEMA) is None
+        list(cards)
+        assert len(deckCache.load(self.vipCsv, VIP_CARD_SCHEMA)) == 2
+        # From the cache it's simply the list
+        assert isinstance(streamDeck(self.vipCsv, VIP_CARD_SCHEMA, deckCache)[0], list)
+
+    def test_buildRendersWhileTheDeckIsParsed(self):
+        assets = self.path / "assets"
+        resourceCardsCSV, vipCardsCSV = generateAssets(assets, resourceCardCount=6, vipCardCount=2)
+        parsed = list()
+        parsedAtEachRender = list()
+
+        compile = RESOURCE_CARD_SCHEMA.compile
+        def countingCompile(header):
+            parseRow = compile(header)
+            def countingParseRow(row):
+                parsed.append(row)
+                return parseRow(row)
+            return countingParseRow
+
+        processResourceCard = imageDrawing.processResourceCard
+        def recordingProcessResourceCard(*args):
+            parsedAtEachRender.append(len(parsed))
+            return processResourceCard(*args)
+
+        with mock.patch.object(RESOURCE_CARD_SCHEMA, 'compile', countingCompile), mock.patch.object(imageDrawing, 'processResourceCard', recordingProcessResourceCard):
+            main.main(self.path / "out", AssetGetter(assets), resourceCardsCSV, vipCardsCSV, renderCache=RenderCache(self.path / "renderCache"), writeImages=False, deckCache=DeckCache(self.path / "cache"))
+        assert parsedAtEachRender == [1, 2, 3, 4, 5, 6]
+        assert (self.path / "out" / "ResourceCards.pdf").is_file()
+
+    def test_decksWithBadRowsArentCached(self):
+        deckCache = DeckCache(self.path / "cache")
+        _, errors = loadDeck(self.resourceCsv, RESOURCE_CARD_SCHEMA, deckCache)
+        assert len(errors) == 2
+        assert deckCache.load(self.resourceCsv, RESOURCE_CARD_SCHEMA) is None
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,42 @@
+import tempfile
+import unittest
+from pathlib import Path
+
+from PIL import Image
+
+from main import DeckWatcher
+from PDFMaker import PdfMaker, US_LETTER_IN
+from assetGetter import AssetGetter
+from assetManifest import AssetManifest
+from syntheticAssets import generateAssets
+
+
+class TestDeckWatcher(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.TemporaryDirectory()
+        self.path = Path(self.folder.name)
+        self.assets = self.path / "assets"
+        resourceCardsCSV, vipCardsCSV = generateAssets(self.assets, resourceCardCount=4, vipCardCount=2)
+        self.manifest = AssetManifest(self.assets, self.path / "manifest.json")
+        assetGetter = AssetGetter(self.assets, manifest=self.manifest)
+        self.watcher = DeckWatcher(self.path / "output", assetGetter, resourceCardsCSV, vipCardsCSV, PdfMaker(US_LETTER_IN[1], US_LETTER_IN[0]))
+
+    def tearDown(self):
+        self.watcher.close()
+        self.folder.cleanup()
+
+    def test_artAddedAlongWithASharedIconIsListed(self):
+        self.watcher.outputFolderPath.mkdir()
+        self.watcher.build()
+        levelIcon = self.watcher.assetGetter.getLevelIcon()
+        Image.new("RGBA", (40, 40), "red").save(levelIcon)
+        newArt = self.assets / "VIP Images" / "new.png"
+        Image.new("RGB", (80, 80), "blue").save(newArt)
+
+        self.watcher.build({str(levelIcon), str(newArt)})
+        assert newArt in self.watcher.assetGetter.getVipImagePaths()
+
+
+if __name__ == '__main__':
+    unittest.main()
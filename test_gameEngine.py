@@ -0,0 +1,55 @@
+import unittest
+import random
+
+from splendid import ResourceType, ResourceCard, VIPCard, COST_ORDER
+import gameEngine
+
+
+def makeDeck(seed=0):
+    rng = random.Random(seed)
+    resourceCards = list()
+    for level in (1, 2, 3):
+        for _ in range(20):
+            requires = {resourceType: rng.randint(1, level+2) for resourceType in rng.sample(COST_ORDER, 3)}
+            resourceCards.append(ResourceCard(produces=rng.choice(COST_ORDER), requires=requires, level=level, victoryPoints=level-1))
+    vipCards = [VIPCard(requires={ResourceType.Water: 3, ResourceType.Fire: 3, ResourceType.Air: 3}, victoryPoints=3) for _ in range(5)]
+    return resourceCards, vipCards
+
+
+class TestGameEngine(unittest.TestCase):
+
+    def test_tokensAreConserved(self):
+        table = gameEngine.CardTable(*makeDeck())
+        rng = random.Random(1)
+        state = gameEngine.GameState(table, 3, rng)
+        totals = list(state.bank)
+
+        while not state.isOver():
+            moves = gameEngine.legalMoves(state)
+            gameEngine.applyMove(state, gameEngine.randomPolicy(state, moves, rng))
+            for slot in range(gameEngine.TOKEN_SLOTS):
+                assert state.bank[slot] + sum(tokens[slot] for tokens in state.tokens) == totals[slot]
+            for tokens in state.tokens:
+                assert sum(tokens) <= gameEngine.MAX_TOKENS
+                assert min(tokens) >= 0
+
+    def test_greedyBeatsRandom(self):
+        resourceCards, vipCards = makeDeck()
+        report = gameEngine.simulate(resourceCards, vipCards, 200, ['greedy', 'random'], seed=3)
+        assert report['winRates']['greedy'] > report['winRates']['random']
+        assert report['rounds']['max'] <= gameEngine.MAX_ROUNDS
+
+    def test_simulationIsDeterministic(self):
+        resourceCards, vipCards = makeDeck()
+        first = gameEngine.simulate(resourceCards, vipCards, 50, ['greedy', 'greedy'], seed=7, chunkSize=20)
+        second = gameEngine.simulate(resourceCards, vipCards, 50, ['greedy', 'greedy'], seed=7, chunkSize=20)
+        assert first == second
+
+    def test_noGamesIsAnError(self):
+        resourceCards, vipCards = makeDeck()
+        with self.assertRaises(ValueError):
+            gameEngine.simulate(resourceCards, vipCards, 0, ['greedy', 'random'])
+
+
+if __name__ == '__main__':
+    unittest.main()
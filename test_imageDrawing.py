@@ -0,0 +1,115 @@
+import tempfile
+import threading
+import unittest
+from pathlib import Path
+from unittest import mock
+
+from PIL import Image, ImageChops, ImageDraw
+
+import imageDrawing
+from splendid import ResourceType
+
+
+class TestResourceCardOverlay(unittest.TestCase):
+
+    def setUp(self):
+        gradient = Image.linear_gradient("L")
+        # A partly transparent icon, so the alpha blending of the corner icon is exercised too
+        self.producesImage = Image.merge("RGBA", (gradient, gradient.rotate(90), gradient.rotate(180), gradient.rotate(45))).resize((100, 100))
+        self.art = Image.merge("RGB", (gradient, gradient.rotate(30), gradient.rotate(60))).resize((599, 337))
+
+    def test_matchesBordersAndIconPastedOneByOne(self):
+        color = imageDrawing.resourceTypeToPILColor[ResourceType.Fire]
+        expected = imageDrawing.add_border(self.art, color)
+        expected = imageDrawing.add_border(expected, "black", 1)
+        expected.paste(self.producesImage, (599-100-imageDrawing.BORDER_SIZE, imageDrawing.BORDER_SIZE), mask=self.producesImage)
+
+        actual = self.art.copy()
+        imageDrawing.ResourceCardOverlay(actual.size, color, self.producesImage).applyTo(actual)
+        assert ImageChops.difference(expected, actual).getbbox() is None
+
+    def test_overlayIsBuiltOncePerTypeAndSize(self):
+        sharedImages = imageDrawing.SplendidSharedAssetts()
+        sharedImages.resouceTypeToImage[ResourceType.Air] = (self.producesImage, self.producesImage)
+        overlay = sharedImages.getResourceCardOverlay(ResourceType.Air, (600, 337))
+        assert sharedImages.getResourceCardOverlay(ResourceType.Air, (600, 337)) is overlay
+        assert sharedImages.getResourceCardOverlay(ResourceType.Air, (599, 337)) is not overlay
+
+
+class TestAddNumber(unittest.TestCase):
+
+    def drawText(self, image, number, centeredAt, font):
+        """addNumber as it was before the sprites, drawing the text straight onto the card"""
+        draw = ImageDraw.Draw(image)
+        _, _, w, h = draw.textbbox(xy=(0, 0), text=str(number), font=font)
+        loc = (centeredAt[0]-(w//2), centeredAt[1]-(h//2))
+        draw.text(loc, str(number), fill='white', font=font, stroke_width=2, stroke_fill='black')
+
+    def test_matchesDrawingTheText(self):
+        gradient = Image.linear_gradient("L")
+        rgb = Image.merge("RGB", (gradient, gradient.rotate(30), gradient.rotate(60))).resize((200, 120))
+        rgba = rgb.copy()
+        rgba.putalpha(gradient.resize((200, 120)))
+        palette = rgb.convert("P", palette=Image.ADAPTIVE, colors=64)
+
+        for art in (rgb, rgba, palette):
+            for number, fontsize in ((7, 50), (13, 35)):
+                font = imageDrawing.getFont(fontsize=fontsize)
+                expected, actual = art.copy(), art.copy()
+                self.drawText(expected, number, (60, 50), font)
+                imageDrawing.addNumber(actual, number, (60, 50), font)
+                assert actual.mode == art.mode
+                assert actual.getpalette() == expected.getpalette()
+                assert list(actual.getdata()) == list(expected.getdata()), f"{art.mode} art, {number}"
+
+
+class TestCardBacks(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.TemporaryDirectory()
+        self.path = Path(self.folder.name)
+        registry = mock.patch.object(imageDrawing, '_cardBackRegistry', imageDrawing.OrderedDict())
+        registry.start()
+        self.addCleanup(registry.stop)
+
+    def tearDown(self):
+        self.folder.cleanup()
+
+    def test_registryKeepsTheMostRecentlyUsed(self):
+        backPaths = list()
+        for i in range(imageDrawing.MAX_CARD_BACK_SETS + 2):
+            backPaths.append(self.path / f"{i}.png")
+            Image.new("RGB", (40, 40), (i, 0, 0)).save(backPaths[-1])
+
+        generated = list()
+        def backsOf(backPath):
+            return imageDrawing._cardBacks("vip", backPath, None, lambda: generated.append(backPath) or [backPath.name])
+
+        backsOf(backPaths[0])
+        for backPath in backPaths[1:]:
+            backsOf(backPath)
+            # Still in use, so it's never the one let go of
+            assert backsOf(backPaths[0]) == ["0.png"]
+        assert len(imageDrawing._cardBackRegistry) == imageDrawing.MAX_CARD_BACK_SETS
+        assert generated.count(backPaths[0]) == 1
+        backsOf(backPaths[1])
+        assert generated.count(backPaths[1]) == 2
+
+    def test_concurrentRendersBuildTheBacksOnce(self):
+        backPath = self.path / "back.png"
+        Image.new("RGB", (40, 40), "blue").save(backPath)
+        generated = list()
+        def generate():
+            generated.append(threading.get_ident())
+            return ["back"]
+
+        threads = [threading.Thread(target=imageDrawing._cardBacks, args=("vip", backPath, None, generate)) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert len(generated) == 1
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,93 @@
+import json
+import tempfile
+import threading
+import unittest
+from pathlib import Path
+
+from PIL import Image
+
+import instrumentation
+from instrumentation import Tracer
+
+
+class TestTracer(unittest.TestCase):
+
+    def setUp(self):
+        self.tracer = Tracer()
+        # Image.new goes through more than one Image.__init__
+        Image.new("L", (1, 1))
+        self.perImage = self.tracer.imageAllocations
+        self.tracer.imageAllocations = 0
+
+    def tearDown(self):
+        self.tracer.close()
+
+    def test_stagesNest(self):
+        with self.tracer.stage("build", deck="resource"):
+            with self.tracer.stage("render"):
+                Image.new("RGB", (4, 4))
+            Image.new("RGB", (4, 4))
+
+        render, build = self.tracer.events
+        assert (render['name'], render['depth']) == ("render", 1)
+        assert (build['name'], build['depth'], build['args']) == ("build", 0, {'deck': "resource"})
+        assert build['start'] <= render['start'] and render['start'] + render['duration'] <= build['start'] + build['duration']
+        assert (render['imageAllocations'], build['imageAllocations']) == (self.perImage, 2*self.perImage)
+
+    def test_imagesCountedAcrossThreads(self):
+        def allocate():
+            for _ in range(500):
+                Image.new("L", (1, 1))
+        threads = [threading.Thread(target=allocate) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert self.tracer.imageAllocations == 2000*self.perImage
+
+    def test_closeStopsCounting(self):
+        self.tracer.close()
+        Image.new("RGB", (4, 4))
+        assert self.tracer.imageAllocations == 0
+
+    def test_chromeTrace(self):
+        with self.tracer.stage("build"):
+            with self.tracer.stage("render", card=3):
+                pass
+
+        with tempfile.TemporaryDirectory() as folder:
+            outputPath = Path(folder) / "trace.json"
+            self.tracer.write(outputPath)
+            summary = json.loads(outputPath.read_text())
+            trace = json.loads(outputPath.with_suffix('.chrome.json').read_text())
+
+        assert summary['stages']['render']['count'] == 1
+        assert trace['displayTimeUnit'] == 'ms'
+        spans = [event for event in trace['traceEvents'] if event['ph'] == 'X']
+        assert [span['name'] for span in spans] == ["render", "build"]
+        render, build = spans
+        assert set(render) == {'name', 'ph', 'ts', 'dur', 'pid', 'tid', 'args'}
+        assert render['args'] == {'card': 3, 'imageAllocations': 0}
+        # Chrome nests complete events by time on the same thread
+        assert render['tid'] == build['tid']
+        assert build['ts'] <= render['ts'] and render['ts'] + render['dur'] <= build['ts'] + build['dur']
+        for counter in (event for event in trace['traceEvents'] if event['ph'] == 'C'):
+            assert counter['name'] == 'peak RSS' and counter['args']['bytes'] > 0
+
+
+class TestTracing(unittest.TestCase):
+
+    def test_disabledTracingRecordsNothing(self):
+        tracer = instrumentation.enableTracing()
+        try:
+            assert instrumentation.getTracer() is tracer
+        finally:
+            instrumentation.disableTracing()
+        assert isinstance(instrumentation.getTracer(), instrumentation.NullTracer)
+        with instrumentation.getTracer().stage("build"):
+            Image.new("RGB", (4, 4))
+        assert tracer.events == [] and tracer.imageAllocations == 0
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,42 @@
+import sys
+import unittest
+
+from PIL import Image
+
+from memoryBudget import MemoryBudget, currentRssBytes
+from renderPool import RenderPool
+
+
+def renderSolid(card, outputPath, sharedImages):
+    return Image.new("RGB", (4, 4), (card, 0, 0))
+
+
+class TestMemoryBudget(unittest.TestCase):
+
+    @unittest.skipUnless(sys.platform.startswith("linux"), "RSS is only read on Linux")
+    def test_overBudgetHoldsRenderingToOneCard(self):
+        assert currentRssBytes() > 0
+        assert MemoryBudget(maxInFlight=8).inFlightLimit() == 8
+        memoryBudget = MemoryBudget(maxInFlight=8, maxRssBytes=1)
+        assert memoryBudget.inFlightLimit() == 1
+        assert memoryBudget.throttled == 1
+
+    def test_workersStayWithinTheInFlightCap(self):
+        memoryBudget = MemoryBudget(maxInFlight=3)
+        with RenderPool(None, workers=2) as renderPool:
+            submitted = list()
+            submit = renderPool.executor.submit
+            def countingSubmit(*args):
+                submitted.append(args)
+                return submit(*args)
+            renderPool.executor.submit = countingSubmit
+
+            rendered = list()
+            for image in renderPool.renderIter(renderSolid, [(i, None) for i in range(10)], memoryBudget=memoryBudget):
+                assert len(submitted) - len(rendered) <= 3
+                rendered.append(image.getpixel((0, 0))[0])
+        assert rendered == list(range(10))
+
+
+if __name__ == '__main__':
+    unittest.main()
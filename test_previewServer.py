@@ -0,0 +1,124 @@
+import time
+import tempfile
+import threading
+import unittest
+import urllib.error
+import urllib.request
+from pathlib import Path
+from unittest import mock
+
+from assetGetter import AssetGetter
+from previewServer import CardPreviewer, PreviewCache, makeServer
+from syntheticAssets import generateAssets
+
+
+class TestPreviewCache(unittest.TestCase):
+
+    def test_leastRecentlyUsedGoesFirst(self):
+        cache = PreviewCache(maxBytes=10)
+        cache.put("a", b"1234")
+        cache.put("b", b"1234")
+        assert cache.get("a") == b"1234"
+        cache.put("c", b"1234")
+        assert cache.get("b") is None
+        assert cache.get("a") is not None and cache.get("c") is not None
+        assert cache.totalBytes == 8
+
+
+class TestPreviewServer(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.folder = tempfile.TemporaryDirectory()
+        assetsPath = Path(cls.folder.name)
+        resourceCardsCSV, vipCardsCSV = generateAssets(assetsPath, resourceCardCount=6, vipCardCount=2)
+        cls.previewer = CardPreviewer(AssetGetter(assetsPath), resourceCardsCSV, vipCardsCSV)
+        cls.server = makeServer(cls.previewer, port=0)
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+        cls.folder.cleanup()
+
+    def get(self, path:str) -> tuple[int, bytes]:
+        try:
+            with urllib.request.urlopen(f"http://127.0.0.1:{self.server.server_address[1]}{path}") as response:
+                return response.status, response.read()
+        except urllib.error.HTTPError as e:
+            return e.code, e.read()
+
+    def test_deckCards(self):
+        status, body = self.get("/resource/5.png")
+        assert status == 200 and body.startswith(b"\x89PNG")
+        assert self.get("/vip/1.png")[0] == 200
+        assert self.get("/vip/2.png")[0] == 404
+        assert b"/resource/5.png" in self.get("/")[1]
+
+    def test_adHocCardsAreCachedByContent(self):
+        path = "/resource.png?Card%20Level=2&VP=1&Generates=Red&Blue=3"
+        status, body = self.get(path)
+        assert status == 200
+        hits = self.previewer.cache.hits
+        assert self.get(path)[1] == body
+        assert self.previewer.cache.hits == hits + 1
+        assert self.get("/resource.png?Card%20Level=2&VP=1&Generates=Red&Blue=4")[1] != body
+
+    def test_badParameters(self):
+        assert self.get("/resource.png?Card%20Level=2&VP=1&Generates=Purple")[0] == 400
+        assert self.get("/vip.png?Blue=3")[0] == 400
+        assert self.get("/token/0.png")[0] == 404
+        assert self.get("/vip.png?Victor%20Points=3")[0] == 400
+        assert self.get("/resource.png?Card%20Level=2&VP=1&Generates=Red&Blue=300")[0] == 400
+
+    def test_renderFailureIsA500(self):
+        with mock.patch.object(self.previewer, 'renderPng', side_effect=ZeroDivisionError("division by zero")):
+            status, body = self.get("/vip/1.png")
+        assert status == 500 and b"ZeroDivisionError" in body
+        assert self.get("/vip/1.png")[0] == 200
+
+    def test_differentCardsRenderSideBySide(self):
+        _, renderVip = self.previewer.kinds['vip']
+        bothRendering = threading.Barrier(2, timeout=10)
+        rendered = list()
+        def renderTogether(card, outputPath, sharedImages):
+            rendered.append(card.victoryPoints)
+            # Only returns once both cards are being rendered at the same time
+            bothRendering.wait()
+            return renderVip(card, outputPath, sharedImages)
+
+        cards = [self.previewer.adHocCard('vip', {'Victor Points': str(points), 'Blue': '3'}) for points in (7, 8)]
+        with mock.patch.dict(self.previewer.kinds, {'vip': (None, renderTogether)}):
+            threads = [threading.Thread(target=self.previewer.renderPng, args=('vip', card)) for card in cards]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        assert not bothRendering.broken
+        assert sorted(rendered) == [7, 8]
+
+    def test_sameCardIsRenderedOnce(self):
+        _, renderVip = self.previewer.kinds['vip']
+        rendered = list()
+        firstStarted = threading.Event()
+        def slowRender(card, outputPath, sharedImages):
+            rendered.append(card)
+            firstStarted.set()
+            time.sleep(0.2)
+            return renderVip(card, outputPath, sharedImages)
+
+        card = self.previewer.adHocCard('vip', {'Victor Points': '9', 'Blue': '3'})
+        with mock.patch.dict(self.previewer.kinds, {'vip': (None, slowRender)}):
+            first = threading.Thread(target=self.previewer.renderPng, args=('vip', card))
+            first.start()
+            firstStarted.wait(10)
+            png = self.previewer.renderPng('vip', card)
+            first.join()
+        assert len(rendered) == 1
+        assert png.startswith(b"\x89PNG")
+        assert self.previewer._renderLocks == {}
+
+
+if __name__ == '__main__':
+    unittest.main()
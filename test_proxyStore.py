@@ -0,0 +1,77 @@
+import os
+import tempfile
+import unittest
+from pathlib import Path
+
+from PIL import Image
+
+import imageDrawing
+from assetGetter import AssetGetter, assignResourceCardArt, assignVipCardArt
+from proxyStore import ProxyStore
+from splendid import ResourceCard, ResourceType, VIPCard
+from syntheticAssets import generateAssets
+
+
+class TestProxyStore(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.TemporaryDirectory()
+        self.path = Path(self.folder.name)
+        self.store = ProxyStore(self.path / "proxies")
+
+    def tearDown(self):
+        self.folder.cleanup()
+
+    def test_proxyIsCroppedAndReduced(self):
+        outputW, outputH = (int(x*imageDrawing.OUTPUT_DPI) for x in imageDrawing.RESOURCE_CARD_SIZE_IN)
+        cropX = imageDrawing.IMG_BORDER_CROP_SYMMETRICAL
+        sourcePath = self.path / "art.png"
+        Image.new("RGB", (3*outputW + 2*cropX, 3*outputH), "red").save(sourcePath)
+
+        proxyPath = self.store.getResourceCardProxy(sourcePath)
+        with Image.open(proxyPath) as proxy:
+            assert proxy.size == (outputW, outputH)
+            assert proxy.info[imageDrawing.PRECROPPED_INFO_KEY] == str(cropX)
+
+    def test_proxyIsBuiltOnceAndRebuiltWhenTheSourceChanges(self):
+        sourcePath = self.path / "art.png"
+        Image.new("RGB", (300, 300), "red").save(sourcePath)
+        first = self.store.getVipProxy(sourcePath)
+        assert self.store.getVipProxy(sourcePath) == first
+        assert self.store.built == 1
+
+        Image.new("RGB", (300, 300), "blue").save(sourcePath)
+        os.utime(sourcePath, ns=(0, 0))
+        second = self.store.getVipProxy(sourcePath)
+        assert second != first
+        assert self.store.built == 2
+        with Image.open(second) as proxy:
+            assert proxy.getpixel((0, 0)) == (0, 0, 255)
+
+    def test_pruneRemovesProxiesNotHandedOut(self):
+        sourcePath = self.path / "art.png"
+        Image.new("RGB", (300, 300), "red").save(sourcePath)
+        Image.new("RGB", (300, 300), "blue").save(self.path / "other.png")
+        stale = self.store.getVipProxy(sourcePath)
+
+        fresh = ProxyStore(self.store.proxyFolder)
+        kept = fresh.getVipProxy(self.path / "other.png")
+        fresh.prune()
+        assert kept.is_file()
+        assert not stale.exists()
+
+    def test_onlyAssignedArtGetsAProxy(self):
+        assets = self.path / "assets"
+        generateAssets(assets, resourceCardCount=12, vipCardCount=6)
+        assetGetter = AssetGetter(assets, self.store)
+        resourceType = max(ResourceType.allButAvatar(), key=lambda resourceType: len(assetGetter.getResourceCardImagePaths(resourceType)))
+        assert len(assetGetter.getResourceCardImagePaths(resourceType)) >= 2
+
+        resourceCards = list(assignResourceCardArt([ResourceCard(resourceType, {}, 1, 0)], assetGetter))
+        vipCards = list(assignVipCardArt([VIPCard({}, 3)], assetGetter))
+        assert self.store.built == 2
+        assert {path.name for path in self.store.proxyFolder.glob("*.png")} == {resourceCards[0].imagePath.name, vipCards[0].imagePath.name}
+
+
+if __name__ == '__main__':
+    unittest.main()
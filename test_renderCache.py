@@ -0,0 +1,120 @@
+import os
+import csv
+import tempfile
+import unittest
+from pathlib import Path
+from unittest import mock
+
+from PIL import Image
+
+import main
+import renderCache
+from main import loadSharedImages
+from PDFMaker import PdfMaker, US_LETTER_IN
+from assetGetter import AssetGetter
+from renderCache import RenderCache
+from assetManifest import AssetManifest
+from splendid import ResourceCard, ResourceType, VIPCard
+from syntheticAssets import generateAssets
+
+
+class TestRenderCache(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.TemporaryDirectory()
+        self.path = Path(self.folder.name)
+        self.cache = RenderCache(self.path / "cache")
+        self.card = Image.new("RGB", (60, 30), "red")
+
+    def tearDown(self):
+        self.folder.cleanup()
+
+    def entryNames(self) -> set[str]:
+        return {entry.stem for entry in (self.path / "cache").glob("*.png")}
+
+    def test_keyFollowsEverythingThatChangesTheCard(self):
+        assets = self.path / "assets"
+        generateAssets(assets, resourceCardCount=1, vipCardCount=1)
+        sharedImages = loadSharedImages(AssetGetter(assets))
+        card = ResourceCard(ResourceType.Air, {ResourceType.Water: 2}, 1, 0)
+        card.imagePath = next((assets / "Resource Cards Images").rglob("*.png"))
+        key = self.cache.cardKey(card, sharedImages)
+
+        assert RenderCache(self.path / "other").cardKey(card, sharedImages) == key
+        card.requires = {ResourceType.Water: 3}
+        assert self.cache.cardKey(card, sharedImages) != key
+        card.requires = {ResourceType.Water: 2}
+        Image.new("RGB", (8, 8), "green").save(card.imagePath)
+        assert self.cache.cardKey(card, sharedImages) != key
+
+    def test_indexedArtIsntHashedAgain(self):
+        assets = self.path / "assets"
+        generateAssets(assets, resourceCardCount=1, vipCardCount=1)
+        assetGetter = AssetGetter(assets, manifest=AssetManifest(assets, self.path / "manifest.json"))
+        sharedImages = loadSharedImages(assetGetter)
+        card = VIPCard({ResourceType.Water: 4}, 3)
+        card.imagePath = assetGetter.getVipImagePaths()[0]
+        key = RenderCache(self.path / "plain").cardKey(card, sharedImages)
+
+        withManifest = RenderCache(self.path / "indexed", manifest=assetGetter.manifest)
+        withManifest.cardKey(card, sharedImages)
+        hashed = list()
+        hashFile = renderCache.hashFile
+        def recordingHashFile(path):
+            hashed.append(Path(path))
+            return hashFile(path)
+        with mock.patch.object(renderCache, 'hashFile', recordingHashFile):
+            withManifest._fileDigests.clear()
+            assert withManifest.cardKey(card, sharedImages) == key
+            assert card.imagePath not in hashed
+
+            # Once the art changes the manifest's digest is stale, and the file is hashed after all
+            Image.new("RGB", (8, 8), "green").save(card.imagePath)
+            assert withManifest.cardKey(card, sharedImages) != key
+            assert card.imagePath in hashed
+
+    def test_hitCopiesTheRender(self):
+        assert self.cache.fetch("a", self.path / "out.png") is None
+        self.cache.store("a", self.card)
+
+        assert self.cache.fetch("a", self.path / "out.png") == self.path / "out.png"
+        assert Image.open(self.path / "out.png").getpixel((0, 0)) == (255, 0, 0)
+        assert (self.cache.hits, self.cache.misses) == (1, 1)
+
+    def test_evictsLeastRecentlyUsed(self):
+        self.cache.store("a", self.card)
+        self.cache.store("b", self.card)
+        self.cache.maxBytes = 2 * (self.path / "cache" / "a.png").stat().st_size
+        self.cache.fetch("a", self.path / "out.png")
+        self.cache.store("c", self.card)
+        assert self.entryNames() == {"a", "c"}
+
+        # A later run picks the order up from the mtimes
+        os.utime(self.path / "cache" / "c.png", (0, 0))
+        reopened = RenderCache(self.path / "cache", maxBytes=self.cache.maxBytes // 2)
+        reopened.evict()
+        assert self.entryNames() == {"a"}
+
+    def test_hitsSurviveEvictionUntilDrawn(self):
+        assets = self.path / "assets"
+        resourceCardsCSV, vipCardsCSV = generateAssets(assets, resourceCardCount=12, vipCardCount=2)
+
+        def build(renderCache):
+            # PDF workers draw only once every card has been rendered, so misses are stored between the hits being fetched and drawn
+            pdfManager = PdfMaker(US_LETTER_IN[1], US_LETTER_IN[0], workers=2)
+            main.main(self.path / "out", AssetGetter(assets), resourceCardsCSV, vipCardsCSV, renderCache=renderCache, writeImages=False, pdfManager=pdfManager)
+
+        build(self.cache)
+        rows = list(csv.reader(open(resourceCardsCSV)))
+        for row in rows[1:7]:
+            row[1] = str(int(row[1]) + 1)
+        with open(resourceCardsCSV, 'w', newline='') as f:
+            csv.writer(f).writerows(rows)
+
+        # Full to the brim, each new render evicts a hit of this same build
+        build(RenderCache(self.path / "cache", maxBytes=self.cache._totalBytes))
+        assert (self.path / "out" / "ResourceCards.pdf").is_file()
+
+
+if __name__ == '__main__':
+    unittest.main()
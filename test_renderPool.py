@@ -0,0 +1,51 @@
+import tempfile
+import unittest
+from pathlib import Path
+
+import imageDrawing
+from main import loadResourceCardsFromCsv, loadSharedImages
+from assetGetter import AssetGetter, assignResourceCardArt
+from memoryBudget import MemoryBudget
+from renderPool import RenderPool
+from syntheticAssets import generateAssets
+
+
+class TestRenderPool(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.folder = tempfile.TemporaryDirectory()
+        cls.path = Path(cls.folder.name)
+        assetGetter = AssetGetter(cls.path / "assets")
+        resourceCardsCSV, _ = generateAssets(assetGetter.assetsPath, resourceCardCount=6, vipCardCount=1)
+        resourceCards, _ = loadResourceCardsFromCsv(resourceCardsCSV)
+        cls.cards = list(assignResourceCardArt(resourceCards, assetGetter))
+        cls.sharedImages = loadSharedImages(assetGetter)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.folder.cleanup()
+
+    def renderInMemory(self, workers, memoryBudget=None) -> list[bytes]:
+        with RenderPool(self.sharedImages, workers) as renderPool:
+            jobs = [(card, None) for card in self.cards]
+            return [image.tobytes() for image in renderPool.renderIter(imageDrawing.processResourceCard, jobs, memoryBudget=memoryBudget)]
+
+    def test_workersRenderTheSameCardsInOrder(self):
+        serial = self.renderInMemory(workers=1)
+        # Every card in the deck looks different, so matching lists means matching order too
+        assert len(set(serial)) == len(self.cards)
+        assert self.renderInMemory(workers=2) == serial
+        assert self.renderInMemory(workers=2, memoryBudget=MemoryBudget(maxInFlight=2)) == serial
+
+    def test_renderedPathsComeBackInJobOrder(self):
+        outputFolder = self.path / "rendered"
+        outputFolder.mkdir(exist_ok=True)
+        jobs = [(card, outputFolder / f"{i}.png") for i, card in enumerate(self.cards)]
+        with RenderPool(self.sharedImages, workers=2) as renderPool:
+            assert renderPool.render(imageDrawing.processResourceCard, jobs) == [outputPath for _, outputPath in jobs]
+        assert all(outputPath.is_file() for _, outputPath in jobs)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,79 @@
+import unittest
+import pickle
+
+from splendid import ResourceType, ResourceCard, VIPCard, Deck, NO_COST, MAX_COST
+
+
+class TestCardModel(unittest.TestCase):
+
+    def test_requiresRoundTrip(self):
+        requires = {ResourceType.Fire: 2, ResourceType.Air: 0}
+        card = ResourceCard(produces=ResourceType.Water, requires=requires, level=2, victoryPoints=1)
+        assert card.requires == requires
+        # blank costs stay distinct from explicit zeroes
+        assert list(card.costVector) == [0, NO_COST, NO_COST, 2, NO_COST]
+
+        card.requires = {ResourceType.Earth: 3}
+        assert card.requires == {ResourceType.Earth: 3}
+
+    def test_costsOutOfRange(self):
+        for count in (MAX_COST+1, NO_COST):
+            with self.assertRaises(ValueError):
+                VIPCard(requires={ResourceType.Water: count}, victoryPoints=3)
+        assert VIPCard(requires={ResourceType.Water: MAX_COST}, victoryPoints=3).requires == {ResourceType.Water: MAX_COST}
+
+        # A Deck holds levels and victory points in the same signed chars as the costs
+        for level, victoryPoints in ((MAX_COST+1, 0), (1, MAX_COST+1), (1, -1)):
+            with self.assertRaises(ValueError):
+                Deck(ResourceCard, [ResourceCard(produces=ResourceType.Air, requires={}, level=level, victoryPoints=victoryPoints)])
+        with self.assertRaises(ValueError):
+            Deck(VIPCard, [VIPCard(requires={}, victoryPoints=MAX_COST+1)])
+        deck = Deck(ResourceCard, [ResourceCard(produces=ResourceType.Air, requires={}, level=MAX_COST, victoryPoints=MAX_COST)])
+        assert (deck[0].level, deck[0].victoryPoints) == (MAX_COST, MAX_COST)
+
+    def test_cardsHaveNoInstanceDict(self):
+        card = VIPCard(requires={ResourceType.Water: 4}, victoryPoints=3)
+        assert not hasattr(card, '__dict__')
+        with self.assertRaises(AttributeError):
+            card.somethingElse = 1
+
+    def test_cardsPickle(self):
+        card = ResourceCard(produces=ResourceType.Air, requires={ResourceType.Water: 1}, level=1, victoryPoints=0)
+        card.imagePath = "art.png"
+        copy = pickle.loads(pickle.dumps(card))
+        assert copy.requires == card.requires
+        assert copy.imagePath == "art.png"
+
+
+class TestDeck(unittest.TestCase):
+
+    def test_resourceDeck(self):
+        cards = [
+            ResourceCard(produces=ResourceType.Air, requires={ResourceType.Water: 1}, level=1, victoryPoints=0),
+            ResourceCard(produces=ResourceType.Fire, requires={ResourceType.Earth: 5, ResourceType.WhiteLotus: 0}, level=3, victoryPoints=4),
+        ]
+        deck = Deck(ResourceCard, cards)
+
+        assert len(deck) == 2
+        assert len(deck.costs) == 10
+        last = deck[-1]
+        assert last.produces == ResourceType.Fire
+        assert last.level == 3
+        assert last.victoryPoints == 4
+        assert last.requires == cards[1].requires
+        assert [card.produces for card in deck] == [ResourceType.Air, ResourceType.Fire]
+
+        with self.assertRaises(IndexError):
+            deck[2]
+
+    def test_vipDeck(self):
+        deck = Deck(VIPCard, [VIPCard(requires={ResourceType.Water: 4, ResourceType.Air: 4}, victoryPoints=3)])
+        assert deck[0].requires == {ResourceType.Water: 4, ResourceType.Air: 4}
+        assert deck.levels[0] == 0
+
+        with self.assertRaises(TypeError):
+            deck.append(ResourceCard(produces=ResourceType.Air, requires={}, level=1, victoryPoints=0))
+
+
+if __name__ == '__main__':
+    unittest.main()
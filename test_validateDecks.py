@@ -0,0 +1,50 @@
+import sys
+import tempfile
+import unittest
+import subprocess
+from pathlib import Path
+
+from assetGetter import AssetGetter
+from syntheticAssets import generateAssets
+from validateDecks import validateDecks
+
+
+class TestValidateDecks(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.TemporaryDirectory()
+        self.assets = Path(self.folder.name) / "assets"
+        self.resourceCardsCSV, self.vipCardsCSV = generateAssets(self.assets, 12, vipCardCount=3)
+
+    def tearDown(self):
+        self.folder.cleanup()
+
+    def validate(self) -> dict:
+        return validateDecks(AssetGetter(self.assets), self.resourceCardsCSV, self.vipCardsCSV)
+
+    def test_generatedAssetsAreValid(self):
+        report = self.validate()
+        self.assertTrue(report['ok'], report)
+        self.assertEqual(report['cards'], {'resource': 12, 'vip': 3})
+
+    def test_reportsEveryProblem(self):
+        with open(self.resourceCardsCSV, 'a') as f:
+            f.write("2,not a number,Blue,,,,,\n")
+        AssetGetter(self.assets).getLevelIcon().unlink()
+        for path in (self.assets / "VIP Images").iterdir():
+            path.unlink()
+
+        report = self.validate()
+        self.assertFalse(report['ok'])
+        self.assertEqual([badRow['row'] for badRow in report['badRows']], [13])
+        self.assertEqual(report['missingAssets'], [str(AssetGetter(self.assets).getLevelIcon())])
+        self.assertEqual(report['artShortages'], [{'deck': 'vip', 'type': None, 'cards': 3, 'images': 0}])
+
+    def test_neverImportsPillowOrReportlab(self):
+        script = "import sys, validateDecks; print(sorted(m for m in ('PIL', 'reportlab', 'numpy') if m in sys.modules))"
+        output = subprocess.run([sys.executable, "-c", script], cwd=Path(__file__).parent, capture_output=True, text=True, check=True)
+        self.assertEqual(output.stdout.strip(), "[]")
+
+
+if __name__ == '__main__':
+    unittest.main()
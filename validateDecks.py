@@ -0,0 +1,93 @@
+import sys
+import json
+import argparse
+from pathlib import Path
+from collections import Counter
+
+from splendid import ResourceType
+from deckLoader import loadDeck, RESOURCE_CARD_SCHEMA, VIP_CARD_SCHEMA
+from assetGetter import AssetGetter
+
+# Only what's needed to read CSVs and list files is imported here, so a check starts as fast as the interpreter does.
+# Pillow and reportlab are never loaded, images are checked for being there, not for decoding.
+
+
+def validateDecks(assetGetter:AssetGetter, resourceCardsCSV:Path, vipCardsCSV:Path) -> dict:
+    """Everything that would go wrong building the decks without rendering any of them.
+
+    Reports the CSV rows that don't parse, shared assets that are missing, and every card type there
+    isn't enough art for, which the build would otherwise leave out or fail on.
+    """
+    report = {
+        'badRows': list(),
+        'missingAssets': list(),
+        'artShortages': list(),
+        'cards': dict(),
+    }
+
+    decks = dict()
+    for deck, csvFile, schema in (('resource', resourceCardsCSV, RESOURCE_CARD_SCHEMA), ('vip', vipCardsCSV, VIP_CARD_SCHEMA)):
+        if not Path(csvFile).is_file():
+            report['missingAssets'].append(str(csvFile))
+            decks[deck] = []
+            continue
+        cards, errors = loadDeck(csvFile, schema)
+        decks[deck] = cards
+        report['cards'][deck] = len(cards)
+        for error in errors:
+            report['badRows'].append({'csv': str(csvFile), 'row': error.rowNumber, 'error': str(error.previousError)})
+
+    sharedAssets = [assetGetter.getResourceImagePath(resourceType) for resourceType in ResourceType.allButAvatar()]
+    sharedAssets += [assetGetter.getLevelIcon(), assetGetter.getResourceCardBackPath(), assetGetter.getVipCardBackImageRaw()]
+    artFolders = list(assetGetter.resourceTypeToResourceCardFolder.values()) + [assetGetter.assetsPath / "VIP Images"]
+    report['missingAssets'] += [str(path) for path in sharedAssets if not path.is_file()]
+    report['missingAssets'] += [str(path) for path in artFolders if not path.is_dir()]
+
+    needed = Counter(card.produces for card in decks['resource'] if card.imagePath is None)
+    for resourceType, count in sorted(needed.items(), key=lambda item: item[0].value):
+        if resourceType in assetGetter.resourceTypeToResourceCardFolder:
+            available = len(assetGetter.getResourceCardImagePaths(resourceType))
+        else:
+            # Nothing produces Gold, so it has no art folder at all
+            available = 0
+        if count > available:
+            report['artShortages'].append({'deck': 'resource', 'type': resourceType.name, 'cards': count, 'images': available})
+
+    neededVip = sum(1 for card in decks['vip'] if card.imagePath is None)
+    availableVip = len(assetGetter.getVipImagePaths())
+    if neededVip > availableVip:
+        report['artShortages'].append({'deck': 'vip', 'type': None, 'cards': neededVip, 'images': availableVip})
+
+    report['ok'] = not (report['badRows'] or report['missingAssets'] or report['artShortages'])
+    return report
+
+
+def formatReport(report:dict) -> str:
+    lines = [f"{deck}: {count} cards" for deck, count in report['cards'].items()]
+    for badRow in report['badRows']:
+        lines.append(f"bad row {badRow['row']} in {badRow['csv']}: {badRow['error']}")
+    for path in report['missingAssets']:
+        lines.append(f"missing {path}")
+    for shortage in report['artShortages']:
+        kind = shortage['type'] or shortage['deck']
+        lines.append(f"not enough {kind} art: {shortage['cards']} cards but {shortage['images']} images")
+    lines.append("ok" if report['ok'] else "failed")
+    return "\n".join(lines)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Check the deck CSVs and assets without rendering anything, exits non zero on any problem")
+    parser.add_argument("--assets", type=Path, default=Path("assets"))
+    parser.add_argument("--resource-cards", type=Path, help="defaults to resourceCards.csv in the assets folder")
+    parser.add_argument("--vip-cards", type=Path, help="defaults to VIPCardsTriple.csv in the assets folder")
+    parser.add_argument("--json", type=Path, help="also write the report as JSON")
+    args = parser.parse_args()
+
+    resourceCardsCSV = args.resource_cards or args.assets / "resourceCards.csv"
+    vipCardsCSV = args.vip_cards or args.assets / "VIPCardsTriple.csv"
+    report = validateDecks(AssetGetter(args.assets), resourceCardsCSV, vipCardsCSV)
+    print(formatReport(report))
+    if args.json is not None:
+        with open(args.json, 'w') as f:
+            json.dump(report, f, indent=2)
+    sys.exit(0 if report['ok'] else 1)